@@ -0,0 +1,143 @@
+"""
+Background Event Loop
+A single process-wide asyncio loop shared by every request handled by this worker
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import signal
+import threading
+
+# Signals the Functions host sends when it recycles or scales in the worker
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class BackgroundLoop:
+    """Runs one asyncio event loop on a daemon thread for the lifetime of the process."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._shutdown_hooks = []
+        self._closed = False
+        self._closed_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="sorea-background-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop_thread(self) -> bool:
+        """Return True when called from the background loop's own thread."""
+        return threading.current_thread() is self._thread
+
+    def run(self, coro, timeout: float = None):
+        """Run a coroutine on the background loop from synchronous code and wait for its result."""
+        if self.in_loop_thread():
+            raise RuntimeError("BackgroundLoop.run() cannot be called from the background loop itself")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def run_async(self, coro):
+        """Await a coroutine on the background loop from another event loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def stream(self, agen):
+        """
+        Iterate an async generator on the background loop from another event loop. If the
+        consumer goes away, the generator is closed on the background loop so its cleanup runs.
+        """
+        caller_loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+
+        def deliver(item, error=None) -> bool:
+            try:
+                caller_loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+                return True
+            except RuntimeError:
+                # The consumer's loop is closed
+                return False
+
+        async def pump():
+            try:
+                async for item in agen:
+                    if not deliver(item):
+                        break
+            except Exception as e:
+                deliver(None, e)
+            finally:
+                await agen.aclose()
+                deliver(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item, error = await queue.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    break
+                yield item
+        finally:
+            # Stops generation early if the consumer went away
+            future.cancel()
+
+    def on_shutdown(self, hook):
+        """Register an async callable to be awaited before the loop stops."""
+        self._shutdown_hooks.append(hook)
+
+    def shutdown(self, timeout: float = 10.0):
+        """Await shutdown hooks (e.g. draining pending writes) and stop the loop. Runs once."""
+        with self._closed_lock:
+            if self._closed or not self.loop.is_running():
+                return
+            self._closed = True
+        for hook in self._shutdown_hooks:
+            try:
+                self.run(hook(), timeout)
+            except Exception as e:
+                logging.error(f"Background loop shutdown hook failed: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def install_signal_handlers(self) -> bool:
+        """
+        Shut down on SIGTERM/SIGINT before the previous handler runs. atexit alone misses
+        these: the default SIGTERM action ends the process without running it. Handlers can
+        only be installed from the main thread.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return False
+        for signum in SHUTDOWN_SIGNALS:
+            previous = signal.getsignal(signum)
+
+            def handler(received, frame, previous=previous):
+                self.shutdown()
+                if callable(previous):
+                    previous(received, frame)
+                elif previous != signal.SIG_IGN:
+                    # Default action: terminate with the same signal
+                    signal.signal(received, signal.SIG_DFL)
+                    os.kill(os.getpid(), received)
+
+            signal.signal(signum, handler)
+        return True
+
+
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    """Return the process-wide background loop, starting it on first use."""
+    global _background_loop
+    if _background_loop is None:
+        with _background_loop_lock:
+            if _background_loop is None:
+                _background_loop = BackgroundLoop()
+                atexit.register(_background_loop.shutdown)
+                if not _background_loop.install_signal_handlers():
+                    logging.warning("Background loop started off the main thread, pending writes are "
+                                    "only drained at interpreter exit")
+    return _background_loop
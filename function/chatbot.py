@@ -1,5 +1,4 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from llm import get_llm
 from managers.message import MessageManager
 from filter import MentalHealthFilter
 from config import Config
@@ -7,34 +6,102 @@ from managers.firebase_manager import FirebaseManager
 from managers.summary import SummaryManager
 from managers.events import EventManager
 from managers.crisis import CrisisManager
-from managers.helper import HelperManager
+from managers.helper import HelperManager, ReplySplitter, REPLY_SUGGESTIONS_INSTRUCTION
+from managers.analysis import AnalysisManager
+from preclassifier import PreClassifier
+from context import ContextBuilder
+from prompt_cache import get_prompt_cache
+from ratelimit import get_llm_scheduler
+from profile_cache import get_profile_cache
+from data import MentalHealthTopicFilter, UserProfile
 from firebase_writer import FirebaseWriter
+from background import get_background_loop
+from resilience import get_breaker, run_stage
+from tracing import run_in_trace, span
 import asyncio
 import logging
 
 
+# Sent when the reply stage cannot produce an answer
+DEGRADED_REPLY = (
+    "I'm having a little trouble gathering my thoughts right now, but I'm still here with you. "
+    "Could you tell me a bit more about what's on your mind?"
+)
+
+
+class ReplyStream:
+    """A reply generation running in the background, buffered until it is consumed or discarded."""
+
+    def __init__(self, llm, messages):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._produce(llm, messages))
+        # Discarded drafts are never awaited, so retrieve their errors here
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def _produce(self, llm, messages):
+        try:
+            async for chunk in get_llm_scheduler().astream(llm, messages, "chat"):
+                if isinstance(chunk.content, str) and chunk.content:
+                    self.queue.put_nowait(chunk.content)
+        finally:
+            self.queue.put_nowait(None)
+
+    async def chunks(self, timeout: float = None):
+        """
+        Yield buffered chunks, then live ones, re-raising any generation error at the end.
+        Raises asyncio.TimeoutError if no chunk arrives within timeout seconds.
+        """
+        while True:
+            chunk = await asyncio.wait_for(self.queue.get(), timeout)
+            if chunk is None:
+                break
+            yield chunk
+        await self.task
+
+    async def text(self, timeout: float = None) -> str:
+        return "".join([chunk async for chunk in self.chunks(timeout)])
+
+    def cancel(self):
+        self.task.cancel()
+
+
 class MentalHealthChatbot:
     """Main chatbot class that orchestrates the mental health conversation."""
 
-    def __init__(self):
+    def __init__(self, config: Config = None, firebase_manager: FirebaseManager = None):
         logging.info("Initializing MentalHealthChatbot...")
-        self.firebase_manager = FirebaseManager()
-        self.writer = FirebaseWriter()
-        self.config = Config()
-
-        self.llm = ChatGoogleGenerativeAI(
-            model=self.config.model_name,
-            google_api_key=self.config.gemini_api_key,
-            temperature=self.config.temperature,
-            max_tokens=self.config.max_tokens
+        self.firebase_manager = firebase_manager or FirebaseManager()
+        self.config = config or Config()
+        self.writer = FirebaseWriter(
+            self.firebase_manager.db,
+            batch_size=self.config.write_batch_size,
+            flush_interval=self.config.write_flush_interval,
+            async_db=self.firebase_manager.async_db
         )
 
-        self.message_manager = MessageManager(self.firebase_manager)
-        self.health_filter = MentalHealthFilter(self.config)
-        self.event_manager = EventManager(self.config, self.firebase_manager)
+        self.llm = get_llm(self.config, "chat")
+        self.gemini_breaker = get_breaker("gemini", self.config)
+        self.firestore_breaker = get_breaker("firestore", self.config)
+        self.prompt_cache = get_prompt_cache(self.config)
+        self.scheduler = get_llm_scheduler(self.config)
+        self.profile_cache = get_profile_cache(self.config)
+
+        self.message_manager = MessageManager(
+            self.firebase_manager,
+            cache_size=self.config.conversation_cache_size,
+            cache_ttl=self.config.conversation_cache_ttl,
+            window_size=self.config.conversation_window
+        )
+        self.analysis_manager = AnalysisManager(self.config)
+        self.preclassifier = PreClassifier()
+        self.health_filter = MentalHealthFilter(self.config, self.analysis_manager)
+        self.event_manager = EventManager(self.config, self.firebase_manager, self.analysis_manager)
         self.crisis_manager = CrisisManager(self.config)
-        self.helper_manager = HelperManager(self.config)
-        self.summary_manager = SummaryManager(self.config,self.firebase_manager.db)
+        self.helper_manager = HelperManager(self.config, self.analysis_manager)
+        self.summary_manager = SummaryManager(self.config,self.firebase_manager.db, self.firebase_manager.async_db)
+        self.context_builder = ContextBuilder(self.config)
+        # Users whose rolling summary is being folded right now
+        self._folding = set()
         
         self.system_prompt = """You are Sorea - a caring, supportive friend who adapts your response style based on what the person needs. Your personality adjusts to match the situation:
 
@@ -108,196 +175,413 @@ class MentalHealthChatbot:
         You: "That sounds tough. How have you been sleeping through all this?" OR "Have you talked to anyone close to you about this?"
 
         Remember: You can be caring and supportive without being aggressive. Save the intense, protective energy for when someone actually needs saving."""
+        # The only prompt above prompt_cache_min_tokens; the crisis, suggestions and greeting
+        # prompts are too short for Gemini context caching and are sent in full
+        self.prompt_cache.register(self.system_prompt)
+
+        # The reply can carry the turn's suggestions, saving the separate suggestions call
+        self.reply_prompt = self.system_prompt
+        if self.config.suggestions_in_reply:
+            self.reply_prompt = self.system_prompt + "\n" + REPLY_SUGGESTIONS_INSTRUCTION
 
 
 
     # ---------------------------------------------------------------------
     async def process_conversation_async(self, email: str, message: str) -> str:
-        try:
-            # Fetch in parallel
-            user_profile, emotion_urgency, recent_messages = await asyncio.gather(
-                asyncio.to_thread(self.firebase_manager.get_user_profile, email),
-                asyncio.to_thread(self.helper_manager.detect_emotion, message),
-                asyncio.to_thread(self.message_manager.get_conversation, email, self.firebase_manager, None, 20)
-            )
+        with span("chat.turn"):
+            try:
+                reply, turn = await self._prepare_turn_async(email, message, self.config.speculative_generation)
+            except Exception as e:
+                # Stages degrade on their own, so this is unexpected; answer instead of replaying the turn
+                logging.error(f"Error async conversation: {e}")
+                return DEGRADED_REPLY
 
-            # Last 2–3 messages
-            if recent_messages:
-                last_messages = [msg.user_message.content for msg in recent_messages[-3:]]
-            else:
-                last_messages = [message]
+            if reply is not None:
+                return reply
 
-            # Extract emotion/urgency
-            emotion, urgency_level = emotion_urgency
-            user_name = user_profile.name
+            # Normal response
+            return await self._generate_response_async(**turn)
 
 
-            if not message.startswith("[TEST]"):
-                topic_filter = await asyncio.to_thread(self.health_filter.filter, last_messages)
+    # ---------------------------------------------------------------------
+    async def stream_conversation_async(self, email: str, message: str):
+        """Yield the reply in chunks as Gemini streams it. Persistence runs once the stream finishes."""
+        try:
+            reply, turn = await self._prepare_turn_async(email, message, self.config.speculative_generation)
+        except Exception as e:
+            logging.error(f"Error streaming conversation: {e}")
+            reply = DEGRADED_REPLY
 
-            # Ignore non-mental-health queries
-            if not topic_filter.is_mental_health_related:
-                redirect = "Sorry but i can not answer to that question!!!."
-                asyncio.create_task(
-                    self.writer.submit(self.message_manager.add_chat_pair,
-                                       email, message, redirect, emotion, urgency_level)
-                )
-                return redirect
+        if reply is not None:
+            yield reply
+            return
 
-            # Extract events (background)
-            event_future = asyncio.create_task(
-                asyncio.to_thread(self.event_manager._extract_events_with_llm, message, email)
-            )
+        async for chunk in self._stream_response_async(**turn):
+            yield chunk
 
-            # Crisis handling
-            if urgency_level >= 5:
-                crisis = self.crisis_manager.handle_crisis_situation(email, message, self.firebase_manager)
-                asyncio.create_task(
-                    self.writer.submit(self.message_manager.add_chat_pair,
-                                       email, message, crisis.content, emotion, urgency_level)
-                )
-                return crisis.content
 
-            # Add event if exists
-            event = await event_future
-            if event:
-                asyncio.create_task(self.writer.submit(self.event_manager.add_event, email, event))
+    # ---------------------------------------------------------------------
+    def _firestore_stage(self, name, func, *args, fallback):
+        return run_stage(
+            name, func, *args,
+            breaker=self.firestore_breaker,
+            timeout=self.config.firestore_timeout,
+            retries=self.config.stage_retries,
+            fallback=fallback
+        )
 
-            # Normal response
-            return await self._generate_response_async(
-                email=email,
-                message=message,
-                user_name=user_name,
-                emotion=emotion,
-                urgency_level=urgency_level,
-                recent_messages=recent_messages
-            ) # type: ignore
+    def _gemini_stage(self, name, func, *args, fallback, retries=None):
+        return run_stage(
+            name, func, *args,
+            breaker=self.gemini_breaker,
+            timeout=self.config.gemini_timeout,
+            retries=self.config.stage_retries if retries is None else retries,
+            fallback=fallback
+        )
 
-        except Exception as e:
-            logging.error(f"Error async conversation: {e}")
-            return self.process_conversation_sync(email, message)
+    async def _crisis_reply(self, email, message):
+        crisis = await self._gemini_stage(
+            "crisis", self.crisis_manager.handle_crisis_situation_async, email, message, self.firebase_manager,
+            fallback=None
+        )
+        return crisis or self.crisis_manager.fallback_response()
 
 
     # ---------------------------------------------------------------------
-    async def _generate_response_async(self, email, message, user_name, emotion, urgency_level, recent_messages):
-        try:
-            enhanced_prompt = f"""
-{self.system_prompt}
-
-CONVERSATION CONTEXT:
-{recent_messages}
-
-CURRENT USER STATE:
-- Emotion: {emotion}
-- Urgency: {urgency_level}/5
-- Name: {user_name}
-"""
+    async def _prepare_turn_async(self, email: str, message: str, speculate: bool = False):
+        """
+        Run every stage that happens before the main reply.
+
+        With speculate, the reply starts generating alongside the analysis call and is
+        discarded if the turn turns out to be off-topic or a crisis.
+
+        Each stage has its own timeout, retries and circuit breaker, and falls back to a
+        degraded result (default profile, empty history, neutral analysis, static crisis
+        response) instead of failing the turn.
+
+        Returns (reply, None) when the turn is already answered (test, redirect or crisis),
+        otherwise (None, turn) where turn holds the arguments for the reply generation.
+        """
+        # Local fast path: crisis phrases skip every LLM stage before the crisis response
+        pre = self.preclassifier.classify(message)
+        if pre.path == "crisis" and not message.startswith("[TEST]"):
+            logging.info(f"Turn path: local_crisis (matched '{pre.matched}')")
+            crisis = await self._crisis_reply(email, message)
+            self.writer.submit_writes(self.message_manager.chat_pair_writes(
+                email, message, crisis.content, "distressed", 5
+            ))
+            return crisis.content, None
+
+        # Fetch in parallel
+        user_profile, recent_messages = await asyncio.gather(
+            self._firestore_stage(
+                "profile", self.firebase_manager.get_user_profile_async, email,
+                fallback=UserProfile(name="Friend")
+            ),
+            self._firestore_stage(
+                "conversation", self.message_manager.get_conversation_async,
+                email, self.firebase_manager, None, self.config.conversation_window,
+                fallback=[]
+            )
+        )
 
-            messages = [SystemMessage(content=enhanced_prompt)]
+        # Last 2–3 previous messages as context for the current one
+        last_messages = [msg.user_message.content for msg in recent_messages[-3:]] if recent_messages else []
+        user_name = user_profile.name
+
+        # History that fits the token budget; older turns are covered by the conversation's
+        # rolling summary. Trimmed turns it does not cover yet are folded in for the next turns
+        memory = self.message_manager.conversation_memory(email) if self.config.rolling_summary else None
+        history, trimmed = self.context_builder.fit_history(recent_messages, memory)
+        earlier_summary = memory.summary if memory and memory.summary else None
+        if memory is not None and self.context_builder.uncovered_turns(recent_messages, memory, trimmed):
+            self._maybe_fold_summary(email, force=True)
+
+        # Speculative reply, using the user's state from the previous turn
+        draft = None
+        if speculate and not message.startswith("[TEST]"):
+            previous = recent_messages[-1].user_message if recent_messages else None
+            draft = ReplyStream(self.llm, self._build_messages(
+                message,
+                user_name,
+                (previous.emotion_detected if previous else None) or "neutral",
+                (previous.urgency_level if previous else None) or 1,
+                history,
+                earlier_summary
+            ))
 
-            # Chat history
-            if recent_messages:
-                for msg_pair in recent_messages:
-                    messages.append(HumanMessage(content=msg_pair.user_message.content))
-                    messages.append(AIMessage(content=msg_pair.llm_message.content))
+        # Emotion, urgency, topic relevance and event in a single LLM call.
+        # A confident local topic match leaves the topic part out of the call.
+        known_topic = None
+        if pre.path == "mental_health":
+            known_topic = MentalHealthTopicFilter(
+                is_mental_health_related=True,
+                confidence_score=pre.confidence,
+                reason=f"Local match: '{pre.matched}'"
+            )
+        try:
+            analysis = await self._gemini_stage(
+                "analysis", self.analysis_manager.analyze_async, message, last_messages, email, known_topic, True,
+                fallback=None
+            )
+        except BaseException:
+            if draft:
+                draft.cancel()
+            raise
+        if analysis is None:
+            analysis = self.analysis_manager.default_analysis(known_topic)
+            # A plainly dated event is still kept without the LLM
+            analysis.event = self.analysis_manager.local_event(message, email)[1]
+        analysis.path = "local_topic" if known_topic else "llm"
+        logging.info(f"Turn path: {analysis.path}")
+        emotion, urgency_level = analysis.emotion, analysis.urgency_level
+
+        # Draft is only kept for normal on-topic turns
+        if draft and (not analysis.is_mental_health_related or urgency_level >= 5):
+            logging.info("Discarding speculative reply")
+            draft.cancel()
+            draft = None
+
+        # TEST bypass
+        if message.startswith("[TEST]"):
+            return "[TEST CHAT SUCCESS]", None
+
+        # Ignore non-mental-health queries
+        if not analysis.is_mental_health_related:
+            redirect = "Sorry but i can not answer to that question!!!."
+            self.writer.submit_writes(self.message_manager.chat_pair_writes(
+                email, message, redirect, emotion, urgency_level
+            ))
+            return redirect, None
 
-            # Add new message okay
-            messages.append(HumanMessage(content=message))
+        # Crisis handling
+        if urgency_level >= 5:
+            crisis = await self._crisis_reply(email, message)
+            self.writer.submit_writes(self.message_manager.chat_pair_writes(
+                email, message, crisis.content, emotion, urgency_level
+            ))
+            return crisis.content, None
 
-            # LLM CALL
-            response = await asyncio.to_thread(self.llm.invoke, messages)
-            bot_message = response.content
+        # Add event if exists
+        if analysis.event:
+            self.writer.submit_writes(self.event_manager.event_writes(email, analysis.event))
 
-            # Persist interaction (non-blocking for caller)
-            asyncio.create_task(self.writer.submit(
-                self.message_manager.add_chat_pair,
-                email, message, bot_message, emotion, urgency_level
-            ))
+        return None, {
+            "email": email,
+            "message": message,
+            "user_name": user_name,
+            "emotion": emotion,
+            "urgency_level": urgency_level,
+            "recent_messages": history,
+            "earlier_summary": earlier_summary,
+            "draft": draft
+        }
 
-            asyncio.create_task(self.writer.submit(
-                self.message_manager.add_suggestions,
-                self.helper_manager,
-                emotion,
-                urgency_level,
-                email,
-                self.firebase_manager,
-                self.message_manager,
-                message
-                
-            ))
-            
-            return bot_message
 
-        except Exception as e:
-            logging.error(f"Error generating response: {e}")
-            raise
+    # ---------------------------------------------------------------------
+    def _build_messages(self, message, user_name, emotion, urgency_level, recent_messages, earlier_summary=None):
+        return self.context_builder.build(
+            self.reply_prompt, message, user_name, emotion, urgency_level, recent_messages, earlier_summary
+        )
 
 
     # ---------------------------------------------------------------------
-    def process_conversation(self, email: str, message: str) -> str:
-        """Required by API + test"""
-        return asyncio.run(self.process_conversation_async(email, message))
+    def _persist_turn(self, email, message, bot_message, emotion, urgency_level, user_name, recent_messages,
+                      suggestions=None):
+        """
+        Queue the chat pair and suggestion writes (non-blocking for caller).
+        Without suggestions from the reply, they are generated in the background from the
+        turn's profile and history, once the user has been quiet for suggestion_debounce seconds.
+        """
+        writes = self.message_manager.chat_pair_writes(email, message, bot_message, emotion, urgency_level)
+        if suggestions:
+            writes += self.message_manager.suggestion_writes(email, emotion, urgency_level, suggestions)
+        self.writer.submit_writes(writes)
+        self._maybe_fold_summary(email)
+        if suggestions:
+            return
+
+        self.writer.submit_debounced(
+            ("suggestions", email),
+            self.config.suggestion_debounce,
+            self.message_manager.add_suggestions_async,
+            self.helper_manager,
+            emotion,
+            urgency_level,
+            email,
+            self.firebase_manager,
+            self.message_manager,
+            message,
+            user_name=user_name,
+            recent_messages=recent_messages
+        )
 
 
     # ---------------------------------------------------------------------
-    def process_conversation_sync(self, email: str, message: str) -> str:
-        """Fallback sync method"""
+    def _maybe_fold_summary(self, email, force=False):
+        """
+        Queue a rolling summary update once summary_trigger_length turns are not covered by it,
+        or with force as soon as any turn is not (the prompt had to trim it).
+        """
+        if not self.config.rolling_summary or email in self._folding:
+            return
+        memory = self.message_manager.conversation_memory(email)
+        if memory is None:
+            return
+        pending = memory.pair_count - memory.summarized_pairs
+        if pending <= 0 or (pending < self.config.summary_trigger_length and not force):
+            return
+        self._folding.add(email)
+        self.writer.submit(self._fold_summary_async, email)
+
+    async def _fold_summary_async(self, email):
+        """Fold the turns since the last update into the conversation's rolling summary."""
         try:
-            user_profile = self.firebase_manager.get_user_profile(email)
-            recent_messages = self.message_manager.get_conversation(email, self.firebase_manager, limit=20)
-            last_messages = [msg.user_message.content for msg in recent_messages[-3:]] if recent_messages else [message]
-            topic_filter = self.health_filter.filter(last_messages)
-            emotion, urgency_level = self.helper_manager.detect_emotion(message)
+            memory = self.message_manager.conversation_memory(email)
+            if memory is None:
+                return
+            new_pairs = memory.pair_count - memory.summarized_pairs
+            if new_pairs <= 0:
+                return
+
+            # Served from the cached window, or read with this turn's writes committed
+            await self.writer.flush()
+            pairs = await self.message_manager.get_conversation_async(email, self.firebase_manager, None, new_pairs)
+            folded = await self.summary_manager.fold_summary_async(memory.summary, memory.key_topics, pairs)
+            if folded is None:
+                return
+
+            summary, key_topics = folded
+            updated = memory.model_copy(update={
+                "summary": summary, "key_topics": key_topics, "summarized_pairs": memory.pair_count
+            })
+            self.writer.submit_writes(self.message_manager.rolling_summary_writes(email, updated))
+            self.message_manager.remember_summary(email, updated)
+        finally:
+            self._folding.discard(email)
 
-            # TEST bypass
-            if message.startswith("[TEST]"):
-                return "[TEST CHAT SUCCESS]"
 
-            if not topic_filter.is_mental_health_related:
-                redirect = "Sorry but i can not answer to that question!!!."
-                return redirect
+    # ---------------------------------------------------------------------
+    async def _generate_response_async(self, email, message, user_name, emotion, urgency_level, recent_messages,
+                                       earlier_summary=None, draft=None):
+        """Produce the main reply. Never raises: falls back to DEGRADED_REPLY if Gemini is unavailable."""
+        bot_message = None
+        if draft:
+            bot_message = await self._gemini_stage(
+                "reply", draft.text, self.config.gemini_timeout, fallback=None, retries=0
+            )
+            if bot_message is None:
+                draft.cancel()
 
-            # Crisis block
-            if urgency_level >= 5:
-                crisis = self.crisis_manager.handle_crisis_situation(email, message, self.firebase_manager)
-                return crisis.content
+        if bot_message is None:
+            messages = self._build_messages(
+                message, user_name, emotion, urgency_level, recent_messages, earlier_summary
+            )
 
-            enhanced_prompt = f"""
-{self.system_prompt}
+            # LLM CALL
+            response = await self._gemini_stage(
+                "reply", self.scheduler.ainvoke, self.llm, messages, "chat", fallback=None
+            )
+            bot_message = response.content if response is not None else None
+
+        if bot_message is None:
+            self.writer.submit_writes(self.message_manager.chat_pair_writes(
+                email, message, DEGRADED_REPLY, emotion, urgency_level
+            ))
+            return DEGRADED_REPLY
 
-CONVERSATION CONTEXT:
-{recent_messages}
-"""
+        suggestions = None
+        if self.config.suggestions_in_reply:
+            bot_message, suggestions = HelperManager.split_reply(bot_message)
 
-            messages = [SystemMessage(content=enhanced_prompt)]
+        self._persist_turn(email, message, bot_message, emotion, urgency_level, user_name, recent_messages,
+                           suggestions)
+        return bot_message
 
-            if recent_messages:
-                for msg_pair in recent_messages:
-                    messages.append(HumanMessage(content=msg_pair.user_message.content))
-                    messages.append(AIMessage(content=msg_pair.llm_message.content))
 
-            messages.append(HumanMessage(content=message))
+    # ---------------------------------------------------------------------
+    async def _stream_response_async(self, email, message, user_name, emotion, urgency_level, recent_messages,
+                                     earlier_summary=None, draft=None):
+        """
+        Stream the main reply. A stream that fails before its first chunk is retried, and
+        DEGRADED_REPLY is sent if nothing could be generated. Failures mid-stream are raised.
+        The turn is stored even if the client disconnects, with the reply generated so far.
+        """
+        chunks = []
+        splitter = ReplySplitter() if self.config.suggestions_in_reply else None
+        persisted = False
+        try:
+            for attempt in range(self.config.stage_retries + 1):
+                if not self.gemini_breaker.allow():
+                    logging.warning("Stage reply skipped: circuit 'gemini' open")
+                    # A speculative draft handed over by _prepare_turn_async would keep generating
+                    if draft:
+                        draft.cancel()
+                    break
+                if draft is None:
+                    draft = ReplyStream(self.llm, self._build_messages(
+                        message, user_name, emotion, urgency_level, recent_messages, earlier_summary
+                    ))
+
+                # LLM CALL, forwarded chunk by chunk
+                recorded = False
+                try:
+                    async for chunk in draft.chunks(self.config.gemini_timeout):
+                        chunks.append(chunk)
+                        visible = splitter.feed(chunk) if splitter else chunk
+                        if visible:
+                            yield visible
+                    self.gemini_breaker.record_success()
+                    recorded = True
+                    break
+                except Exception as e:
+                    self.gemini_breaker.record_failure()
+                    recorded = True
+                    if chunks:
+                        logging.error(f"Error streaming response: {e}")
+                        raise
+                    logging.warning(f"Stage reply attempt {attempt + 1} failed: {e}")
+                    draft = None
+                finally:
+                    # Stops generation if the client went away mid-stream
+                    if draft:
+                        draft.cancel()
+                    if not recorded:
+                        self.gemini_breaker.release()
+
+            if not chunks:
+                persisted = True
+                self.writer.submit_writes(self.message_manager.chat_pair_writes(
+                    email, message, DEGRADED_REPLY, emotion, urgency_level
+                ))
+                yield DEGRADED_REPLY
+                return
+
+            bot_message, suggestions = "".join(chunks), None
+            if splitter:
+                rest = splitter.finish()
+                if rest:
+                    yield rest
+                bot_message, suggestions = HelperManager.split_reply(bot_message)
+
+            # Persist only once the full reply is known
+            persisted = True
+            self._persist_turn(email, message, bot_message, emotion, urgency_level, user_name, recent_messages,
+                               suggestions)
+        finally:
+            # The client went away (or the stream failed) mid-reply: keep what was generated
+            if not persisted and chunks:
+                bot_message, suggestions = "".join(chunks), None
+                if splitter:
+                    bot_message, suggestions = HelperManager.split_reply(bot_message)
+                self._persist_turn(email, message, bot_message, emotion, urgency_level, user_name,
+                                   recent_messages, suggestions)
 
-            response = self.llm.invoke(messages)
-            return response.content
 
-            asyncio.run(self.writer.submit(
-                self.message_manager.add_chat_pair,
-                email, message, bot_message, emotion, urgency_level
-            ))
-            asyncio.run(self.writer.submit(
-                self.message_manager.add_suggestions,
-                self.helper_manager,
-                emotion,
-                urgency_level,
-                email,
-                self.firebase_manager,
-                self.message_manager,
-                message
-            ))
-            
-            return bot_message
-            
-        except Exception as e:
-            logging.error(f"Sync error: {e}")
-            raise
+    # ---------------------------------------------------------------------
+    def process_conversation(self, email: str, message: str, trace=None) -> str:
+        """
+        Required by API + test. Runs on the shared background loop so queued writes outlive the request.
+        Spans of the turn are collected into trace when one is given.
+        """
+        return get_background_loop().run(run_in_trace(trace, self.process_conversation_async(email, message)))
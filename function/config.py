@@ -13,9 +13,69 @@ class Config(BaseModel):
     max_tokens: int = int(os.getenv("MAX_TOKENS", "1000"))
     temperature: float = float(os.getenv("TEMPERATURE", "0.7"))
     
+    # Start the reply alongside the analysis call (discarded for crisis/off-topic turns)
+    speculative_generation: bool = os.getenv("SPECULATIVE_GENERATION", "false").lower() == "true"
+
+    # Event extraction only for messages with a time reference; plainly dated events
+    # ("my exam is tomorrow") are built locally
+    temporal_gate: bool = os.getenv("TEMPORAL_GATE", "true").lower() == "true"
+
+    # Suggestions: produced by the main reply instead of a separate call, and how long a user
+    # must be quiet before background suggestions are generated
+    suggestions_in_reply: bool = os.getenv("SUGGESTIONS_IN_REPLY", "false").lower() == "true"
+    suggestion_debounce: float = float(os.getenv("SUGGESTION_DEBOUNCE", "10"))
+
+    # Gemini context caching of the static chat system prompt
+    prompt_cache_enabled: bool = os.getenv("PROMPT_CACHE", "true").lower() == "true"
+    prompt_cache_ttl: int = int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+    prompt_cache_min_tokens: int = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+
+    # Gemini Quotas, shared by every LLM call in the process (0 = unlimited)
+    gemini_requests_per_minute: int = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "1000"))
+    gemini_tokens_per_minute: int = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "1000000"))
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    llm_background_share: float = float(os.getenv("LLM_BACKGROUND_SHARE", "0.8"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+
+    # Stage Timeouts and Circuit Breakers
+    firestore_timeout: float = float(os.getenv("FIRESTORE_TIMEOUT", "5"))
+    gemini_timeout: float = float(os.getenv("GEMINI_TIMEOUT", "30"))
+    stage_retries: int = int(os.getenv("STAGE_RETRIES", "1"))
+    breaker_failure_threshold: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    breaker_reset_timeout: float = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+    # Per-request timings in chat responses
+    debug_timings: bool = os.getenv("DEBUG_TIMINGS", "false").lower() == "true"
+
     # Memory Configuration
     max_conversation_history: int = 50
-    summary_trigger_length: int = 20
+    context_token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+    summary_trigger_length: int = int(os.getenv("SUMMARY_TRIGGER_LENGTH", "20"))
+
+    # Rolling conversation summary: every summary_trigger_length new turns are folded into the
+    # conversation's running summary, and the reply prompt keeps only the unsummarized turns
+    # (at least summary_keep_turns of them) next to it. Turns the token budget trims are folded
+    # in without waiting for the trigger; with this off they are simply left out
+    rolling_summary: bool = os.getenv("ROLLING_SUMMARY", "true").lower() == "true"
+    summary_keep_turns: int = int(os.getenv("SUMMARY_KEEP_TURNS", "4"))
+
+    # Conversation Window Cache
+    conversation_window: int = 20
+    conversation_cache_size: int = int(os.getenv("CONVERSATION_CACHE_SIZE", "1024"))
+    conversation_cache_ttl: float = float(os.getenv("CONVERSATION_CACHE_TTL", "300"))
+
+    # User Profile Cache, optionally refreshed by Firestore snapshot listeners
+    profile_cache_size: int = int(os.getenv("PROFILE_CACHE_SIZE", "4096"))
+    profile_cache_ttl: float = float(os.getenv("PROFILE_CACHE_TTL", "600"))
+    profile_watch: bool = os.getenv("PROFILE_WATCH", "false").lower() == "true"
+
+    # Bulk Notifications
+    notification_max_concurrency: int = int(os.getenv("NOTIFICATION_MAX_CONCURRENCY", "16"))
+    notification_max_batch: int = int(os.getenv("NOTIFICATION_MAX_BATCH", "1000"))
+
+    # Firestore Write Batching
+    write_batch_size: int = int(os.getenv("WRITE_BATCH_SIZE", "50"))
+    write_flush_interval: float = float(os.getenv("WRITE_FLUSH_INTERVAL", "0.5"))
     
     class Config:
         env_file = ".env"
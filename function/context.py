@@ -0,0 +1,87 @@
+"""
+Context Assembly
+Builds the main reply prompt from the conversation history under a token budget
+"""
+
+from typing import List, Optional, Tuple
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from data import ConversationMemory, MessagePair
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Gemini models (about 4 characters per token)."""
+    return len(text) // 4 + 1 if text else 0
+
+
+class ContextBuilder:
+    """
+    Renders the conversation history once as chat turns, newest turns first within a token budget.
+    Turns already folded into the conversation's rolling summary are left out in favour of it.
+    Turns trimmed before the summary covers them are reported (uncovered_turns) so the caller
+    can fold them in.
+    """
+
+    def __init__(self, config):
+        self.token_budget = config.context_token_budget
+        self.max_turns = config.max_conversation_history
+        self.keep_turns = config.summary_keep_turns
+
+    def fit_history(self, recent_messages: List[MessagePair],
+                    memory: Optional[ConversationMemory] = None) -> Tuple[List[MessagePair], int]:
+        """
+        Keep the newest turns that fit the budget, trimming oldest first. With a rolling
+        summary in memory, only the turns it does not cover (at least keep_turns) are kept.
+
+        Returns:
+            Tuple of (kept turns oldest first, number of trimmed or summarized turns)
+        """
+        recent_messages = recent_messages or []
+        max_turns = self.max_turns
+        if memory is not None and memory.summary:
+            max_turns = min(max_turns, max(memory.pair_count - memory.summarized_pairs, self.keep_turns))
+        kept = []
+        used = 0
+        for pair in reversed(recent_messages[-max_turns:] if max_turns > 0 else []):
+            cost = estimate_tokens(pair.user_message.content) + estimate_tokens(pair.llm_message.content)
+            if kept and used + cost > self.token_budget:
+                break
+            kept.append(pair)
+            used += cost
+        kept.reverse()
+        return kept, len(recent_messages) - len(kept)
+
+    def uncovered_turns(self, recent_messages: List[MessagePair], memory: Optional[ConversationMemory],
+                        trimmed: int) -> int:
+        """How many of the trimmed turns (the oldest in recent_messages) the rolling summary does not cover yet."""
+        recent_messages = recent_messages or []
+        unsummarized = memory.pair_count - memory.summarized_pairs if memory is not None else len(recent_messages)
+        covered = max(0, len(recent_messages) - unsummarized)
+        return max(0, trimmed - covered)
+
+    def build(self, system_prompt: str, message: str, user_name: str, emotion: str, urgency_level: int,
+              history: List[MessagePair], earlier_summary: Optional[str] = None) -> list:
+        """Assemble the message list: system prompt with user state, history turns, current message."""
+        enhanced_prompt = f"""
+{system_prompt}
+"""
+        if earlier_summary:
+            enhanced_prompt += f"""
+EARLIER IN THIS CONVERSATION (summary of the turns before the ones below):
+{earlier_summary}
+"""
+        enhanced_prompt += f"""
+CURRENT USER STATE:
+- Emotion: {emotion}
+- Urgency: {urgency_level}/5
+- Name: {user_name}
+"""
+
+        messages = [SystemMessage(content=enhanced_prompt)]
+
+        # Chat history, sent once as real turns
+        for msg_pair in history:
+            messages.append(HumanMessage(content=msg_pair.user_message.content))
+            messages.append(AIMessage(content=msg_pair.llm_message.content))
+
+        messages.append(HumanMessage(content=message))
+        return messages
@@ -1,71 +1,323 @@
-from datetime import date
+from datetime import date, datetime, time, timedelta, timezone
 from config import Config
 from managers.firebase_manager import FirebaseManager
 from managers.message import MessageManager
 from managers.summary import SummaryManager
+from data import ConversationMemory, MessagePair
+from background import get_background_loop
+from ratelimit import get_llm_scheduler
+from timezones import ended_local_date, local_date, local_day_bounds
+import asyncio
+import json
 import logging
-from typing import Union, Tuple
+import threading
+from typing import Dict, Union, Tuple, List, Optional
 
 
-def run_daily_task_for_user(email: str) -> None:
-    
+class DailyTaskRunner:
+    """
+    Runs the daily summary task for one user at a time (each queue message) over one shared
+    set of clients. Gemini calls go through the shared LLM scheduler at background priority;
+    retries come from the queue. Users whose summary for the day already exists are skipped.
+    """
+
+    def __init__(self, config: Config = None, firebase_manager: FirebaseManager = None):
+        self.config = config or Config()
+        self.firebase_manager = firebase_manager or FirebaseManager()
+        get_llm_scheduler(self.config)
+        self.message_manager = MessageManager(self.firebase_manager)
+        self.summary_manager = SummaryManager(self.config, self.firebase_manager.db, self.firebase_manager.async_db)
+
+    def run_for_user(self, email: str, last_message_time: Optional[datetime] = None,
+                     summary_date: Optional[str] = None, timezone_name: Optional[str] = None) -> None:
+        """
+        Summarize the user's local day summary_date (ISO date) into that day's summary and
+        unmark the user (see clear_daily_pending). When the user's last message is older than
+        that day (runs were missed), their last local day with messages is summarized instead.
+
+        Without summary_date, the user's last conversation day is summarized into today's
+        summary. Raises if the summary could not be produced.
+        """
+        if summary_date is None:
+            summary_date = date.today().isoformat()
+            if self.summary_manager.daily_summary_exists(email, summary_date):
+                logging.info(f"Daily summary for {email} already exists, skipping")
+                return
+            memory, last_day_conversation = self.load_last_day(email, last_message_time)
+            if last_day_conversation or (memory and memory.summary):
+                self.summarize_and_store(email, last_day_conversation, memory, summary_date)
+            return
+
+        _, day_end = local_day_bounds(timezone_name, summary_date)
+        day = summary_date
+        if last_message_time is not None and local_date(timezone_name, last_message_time) < summary_date:
+            day = local_date(timezone_name, last_message_time)
+
+        if self.summary_manager.daily_summary_exists(email, day):
+            logging.info(f"Daily summary for {email} on {day} already exists, skipping")
+        else:
+            memory, conversation = self.load_local_day(email, day, timezone_name)
+            if conversation or (memory and memory.summary):
+                self.summarize_and_store(email, conversation, memory, day)
+
+        # Chats after the summarized day keep the user marked for their next run
+        self.firebase_manager.clear_daily_pending(email, day_end)
+
+    def load_local_day(self, email: str, day: str, timezone_name: Optional[str]
+                       ) -> Tuple[Optional[ConversationMemory], List[MessagePair]]:
+        """
+        Fetch the message pairs of the user's local day (ISO date). When that day is exactly
+        one stored conversation (the user shares the server's timezone), its rolling summary
+        is reused as in load_last_day; otherwise the pairs are read by timestamp across the
+        conversations the day overlaps.
+
+        Returns:
+            Tuple of (conversation memory or None, message pairs)
+        """
+        start, end = local_day_bounds(timezone_name, day)
+        conversation_ids = self.message_manager.conversation_ids_between(start, end)
+        server_start = start.astimezone()
+        if len(conversation_ids) == 1 and server_start.time() == time.min and end - start == timedelta(days=1):
+            return self._load_conversation(email, server_start.strftime('%Y%m%d'))
+        return None, self.message_manager.get_pairs_between(email, self.firebase_manager, start, end)
+
+    def load_last_day(self, email: str, last_message_time: Optional[datetime] = None
+                      ) -> Tuple[Optional[ConversationMemory], List[MessagePair]]:
+        """
+        Fetch the user's last conversation day. When the chat path already keeps a rolling
+        summary of it, only the message pairs the summary does not cover yet are read.
+        A known last_message_time (e.g. from the due-user query) saves reading it again.
+
+        Returns:
+            Tuple of (conversation memory or None, message pairs)
+        """
+        if last_message_time is None:
+            last_message_time = self.message_manager.get_last_conversation_time(self.firebase_manager, email)
+        if not last_message_time:
+            return None, []
+        return self._load_conversation(email, last_message_time.strftime('%Y%m%d'))
+
+    def _load_conversation(self, email: str, conversation_date: str
+                           ) -> Tuple[Optional[ConversationMemory], List[MessagePair]]:
+        """
+        The stored conversation of conversation_date (YYYYMMDD): its memory and the pairs its
+        summary lacks. Read errors are raised so the user stays marked for a retry.
+        """
+        memory = self.message_manager.get_conversation_memory(email, self.firebase_manager, conversation_date)
+        if memory is None:
+            return None, []
+        if memory.summary:
+            unsummarized = memory.pair_count - memory.summarized_pairs
+            if unsummarized <= 0:
+                return memory, []
+            return memory, self.message_manager.get_conversation_pairs(
+                email, self.firebase_manager, conversation_date, limit=unsummarized
+            )
+
+        return memory, self.message_manager.get_conversation_pairs(email, self.firebase_manager, conversation_date)
+
+    def summarize_and_store(self, email: str, conversation: List[MessagePair],
+                            memory: Optional[ConversationMemory] = None, summary_date: Optional[str] = None) -> None:
+        get_background_loop().run(self.summarize_and_store_async(email, conversation, memory, summary_date))
+
+    async def summarize_and_store_async(self, email: str, conversation: List[MessagePair],
+                                        memory: Optional[ConversationMemory] = None,
+                                        summary_date: Optional[str] = None) -> None:
+        """
+        Store the day's summary. With a rolling summary this is a finalize step: only the
+        turns since the last fold are sent to Gemini, or none at all when it is up to date.
+        Raises if the summary could not be generated or stored.
+        """
+        today_iso = summary_date or date.today().isoformat()
+
+        if memory and memory.summary:
+            conversation_summary, key_topics = memory.summary, memory.key_topics
+            if conversation:
+                folded = await self.summary_manager.fold_summary_async(memory.summary, memory.key_topics, conversation)
+                if not folded:
+                    raise RuntimeError("Summary generation failed")
+                conversation_summary, key_topics = folded
+            stored = await self.summary_manager.store_daily_summary_async(
+                email, today_iso, {"summary_text": conversation_summary, "key_topics": key_topics}
+            )
+            if not stored:
+                raise RuntimeError("Summary store failed")
+            return
+
+        conversation_summary = await self.summary_manager.generate_conversation_summary_async(conversation)
+        if not conversation_summary:
+            raise RuntimeError("Summary generation failed")
+
+        stored = await self.summary_manager.store_daily_summary_async(
+            email, today_iso, {"summary_text": conversation_summary}
+        )
+        if not stored:
+            raise RuntimeError("Summary store failed")
+
+    def due_users(self, now: Optional[datetime] = None) -> Dict[str, Tuple[Optional[datetime], str, Optional[str]]]:
+        """
+        Select the users whose local day ended in the past hour (the bucket of the current
+        UTC hour) and who chatted since their last daily run. The mark is cleared by the
+        worker once the user's summary is stored, so a user whose task never ran or failed
+        stays marked and is picked up a day later.
+
+        Returns:
+            Dict of email -> (lastMessageAt, ISO date of the local day that ended, timezone)
+        """
+        now = now or datetime.now(timezone.utc)
+        bucket = now.hour
+        users = self.firebase_manager.get_daily_due_users(bucket)
+        logging.info(f"Daily run for bucket {bucket}: {len(users)} users due")
+
+        return {
+            email: (data.get('lastMessageAt'), ended_local_date(data.get('timezone'), now), data.get('timezone'))
+            for email, data in users.items()
+        }
+
+    async def notify_all(self, emails: List[str]) -> Dict[str, dict]:
+        """
+        Generate notification texts for many users concurrently over the shared clients.
+
+        Returns:
+            Dict of email -> {"notification": text} or {"error": message}
+        """
+        semaphore = asyncio.Semaphore(self.config.notification_max_concurrency)
+
+        async def notify(email: str):
+            async with semaphore:
+                try:
+                    text = await self.message_manager.generate_notification_text_async(
+                        email, self.config, self.firebase_manager
+                    )
+                    return email, {"notification": text}
+                except Exception as e:
+                    logging.error(f"Notification failed for {email}: {e}")
+                    return email, {"error": "Could not generate notification."}
+
+        results = await asyncio.gather(*(notify(email) for email in dict.fromkeys(emails)))
+        return dict(results)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_daily_task_runner() -> DailyTaskRunner:
+    """Return the process-wide DailyTaskRunner, creating its clients on first use."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = DailyTaskRunner()
+    return _runner
+
+
+def run_daily_task_for_user(email: str, last_message_time: Optional[datetime] = None,
+                            summary_date: Optional[str] = None, raise_errors: bool = False,
+                            timezone_name: Optional[str] = None) -> None:
+    """
+    Run the daily summary task for one user. With raise_errors, failures propagate so a
+    queue-triggered caller gets the message retried (and poisoned after too many attempts).
+    """
     try:
-        config = Config()
-        firebase_manager = FirebaseManager()
-        message_manager = MessageManager(firebase_manager)
-        summary_manager = SummaryManager(config, firebase_manager.db)
+        runner = get_daily_task_runner()
     except Exception as e:
         logging.error(f"Error initializing components for {email}: {e}", exc_info=True)
-        return 
+        if raise_errors:
+            raise
+        return
 
     try:
-        
-        today_iso = date.today().isoformat()
-        
-        
-        last_message_time = message_manager.get_last_conversation_time(firebase_manager,email)
-        
-        
-        if last_message_time:
-            
-            last_message_date_str = last_message_time.strftime('%Y%m%d')
-            
-            
-            last_day_conversation = message_manager.get_conversation(
-                email, firebase_manager, date=last_message_date_str
-            )
-            
-            
-            if last_day_conversation:
-                conversation_summary = summary_manager.generate_conversation_summary(last_day_conversation)
-                
-                
-                if conversation_summary:
-                    summary_manager.store_daily_summary(
-                        email, today_iso, {"summary_text": conversation_summary}
-                    )
+        runner.run_for_user(email, last_message_time, summary_date, timezone_name)
 
     except Exception as e:
         logging.error(f"Error executing daily task for {email}: {e}", exc_info=True)
-    
-    
+        if raise_errors:
+            raise
+
+
+def daily_task_messages(now: Optional[datetime] = None) -> List[str]:
+    """
+    Queue messages for this hour's daily fan-out, one per due user (see due_users).
+    Each message carries the user's lastMessageAt, the local date being summarized and
+    the user's timezone.
+    """
+    runner = get_daily_task_runner()
+    return [
+        json.dumps({
+            "email": email,
+            "lastMessageAt": last_message_time.isoformat() if last_message_time else None,
+            "date": summary_date,
+            "timezone": timezone_name
+        })
+        for email, (last_message_time, summary_date, timezone_name) in runner.due_users(now).items()
+    ]
+
+
+def parse_daily_task_message(body: str) -> Tuple[str, Optional[datetime], Optional[str], Optional[str]]:
+    """
+    Read a queue message from daily_task_messages.
+
+    Returns:
+        Tuple of (email, lastMessageAt or None, summary date or None, timezone or None)
+
+    Raises:
+        ValueError: If the message is malformed
+    """
+    try:
+        task = json.loads(body)
+        last_message_time = task.get("lastMessageAt")
+        return (
+            task["email"],
+            datetime.fromisoformat(last_message_time) if last_message_time else None,
+            task.get("date"),
+            task.get("timezone")
+        )
+    except (AttributeError, KeyError, TypeError) as e:
+        raise ValueError(f"Malformed daily task message: {e}") from e
+
+
 
 def send_notification(email: str) -> Union[str, Tuple[str, str]]:
     try:
-        config = Config()
-        firebase_manager = FirebaseManager()
-        message_manager = MessageManager(firebase_manager)
+        runner = get_daily_task_runner()
     except Exception as e:
         logging.error(f"Error initializing components for {email}: {e}", exc_info=True)
         return "Error: Could not initialize components.", "Error: Initialization failed."
 
     try:
-        notification = message_manager.generate_notification_text(email, config, firebase_manager)
+        notification = runner.message_manager.generate_notification_text(email, runner.config, runner.firebase_manager)
         return notification
 
     except Exception as e:
         logging.error(f"Error executing daily task for {email}: {e}", exc_info=True)
         return "Error during task execution.", "Could not generate notification."
-    
-    
-    
+
+
+def notification_cohort(inactive_hours: Optional[float] = None, limit: Optional[int] = None,
+                        start_after: Optional[str] = None) -> List[str]:
+    """
+    One page of the users inactive for at least inactive_hours (every user when None):
+    at most limit emails, after the start_after email of the previous page.
+    """
+    firebase_manager = get_daily_task_runner().firebase_manager
+    if inactive_hours is not None:
+        return firebase_manager.get_inactive_user_emails(inactive_hours, limit, start_after)
+    return firebase_manager.get_all_user_emails(limit, start_after)
+
+
+def send_notifications(emails: List[str]) -> Dict[str, dict]:
+    """Generate notifications for a list of users. Returns the per-user result map."""
+    runner = get_daily_task_runner()
+    return get_background_loop().run(runner.notify_all(emails))
+
+
+def backfill_last_activity() -> int:
+    """One-off migration: write lastMessageAt/lastConversationId for users created before the index."""
+    try:
+        firebase_manager = FirebaseManager()
+        message_manager = MessageManager(firebase_manager)
+        return message_manager.backfill_last_activity(firebase_manager)
+    except Exception as e:
+        logging.error(f"Error backfilling last activity: {e}", exc_info=True)
+        return 0
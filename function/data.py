@@ -15,6 +15,8 @@ class Event(BaseModel):
 
 class UserProfile(BaseModel):
     """User profile information for personalization."""
+    email: Optional[str] = None
+    timezone: str = "UTC"  # IANA name, e.g. 'Asia/Kolkata'
     name: Optional[str] = None
     username: Optional[str] = None
     age: Optional[int] = None  
@@ -50,10 +52,45 @@ class ConversationMemory(BaseModel):
     chat: List[MessagePair] = Field(default_factory=list)
     summary: str = ""
     key_topics: List[str] = Field(default_factory=list)
+    pair_count: int = 0          # chat pairs in the conversation
+    summarized_pairs: int = 0    # leading pairs already folded into summary
 
 
 class MentalHealthTopicFilter(BaseModel):
     """Filter for mental health related topics."""
     is_mental_health_related: bool
     confidence_score: float = Field(ge=0.0, le=1.0)
-    reason: str = ""
\ No newline at end of file
+    reason: str = ""
+
+
+class PreClassification(BaseModel):
+    """Result of the local rule-based pre-classifier."""
+    path: str = "llm"  # 'crisis', 'mental_health' or 'llm'
+    matched: Optional[str] = None
+    confidence: float = 0.0  # topic confidence for the 'mental_health' path
+
+
+class TemporalCue(BaseModel):
+    """Time reference found in a message by the local temporal parser."""
+    matched: str
+    date: Optional[str] = None        # YYYY-MM-DD when the message refers to one definite day
+    event_type: Optional[str] = None  # set when the message plainly names one kind of event
+
+
+class TurnAnalysis(BaseModel):
+    """Combined analysis of a single user turn: emotion, urgency, topic relevance and event."""
+    path: str = "llm"  # 'llm', 'local_topic' or 'local_crisis', which classifier decided the turn
+    emotion: str = "neutral"
+    urgency_level: int = Field(default=1, ge=1, le=5)
+    is_mental_health_related: bool = True
+    confidence_score: float = Field(default=0.1, ge=0.0, le=1.0)
+    reason: str = ""
+    event: Optional[Event] = None
+
+    def topic_filter(self) -> MentalHealthTopicFilter:
+        """Return the topic relevance part of the analysis."""
+        return MentalHealthTopicFilter(
+            is_mental_health_related=self.is_mental_health_related,
+            confidence_score=self.confidence_score,
+            reason=self.reason
+        )
@@ -1,23 +1,263 @@
 import asyncio
 import logging
+import random
+import time
+from typing import List
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1 import Increment
+from background import get_background_loop
+from tracing import current_trace, record_span, run_in_trace, span
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+# Errors after which a batch is known not to have been applied, so it can be sent again.
+# DeadlineExceeded is left out: the commit may have landed, and Increments would double.
+TRANSIENT_ERRORS = (
+    gexc.ServiceUnavailable, gexc.InternalServerError, gexc.Aborted, gexc.ResourceExhausted, ConnectionError
+)
+
+
+class WriteOp:
+    """A single document write that can be grouped into a Firestore batch."""
+
+    def __init__(self, ref, data: dict, merge: bool = True):
+        self.ref = ref
+        self.data = data
+        self.merge = merge
+
+
+def _merge_fields(base: dict, update: dict) -> dict:
+    """Merge update into base the way consecutive merge writes would, summing Increments."""
+    merged = dict(base)
+    for key, value in update.items():
+        current = merged.get(key)
+        if isinstance(current, Increment) and isinstance(value, Increment):
+            merged[key] = Increment(current.value + value.value)
+        elif isinstance(value, Increment) and isinstance(current, (int, float)) and not isinstance(current, bool):
+            # A plain value followed by an increment is the incremented value
+            merged[key] = current + value.value
+        elif isinstance(current, dict) and isinstance(value, dict):
+            merged[key] = _merge_fields(current, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def coalesce_writes(ops: List[WriteOp]) -> List[WriteOp]:
+    """Collapse writes to the same document into one, keeping first-seen order."""
+    coalesced = {}
+    for op in ops:
+        path = op.ref.path
+        previous = coalesced.get(path)
+        if previous is None or not op.merge:
+            coalesced[path] = WriteOp(op.ref, dict(op.data), op.merge)
+        else:
+            coalesced[path] = WriteOp(op.ref, _merge_fields(previous.data, op.data), previous.merge)
+    return list(coalesced.values())
+
+
+def commit_writes(db, ops: List[WriteOp]) -> None:
+    """Commit writes synchronously in as few batches as possible."""
+    ops = coalesce_writes(ops)
+    for start in range(0, len(ops), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for op in ops[start:start + MAX_BATCH_WRITES]:
+            batch.set(op.ref, op.data, merge=op.merge)
+        batch.commit()
+
+
+async def commit_writes_async(async_db, ops: List[WriteOp]) -> None:
+    """Commit writes on the AsyncClient in as few batches as possible."""
+    ops = coalesce_writes(ops)
+    for start in range(0, len(ops), MAX_BATCH_WRITES):
+        batch = async_db.batch()
+        for op in ops[start:start + MAX_BATCH_WRITES]:
+            # Refs may come from the sync client, address the same document on the async one
+            batch.set(async_db.document(op.ref.path), op.data, merge=op.merge)
+        await batch.commit()
+
 
 class FirebaseWriter:
-    def __init__(self):
-        self.queue = asyncio.Queue()
-        self._start_worker()
+    """
+    Queues Firestore work on the background loop.
+    Document writes are buffered and committed together once batch_size writes are pending
+    or flush_interval seconds have passed, on the AsyncClient when one is given.
+    A commit that fails with a transient error is retried; if the batch still fails, each
+    write is committed on its own so one bad write or a lasting outage only loses what it must.
+    Other jobs run on a pool of workers.
+    """
 
-    def _start_worker(self):
-        asyncio.create_task(self._worker())
+    def __init__(self, db, workers: int = 4, batch_size: int = 50, flush_interval: float = 0.5, async_db=None,
+                 max_retries: int = 3, retry_backoff: float = 0.2):
+        self.db = db
+        self.async_db = async_db
+        self.background = get_background_loop()
+        self.loop = self.background.loop
+        self.queue = None
+        self.workers = workers
+        self.batch_size = min(batch_size, MAX_BATCH_WRITES)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._tasks = []
+        self._pending: List[WriteOp] = []
+        self._pending_since = None
+        self._flush_handle = None
+        self._flush_event = None
+        self._commit_lock = None
+        self._debounced = {}   # key -> (TimerHandle, queue item)
+        self.loop.call_soon_threadsafe(self._start_workers)
+        self.background.on_shutdown(self.close)
+
+    def _start_workers(self):
+        self.queue = asyncio.Queue()
+        self._flush_event = asyncio.Event()
+        self._commit_lock = asyncio.Lock()
+        self._tasks = [self.loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(self.loop.create_task(self._flusher()))
 
     async def _worker(self):
         while True:
-            func, args, kwargs = await self.queue.get()
+            func, args, kwargs, submitted, trace = await self.queue.get()
+            job = getattr(func, "__name__", "job")
+            record_span("writer.queue_wait", (time.perf_counter() - submitted) * 1000, trace=trace, job=job)
             try:
-                await asyncio.to_thread(func, *args, **kwargs)
+                # The job's spans belong to the request that submitted it
+                run = self._run_job(func, args, kwargs, job)
+                await (run_in_trace(trace, run) if trace is not None else run)
             except Exception as e:
                 logging.error(f"Firestore write failed: {e}")
             finally:
                 self.queue.task_done()
 
-    async def submit(self, func, *args, **kwargs):
-        await self.queue.put((func, args, kwargs))
+    @staticmethod
+    async def _run_job(func, args, kwargs, job: str):
+        with span("writer.job", job=job):
+            if asyncio.iscoroutinefunction(func):
+                await func(*args, **kwargs)
+            else:
+                await asyncio.to_thread(func, *args, **kwargs)
+
+    async def _flusher(self):
+        while True:
+            await self._flush_event.wait()
+            self._flush_event.clear()
+            await self.flush()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a job. Safe to call from any thread, returns immediately."""
+        self.loop.call_soon_threadsafe(
+            self._enqueue, (func, args, kwargs, time.perf_counter(), current_trace())
+        )
+
+    def _enqueue(self, item):
+        # Runs on the background loop, after _start_workers has created the queue
+        self.queue.put_nowait(item)
+
+    def submit_debounced(self, key, delay: float, func, *args, **kwargs):
+        """
+        Queue a job after delay seconds, replacing any job still waiting under the same key,
+        so a burst of submissions runs only the last one. Safe to call from any thread.
+        """
+        item = (func, args, kwargs, time.perf_counter(), current_trace())
+        if delay <= 0:
+            self.loop.call_soon_threadsafe(self._enqueue, item)
+        else:
+            self.loop.call_soon_threadsafe(self._schedule_debounced, key, delay, item)
+
+    def _schedule_debounced(self, key, delay: float, item):
+        previous = self._debounced.pop(key, None)
+        if previous is not None:
+            previous[0].cancel()
+        handle = self.loop.call_later(delay, self._release_debounced, key)
+        self._debounced[key] = (handle, item)
+
+    def _release_debounced(self, key):
+        _, item = self._debounced.pop(key)
+        self._enqueue(item)
+
+    def submit_writes(self, ops: List[WriteOp]):
+        """Buffer document writes for the next batch commit. Safe to call from any thread."""
+        if ops:
+            self.loop.call_soon_threadsafe(self._buffer_writes, list(ops), time.perf_counter())
+
+    def _buffer_writes(self, ops: List[WriteOp], submitted: float):
+        if not self._pending:
+            self._pending_since = submitted
+        self._pending.extend(ops)
+        if len(self._pending) >= self.batch_size:
+            self._flush_event.set()
+        elif self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.flush_interval, self._flush_event.set)
+
+    async def flush(self):
+        """Commit every buffered write now."""
+        async with self._commit_lock:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            ops, self._pending = self._pending, []
+            if not ops:
+                return
+            # How long the oldest write in this batch waited in the buffer
+            record_span("writer.queue_wait", (time.perf_counter() - self._pending_since) * 1000, writes=len(ops))
+            ops = coalesce_writes(ops)
+            with span("firestore.commit", writes=len(ops)):
+                # One chunk per Firestore batch, so a failed chunk never repeats writes already committed
+                for start in range(0, len(ops), MAX_BATCH_WRITES):
+                    await self._commit_chunk(ops[start:start + MAX_BATCH_WRITES])
+
+    async def _commit_chunk(self, ops: List[WriteOp]):
+        """Commit one batch, falling back to single writes when it keeps failing."""
+        try:
+            await self._commit_with_retry(ops)
+            return
+        except Exception as e:
+            if len(ops) == 1:
+                logging.error(f"Firestore write to {ops[0].ref.path} failed: {e}")
+                return
+            logging.warning(f"Firestore batch commit of {len(ops)} writes failed, committing them one by one: {e}")
+
+        failed = 0
+        for op in ops:
+            try:
+                await self._commit_with_retry([op])
+            except Exception as e:
+                failed += 1
+                logging.error(f"Firestore write to {op.ref.path} failed: {e}")
+        if failed:
+            logging.error(f"Dropped {failed} of {len(ops)} buffered Firestore writes")
+
+    async def _commit_with_retry(self, ops: List[WriteOp]):
+        """Commit ops, retrying transient errors with jittered exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.async_db is not None:
+                    await commit_writes_async(self.async_db, ops)
+                else:
+                    await asyncio.to_thread(commit_writes, self.db, ops)
+                return
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+                logging.warning(f"Firestore commit attempt {attempt + 1} failed, retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def drain(self):
+        """Wait until every queued job has run and every buffered write is committed."""
+        if self.queue is not None:
+            # Debounced jobs still waiting run now
+            for key, (handle, _) in list(self._debounced.items()):
+                handle.cancel()
+                self._release_debounced(key)
+            await self.queue.join()
+            await self.flush()
+
+    async def close(self):
+        """Drain pending work and stop the workers."""
+        await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
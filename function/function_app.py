@@ -2,12 +2,15 @@ import azure.functions as func
 import logging
 import json
 from datetime import datetime, timezone
-import asyncio
-from daily import run_daily_task_for_user,send_notification
+from azurefunctions.extensions.http.fastapi import Request, Response, StreamingResponse, JSONResponse
+from typing import List
+from daily import run_daily_task_for_user,send_notification,send_notifications,notification_cohort,get_daily_task_runner,daily_task_messages,parse_daily_task_message
+from tracing import Trace
+from config import Config
 
 from managers.firebase_manager import FirebaseManager
 
-from main import android_chat
+from main import android_chat, android_chat_stream
 
 
 app = func.FunctionApp()
@@ -19,6 +22,15 @@ CORS_HEADERS = {
     "Access-Control-Allow-Headers": "Content-Type, Authorization, Accept",
 }
 
+# Per-request stage timings in the chat responses (Server-Timing header / done event)
+DEBUG_TIMINGS = Config().debug_timings
+
+# Storage queue of the daily fan-out, one message per user (Azurite locally)
+DAILY_TASK_QUEUE = "daily-tasks"
+
+# Largest cohort inactivity window the notifications endpoint accepts (ten years)
+MAX_INACTIVE_HOURS = 24 * 365 * 10
+
 
 @app.route(route="health", methods=["GET"])
 def health(req: func.HttpRequest) -> func.HttpResponse:
@@ -84,7 +96,8 @@ def chat_handler(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=400, mimetype="application/json", headers=CORS_HEADERS
             )
         
-        chat_response = android_chat(user_prompt=message, user_email=email)
+        trace = Trace() if DEBUG_TIMINGS else None
+        chat_response = android_chat(user_prompt=message, user_email=email, trace=trace)
 
 
         response_data = {
@@ -92,11 +105,20 @@ def chat_handler(req: func.HttpRequest) -> func.HttpResponse:
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
 
+        headers = CORS_HEADERS
+        if trace:
+            headers = {
+                **CORS_HEADERS,
+                "Server-Timing": trace.server_timing(),
+                "X-Trace-Id": trace.trace_id,
+                "Access-Control-Expose-Headers": "Server-Timing, X-Trace-Id"
+            }
+
         return func.HttpResponse(
             json.dumps(response_data),
             mimetype="application/json",
             status_code=200,
-            headers=CORS_HEADERS
+            headers=headers
         )
 
     except Exception as e:
@@ -108,6 +130,61 @@ def chat_handler(req: func.HttpRequest) -> func.HttpResponse:
         
         
         
+@app.route(route="chat_stream", auth_level=func.AuthLevel.FUNCTION)
+async def chat_stream_handler(req: Request) -> StreamingResponse:
+    """
+    Streaming variant of the chat endpoint.
+    Sends the reply as server-sent events while Gemini generates it, then a final event with the full message.
+    Needs the PYTHON_ENABLE_INIT_INDEXING=1 app setting (see README, Deployment).
+    """
+    logging.info('Chat stream handler function processed a request.')
+
+    if req.method == "OPTIONS":
+        return Response(status_code=204, headers=CORS_HEADERS)
+
+    try:
+        req_body = await req.json()
+        email = req_body.get('email')
+        message = req_body.get('message')
+    except ValueError:
+        return JSONResponse(
+            {"error": "Invalid JSON format."},
+            status_code=400, headers=CORS_HEADERS
+        )
+
+    if not email or not message:
+        return JSONResponse(
+            {"error": "Please provide 'email' and 'message'."},
+            status_code=400, headers=CORS_HEADERS
+        )
+
+    async def event_stream():
+        chunks = []
+        trace = Trace() if DEBUG_TIMINGS else None
+        try:
+            async for chunk in android_chat_stream(user_prompt=message, user_email=email, trace=trace):
+                chunks.append(chunk)
+                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+
+            response_data = {
+                "message": "".join(chunks),
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+            if trace:
+                response_data["timings"] = trace.timings()
+            yield f"event: done\ndata: {json.dumps(response_data)}\n\n"
+
+        except Exception as e:
+            logging.error(f"An error occurred in chat_stream_handler: {e}", exc_info=True)
+            yield f"event: error\ndata: {json.dumps({'error': 'An internal server error occurred.'})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={**CORS_HEADERS, "Cache-Control": "no-cache"}
+    )
+
+
 @app.route(route="notification", auth_level=func.AuthLevel.FUNCTION)
 def notification_handler(req: func.HttpRequest) -> func.HttpResponse:
     
@@ -155,30 +232,154 @@ def notification_handler(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500, mimetype="application/json", headers=CORS_HEADERS
         )
 
+@app.route(route="notifications", auth_level=func.AuthLevel.FUNCTION)
+def notifications_handler(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Generates notifications for many users in one call. The body holds either
+    'emails' (a list), 'email' (a single user) or 'cohort' ({"inactive_hours": N},
+    or {} for every user). Responds with a result per email.
+
+    A cohort is served in pages of at most notification_max_batch users. When more
+    remain, the response carries 'next_start_after'; sending it back as
+    cohort.start_after returns the next page.
+    """
+    logging.info('Bulk notification HTTP handler received a request.')
+
+    if req.method == "OPTIONS":
+        return func.HttpResponse("", status_code=204, headers=CORS_HEADERS)
+
+    try:
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            logging.error("Invalid JSON format.")
+            return func.HttpResponse(
+                json.dumps({"error": "Invalid JSON format."}),
+                status_code=400, mimetype="application/json", headers=CORS_HEADERS
+            )
+
+        if not isinstance(req_body, dict):
+            return func.HttpResponse(
+                json.dumps({"error": "The request body must be a JSON object."}),
+                status_code=400, mimetype="application/json", headers=CORS_HEADERS
+            )
+
+        emails = req_body.get('emails')
+        if emails is None and req_body.get('email'):
+            emails = [req_body.get('email')]
+        cohort = req_body.get('cohort')
+
+        if emails is None and not isinstance(cohort, dict):
+            return func.HttpResponse(
+                json.dumps({"error": "Please provide 'emails', 'email' or a 'cohort' in the request body."}),
+                status_code=400, mimetype="application/json", headers=CORS_HEADERS
+            )
+        if emails is not None and (not isinstance(emails, list) or not all(isinstance(e, str) and e for e in emails)):
+            return func.HttpResponse(
+                json.dumps({"error": "'emails' must be a list of email strings."}),
+                status_code=400, mimetype="application/json", headers=CORS_HEADERS
+            )
+        max_batch = get_daily_task_runner().config.notification_max_batch
+        if emails is not None and len(emails) > max_batch:
+            return func.HttpResponse(
+                json.dumps({"error": f"At most {max_batch} emails per request."}),
+                status_code=400, mimetype="application/json", headers=CORS_HEADERS
+            )
+
+        next_start_after = None
+        if emails is None:
+            inactive_hours = cohort.get('inactive_hours')
+            if inactive_hours is not None and (
+                isinstance(inactive_hours, bool) or not isinstance(inactive_hours, (int, float))
+                or not 0 <= inactive_hours <= MAX_INACTIVE_HOURS
+            ):
+                return func.HttpResponse(
+                    json.dumps({"error": f"'cohort.inactive_hours' must be a number from 0 to {MAX_INACTIVE_HOURS}."}),
+                    status_code=400, mimetype="application/json", headers=CORS_HEADERS
+                )
+            start_after = cohort.get('start_after')
+            if start_after is not None and not (isinstance(start_after, str) and start_after):
+                return func.HttpResponse(
+                    json.dumps({"error": "'cohort.start_after' must be an email string."}),
+                    status_code=400, mimetype="application/json", headers=CORS_HEADERS
+                )
+            try:
+                # One extra user tells whether another page follows
+                emails = notification_cohort(inactive_hours, max_batch + 1, start_after)
+            except ValueError as e:
+                return func.HttpResponse(
+                    json.dumps({"error": str(e)}),
+                    status_code=400, mimetype="application/json", headers=CORS_HEADERS
+                )
+            if len(emails) > max_batch:
+                emails = emails[:max_batch]
+                next_start_after = emails[-1]
+
+        results = send_notifications(emails)
+
+        response_data = {
+            "results": results,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+        if next_start_after is not None:
+            response_data["next_start_after"] = next_start_after
+
+        return func.HttpResponse(
+            json.dumps(response_data),
+            mimetype="application/json",
+            status_code=200,
+            headers=CORS_HEADERS
+        )
+
+    except Exception as e:
+        logging.error(f"An error occurred in notifications_handler: {e}", exc_info=True)
+        return func.HttpResponse(
+            json.dumps({"error": "An internal server error occurred."}),
+            status_code=500, mimetype="application/json", headers=CORS_HEADERS
+        )
+
 @app.function_name(name="DailyTaskTimer")
-@app.timer_trigger(schedule="0 0 */24 * * *",  
+@app.timer_trigger(schedule="0 0 * * * *",  
                    arg_name="timer",
                    run_on_startup=False)
-def daily_task_timer(timer: func.TimerRequest) -> None:
+@app.queue_output(arg_name="tasks",
+                  queue_name=DAILY_TASK_QUEUE,
+                  connection="AzureWebJobsStorage")
+def daily_task_timer(timer: func.TimerRequest, tasks: func.Out[List[str]]) -> None:
     
     if timer.past_due:
         logging.info('The timer is past due!')
     logging.info('Daily Task Timer function is executing.')
 
     try:
-        firebase_manager = FirebaseManager()
-        all_user_emails = firebase_manager.get_all_user_emails()
-        
-        
-        if not all_user_emails:
-            logging.info("No users found in the database. Timer task finished.")
+        # Hourly: only users whose local day just ended and who chatted during it.
+        # DailyTaskWorker does the work
+        messages = daily_task_messages()
+        if not messages:
+            logging.info("No users due this hour. Timer task finished.")
             return
-        
-        for email in all_user_emails:
-            try:
-                run_daily_task_for_user(email)
-                logging.info(f"Daily task completed for {email}")
-            except Exception as e:
-                logging.error(f"Error processing daily task for {email}: {e}", exc_info=True)
+        tasks.set(messages)
+        logging.info(f"Queued daily tasks for {len(messages)} users.")
     except Exception as e:
-        logging.error(f"The timer trigger failed with an exception: {e}", exc_info=True)
\ No newline at end of file
+        logging.error(f"The timer trigger failed with an exception: {e}", exc_info=True)
+
+
+@app.function_name(name="DailyTaskWorker")
+@app.queue_trigger(arg_name="msg",
+                   queue_name=DAILY_TASK_QUEUE,
+                   connection="AzureWebJobsStorage")
+def daily_task_worker(msg: func.QueueMessage) -> None:
+    """
+    Runs the daily task for one queued user. Failures are raised so the message is retried,
+    and moved to the daily-tasks-poison queue after maxDequeueCount attempts (host.json).
+    """
+    body = msg.get_body().decode("utf-8")
+    logging.info(f"Daily task worker received message {msg.id} (attempt {msg.dequeue_count}).")
+    try:
+        email, last_message_time, summary_date, timezone_name = parse_daily_task_message(body)
+    except ValueError as e:
+        # Malformed messages would fail the same way on every retry
+        logging.error(f"Dropping malformed daily task message {msg.id}: {e}")
+        return
+
+    run_daily_task_for_user(email, last_message_time, summary_date, raise_errors=True, timezone_name=timezone_name)
\ No newline at end of file
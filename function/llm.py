@@ -0,0 +1,78 @@
+"""
+LLM Client Registry
+Shares one ChatGoogleGenerativeAI client per (model, temperature, max_tokens) across the process
+"""
+
+import threading
+from typing import Callable, Optional
+from langchain_google_genai import ChatGoogleGenerativeAI
+from tracing import LLMTracingHandler
+
+
+# Per-purpose generation settings. None means "use the Config value" for temperature
+# and "model default" for max_tokens. priority orders calls in the LLM scheduler
+# (lower runs first); calls at BACKGROUND_PRIORITY get only part of the quota.
+BACKGROUND_PRIORITY = 2
+
+LLM_PURPOSES = {
+    "crisis":       {"temperature": 0.7,  "max_tokens": None,     "priority": 0},
+    "chat":         {"temperature": None, "max_tokens": "config", "priority": 1},
+    "analysis":     {"temperature": 0.3,  "max_tokens": None,     "priority": 1},
+    "suggestions":  {"temperature": None, "max_tokens": "config", "priority": BACKGROUND_PRIORITY},
+    "events":       {"temperature": 0.3,  "max_tokens": None,     "priority": BACKGROUND_PRIORITY},
+    "summary":      {"temperature": 0.5,  "max_tokens": None,     "priority": BACKGROUND_PRIORITY},
+    "notification": {"temperature": 0.8,  "max_tokens": None,     "priority": BACKGROUND_PRIORITY},
+}
+
+
+# Records a span with token counts for every call made through a registry client
+_tracing_handler = LLMTracingHandler()
+
+
+def _default_factory(model: str, api_key: str, temperature: float, max_tokens: Optional[int]):
+    kwargs = {
+        "model": model,
+        "google_api_key": api_key,
+        "temperature": temperature,
+        "callbacks": [_tracing_handler]
+    }
+    if max_tokens is not None:
+        kwargs["max_tokens"] = max_tokens
+    return ChatGoogleGenerativeAI(**kwargs)
+
+
+class LLMRegistry:
+    """Thread-safe registry that builds each distinct LLM client once and reuses it."""
+
+    def __init__(self, factory: Callable = _default_factory):
+        self.factory = factory
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str, api_key: str, temperature: float, max_tokens: Optional[int] = None):
+        key = (model, temperature, max_tokens)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self.factory(model, api_key, temperature, max_tokens)
+                    self._clients[key] = client
+        return client
+
+    def set_factory(self, factory: Callable):
+        """Replace how clients are built (e.g. with a fake LLM in tests) and drop cached clients."""
+        with self._lock:
+            self.factory = factory
+            self._clients.clear()
+
+
+registry = LLMRegistry()
+
+
+def get_llm(config, purpose: str):
+    """Return the shared LLM client configured for the given purpose (see LLM_PURPOSES)."""
+    settings = LLM_PURPOSES[purpose]
+    temperature = settings["temperature"] if settings["temperature"] is not None else config.temperature
+    max_tokens = config.max_tokens if settings["max_tokens"] == "config" else settings["max_tokens"]
+    return registry.get(config.model_name, config.gemini_api_key, temperature, max_tokens)
@@ -3,13 +3,26 @@ import os
 sys.path.append(os.getcwd())
 
 from chatbot import MentalHealthChatbot
+from background import get_background_loop
+from tracing import stream_in_trace
 
 chatbot = MentalHealthChatbot()
 
-def android_chat(user_prompt, user_email):
+def android_chat(user_prompt, user_email, trace=None):
     """Simplified Android chat function using unified chatbot processor."""
     try:
-        return chatbot.process_conversation(user_email, user_prompt)
+        return chatbot.process_conversation(user_email, user_prompt, trace)
         
     except Exception as e:
-        return f"Sorry, I'm having technical difficulties. Please try again later. Error: {e}"
\ No newline at end of file
+        return f"Sorry, I'm having technical difficulties. Please try again later. Error: {e}"
+
+
+async def android_chat_stream(user_prompt, user_email, trace=None):
+    """Streaming variant of android_chat, yields the reply in chunks as they are generated."""
+    try:
+        turn = stream_in_trace(trace, chatbot.stream_conversation_async(user_email, user_prompt))
+        async for chunk in get_background_loop().stream(turn):
+            yield chunk
+
+    except Exception as e:
+        yield f"Sorry, I'm having technical difficulties. Please try again later. Error: {e}"
@@ -0,0 +1,248 @@
+"""
+Turn Analysis Module
+Runs emotion detection, topic filtering and event extraction as a single LLM call
+"""
+
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from llm import get_llm
+from ratelimit import get_llm_scheduler
+from background import get_background_loop
+from langchain_core.messages import SystemMessage, HumanMessage
+from data import Event, TemporalCue, TurnAnalysis, MentalHealthTopicFilter
+from temporal import TemporalParser
+
+
+class AnalysisManager:
+    """Analyzes a user turn for emotion, urgency, topic relevance and events in one call."""
+
+    def __init__(self, config):
+        """Initialize the AnalysisManager with a low temperature LLM for classification."""
+        self.llm = get_llm(config, "analysis")
+        self.scheduler = get_llm_scheduler()
+        self.temporal_gate = config.temporal_gate
+        self.temporal_parser = TemporalParser()
+
+    def local_event(self, message: str, email: str = "") -> Tuple[bool, Optional[Event]]:
+        """
+        Decide the event part of a turn locally where possible.
+
+        Returns:
+            Tuple of (needs_llm, event). Without a time reference no event can be dated, so
+            the LLM is not needed and event is None. A plainly dated event is built here.
+        """
+        if not self.temporal_gate:
+            return True, None
+        cue: Optional[TemporalCue] = self.temporal_parser.parse(message, datetime.now().date())
+        if cue is None:
+            return False, None
+        if cue.date and cue.event_type:
+            return False, build_event(message, email, cue.event_type, cue.date)
+        return True, None
+
+    def analyze(self, message: str, last_messages: Optional[List[str]] = None, email: str = "",
+                known_topic: Optional[MentalHealthTopicFilter] = None, strict: bool = False) -> TurnAnalysis:
+        """Blocking analyze_async for synchronous callers."""
+        return get_background_loop().run(self.analyze_async(message, last_messages, email, known_topic, strict))
+
+    async def analyze_async(self, message: str, last_messages: Optional[List[str]] = None, email: str = "",
+                            known_topic: Optional[MentalHealthTopicFilter] = None,
+                            strict: bool = False) -> TurnAnalysis:
+        """
+        Analyze the current user message together with the previous user messages.
+
+        Args:
+            message: The current user message
+            last_messages: Up to the last 2-3 previous user messages, oldest first
+            email: User's email, used to build a stable event id
+            known_topic: Topic decision made elsewhere (e.g. the local pre-classifier).
+                When given, the topic part is left out of the prompt and this result is used.
+            strict: Raise when the LLM call fails instead of returning a neutral default analysis.
+                An unparseable response still returns the default.
+
+        Returns:
+            TurnAnalysis with emotion, urgency, topic relevance and an optional Event.
+            The event part is only sent to the LLM when local_event cannot settle it.
+        """
+        today = datetime.now()
+        tomorrow = today + timedelta(days=1)
+        yesterday = today - timedelta(days=1)
+        next_week = today + timedelta(days=7)
+        event_needs_llm, event = self.local_event(message, email)
+
+        if known_topic is None:
+            topic_section = """        3. TOPIC: Whether the CURRENT message is mental-health related. It is related IF:
+           - It directly discusses emotions, stress, anxiety, depression, relationships,
+             pressure, self-care, healing, personal struggles, or psychological well-being.
+           OR
+           - It connects to the previous messages that were mental-health related,
+             even if the current message alone is unclear."""
+            topic_fields = """
+            "mental_health": true/false,
+            "topic_confidence": 0.1-1.0,
+            "topic_reason": "short explanation","""
+        else:
+            topic_section = "        3. TOPIC: Already known, do not analyze."
+            topic_fields = ""
+
+        if event_needs_llm:
+            event_section = f"""        4. EVENT: Whether an important upcoming or recent event is mentioned (exam, interview, appointment, date, presentation, meeting, deadline, party, etc.)
+           - Only significant events a caring friend would follow up about
+           - Only with clear timing indicators (today, tomorrow, next week, yesterday, etc.)
+           - Only specific events, not general activities
+
+        TODAY'S DATE: {today.strftime('%Y-%m-%d')} ({today.strftime('%A')})
+
+        For event_date calculation, use today's date as {today.strftime('%Y-%m-%d')} and calculate:
+        - "today" → {today.strftime('%Y-%m-%d')}
+        - "tomorrow" → {tomorrow.strftime('%Y-%m-%d')}
+        - "yesterday" → {yesterday.strftime('%Y-%m-%d')}
+        - "next week" → {next_week.strftime('%Y-%m-%d')} (7 days from today)
+        - "this weekend" → calculate Saturday/Sunday of this week
+        - "next Monday/Tuesday/etc" → calculate the next occurrence of that day
+        - Specific dates mentioned in the message should be converted to YYYY-MM-DD format"""
+            event_fields = """
+            "has_event": true/false,
+            "event_type": "exam" or "interview" or "appointment" or "date" or "presentation" or "meeting" or "deadline" or "party" or "other",
+            "event_date": "YYYY-MM-DD",
+            "event_confidence": 0.0-1.0"""
+            event_rule = """
+
+        Only return has_event: true if you're confident (>0.7) there's a real important event with timing."""
+        else:
+            event_section = "        4. EVENT: Not needed, do not analyze."
+            event_fields = ""
+            event_rule = ""
+
+        system_prompt = f"""You are the analysis stage of a mental health chatbot named Sorea. For the CURRENT user message you must determine, in one pass:
+
+        1. EMOTION: The main emotion expressed (happy, sad, anxious, angry, excited, frustrated, depressed, hopeful, etc.)
+        2. URGENCY: Rate from 1-5 based on how urgent the situation seems:
+           1 = Casual/Positive: Good news, casual chat, mild stress, normal life updates
+           2 = Mild Concern: Minor worries, everyday stress, slight sadness, general life issues
+           3 = Moderate Distress: Significant stress, relationship problems, work/school issues, moderate anxiety/depression
+           4 = High Distress: Severe anxiety, major life crisis, intense emotional pain, thoughts of self-harm (non-suicidal)
+           5 = CRISIS: Suicidal thoughts, immediate danger, severe depression with self-harm ideation, emergency situation
+           - Most messages should be level 1-3. Only use 4-5 for genuinely serious situations
+           - Don't over-dramatize normal stress or sadness
+           - Look for keywords like "kill myself", "end it all", "can't go on" for level 5
+           - Consider context: "I'm so tired" could be level 1 (normal) or level 3 (depression symptom)
+{topic_section}
+{event_section}
+
+        Return your analysis in this EXACT JSON format:
+        {{
+            "emotion": "single word emotion",
+            "urgency": 1-5,{topic_fields}{event_fields}
+        }}{event_rule}"""
+
+        previous_text = "\n".join(
+            [f"Message {i+1}: {msg}" for i, msg in enumerate(last_messages or [])]
+        )
+
+        response = None
+        try:
+            messages = [
+                SystemMessage(content=system_prompt),
+                HumanMessage(
+                    content=(
+                        f"Previous user messages:\n{previous_text if previous_text else 'None'}\n\n"
+                        f"CURRENT message:\n\"{message}\"\n\n"
+                        "Analyze the CURRENT message. Return as JSON."
+                    )
+                )
+            ]
+
+            response = await self.scheduler.ainvoke(self.llm, messages, "analysis")
+            response_text = response.content.strip()
+
+            if '{' not in response_text or '}' not in response_text:
+                raise ValueError("No JSON found in response")
+
+            start = response_text.find('{')
+            end = response_text.rfind('}') + 1
+            analysis_data = json.loads(response_text[start:end])
+
+            if known_topic is not None:
+                analysis_data.update({
+                    'mental_health': known_topic.is_mental_health_related,
+                    'topic_confidence': known_topic.confidence_score,
+                    'topic_reason': known_topic.reason
+                })
+            analysis = self._parse_analysis(analysis_data, message, email)
+            if not event_needs_llm:
+                analysis.event = event
+            return analysis
+
+        except Exception as e:
+            logging.error(f"Error analyzing turn: {e}")
+            if strict and response is None:
+                raise
+            analysis = self.default_analysis(known_topic)
+            analysis.event = event
+            return analysis
+
+    @staticmethod
+    def default_analysis(known_topic: Optional[MentalHealthTopicFilter] = None) -> TurnAnalysis:
+        """Neutral analysis used when the LLM call is unavailable."""
+        if known_topic is not None:
+            return TurnAnalysis(**known_topic.model_dump())
+        return TurnAnalysis(reason="Analysis unavailable.")
+
+    def _parse_analysis(self, analysis_data: dict, message: str, email: str) -> TurnAnalysis:
+        """Convert the raw JSON analysis into a TurnAnalysis, clamping out-of-range values."""
+        emotion = str(analysis_data.get('emotion') or 'neutral').strip().lower()
+
+        try:
+            urgency_level = max(1, min(5, int(analysis_data.get('urgency', 1))))
+        except (TypeError, ValueError):
+            urgency_level = 1
+
+        try:
+            confidence = max(0.1, min(1.0, float(analysis_data.get('topic_confidence', 0.1))))
+        except (TypeError, ValueError):
+            confidence = 0.1
+
+        event = None
+        try:
+            event_confidence = float(analysis_data.get('event_confidence', 0.0))
+        except (TypeError, ValueError):
+            event_confidence = 0.0
+        if analysis_data.get('has_event') and event_confidence >= 0.7 and analysis_data.get('event_date'):
+            event = build_event(
+                message,
+                email,
+                analysis_data.get('event_type') or 'event',
+                analysis_data.get('event_date')
+            )
+
+        return TurnAnalysis(
+            emotion=emotion,
+            urgency_level=urgency_level,
+            is_mental_health_related=bool(analysis_data.get('mental_health')),
+            confidence_score=confidence,
+            reason=analysis_data.get('topic_reason') or "LLM did not provide a reason.",
+            event=event
+        )
+
+
+def build_event(message: str, email: str, event_type: str, event_date: str) -> Event:
+    """Build an Event with a stable id derived from type, user, date and message."""
+    base_components = [
+        event_type.lower().replace(' ', '_'),
+        email.split('@')[0],
+        event_date
+    ]
+    description_hash = hashlib.md5(message.encode()).hexdigest()[:6]
+    event_id = f"{base_components[0]}_{base_components[1]}_{base_components[2]}_{description_hash}"
+
+    return Event(
+        eventid=event_id,
+        eventType=event_type,
+        description=message,
+        eventDate=event_date,
+        isCompleted=False
+    )
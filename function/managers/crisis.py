@@ -4,30 +4,15 @@ Handles crisis intervention and error handling for the mental health chatbot
 """
 
 import json
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm import get_llm
 from langchain_core.messages import SystemMessage, HumanMessage
 from data import LLMMessage
+from ratelimit import get_llm_scheduler
+from background import get_background_loop
 
 
-
-class CrisisManager:
-    """Manages crisis intervention and error handling responses."""
-    
-    def __init__(self,config):
-        """Initialize the CrisisManager with LLM for response generation."""
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.model_name,
-            google_api_key=config.gemini_api_key,
-            temperature=0.7 
-        )
-    
-    def handle_crisis_situation(self, user_email: str, message: str,firebase_manager) -> LLMMessage:
-        """Handle crisis situations with immediate support and resources using LLM."""
-        user_profile = firebase_manager.get_user_profile(user_email)
-        name = user_profile.name 
-        
-        # Generate complete crisis response using single LLM call
-        system_prompt = f"""You are Sorea, a caring friend responding to someone in severe emotional crisis. Generate a complete crisis intervention response with all components.
+# Static part of the crisis prompt, cached as a prompt prefix
+CRISIS_PROMPT = """You are Sorea, a caring friend responding to someone in severe emotional crisis. Generate a complete crisis intervention response with all components.
 
         CRISIS RESPONSE REQUIREMENTS:
         1. IMMEDIATELY show deep concern and love for them
@@ -49,13 +34,9 @@ class CrisisManager:
         - Challenge negative thoughts with love and reality
         - Make it personal - this is about THEM specifically
 
-        USER CONTEXT:
-        - Name: {name}
-        - Crisis message: "{message}"
-
         RESPONSE FORMAT:
         Return your response as a JSON object with this EXACT structure:
-        {{
+        {
             "crisis_response": "The main crisis intervention message (include all crisis resources)",
             "suggestions": [
                 "Immediate actionable suggestion 1",
@@ -65,7 +46,7 @@ class CrisisManager:
                 "Caring urgent question about safety?",
                 "Personal question encouraging immediate action?"
             ]
-        }}
+        }
 
         SUGGESTIONS should be:
         - IMMEDIATE safety-focused actions they can take right now
@@ -83,13 +64,38 @@ class CrisisManager:
 
         Generate a powerful, loving response that could save their life."""
 
+
+class CrisisManager:
+    """Manages crisis intervention and error handling responses."""
+    
+    def __init__(self,config):
+        """Initialize the CrisisManager with LLM for response generation."""
+        self.llm = get_llm(config, "crisis")
+        self.scheduler = get_llm_scheduler()
+    
+    def handle_crisis_situation(self, user_email: str, message: str,firebase_manager) -> LLMMessage:
+        """Blocking handle_crisis_situation_async for synchronous callers."""
+        return get_background_loop().run(self.handle_crisis_situation_async(user_email, message, firebase_manager))
+
+    async def handle_crisis_situation_async(self, user_email: str, message: str, firebase_manager) -> LLMMessage:
+        """Handle crisis situations with immediate support and resources using LLM."""
+        user_profile = await firebase_manager.get_user_profile_async(user_email)
+        name = user_profile.name 
+        
+        # Generate complete crisis response using single LLM call
+        system_prompt = f"""{CRISIS_PROMPT}
+
+        USER CONTEXT:
+        - Name: {name}
+        - Crisis message: "{message}\""""
+
         try:
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=f"Generate a complete crisis intervention response for {name} who said: '{message}'. Return as JSON.")
             ]
             
-            response = self.llm.invoke(messages)
+            response = await self.scheduler.ainvoke(self.llm, messages, "crisis")
             response_text = response.content.strip()
         
             try:
@@ -117,9 +123,23 @@ class CrisisManager:
                 raise Exception(f"JSON parsing failed: {json_error}")
             
         except Exception as e:
-            fallback_name = name if 'name' in locals() else "friend"
-            fallback_message = (
-                f"What's really on your heart right now, {fallback_name}? "
-                "How can I best support you today?"
-            )
-            return LLMMessage(content=fallback_message)
+            return self.fallback_response(name)
+
+    @staticmethod
+    def fallback_response(name: str = None) -> LLMMessage:
+        """Static crisis response with the essential resources, used when the LLM is unavailable."""
+        fallback_name = name or "friend"
+        fallback_message = (
+            f"{fallback_name}, I'm really worried about you and I'm so glad you told me. "
+            "You matter, and you don't have to go through this alone. Please reach out right now:\n"
+            "- Call 988 (Suicide & Crisis Lifeline) - Available 24/7\n"
+            "- Text HOME to 741741 (Crisis Text Line)\n"
+            "- Call 911 if in immediate danger\n"
+            "- Go to nearest emergency room\n"
+            "Is there someone you trust who can be with you right now?"
+        )
+        return LLMMessage(
+            content=fallback_message,
+            suggestions=["Call or text 988 right now", "Ask someone you trust to stay with you"],
+            follow_up_questions=[f"Are you safe right now, {fallback_name}?"]
+        )
@@ -3,28 +3,44 @@ Event Management Module
 Handles detection, storage, and follow-up of important events in conversations
 """
 
-import json
-from datetime import date, timedelta, datetime
+from datetime import date, datetime
 from typing import Optional, List
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm import get_llm
 from langchain_core.messages import SystemMessage, HumanMessage
 from data import Event
-import hashlib
-from datetime import datetime
+from managers.analysis import AnalysisManager
+from firebase_writer import WriteOp, commit_writes, commit_writes_async
+from ratelimit import get_llm_scheduler
+from tracing import traced
+import asyncio
 import logging
 
 
+# Static part of the event greeting prompt, cached as a prompt prefix
+GREETING_PROMPT = """You are Sorea, a caring friend who remembers important events in people's lives. Generate a warm, personalized greeting that asks about multiple important events.
+
+        GUIDELINES:
+        - Be genuinely caring and show you remember all the events
+        - Use natural, friendly language like you're texting a close friend
+        - Show appropriate emotion (excitement, concern, encouragement) for the event types
+        - Keep it conversational and warm, not formal
+        - Reference the timing naturally based on the date comparisons
+        - Make it feel personal and thoughtful
+        - If there are multiple events, weave them together naturally or focus on the most relevant one
+
+        Generate ONE natural, caring greeting message that shows you remember and care about their events."""
+
+
 class EventManager:
     """Manages event detection, storage, and proactive follow-ups."""
     
-    def __init__(self,config,firebase_manager):
-        """Initialize the EventManager with LLM for event detection."""
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.model_name,
-            google_api_key=config.gemini_api_key,
-            temperature=0.3 
-        )
+    def __init__(self,config,firebase_manager,analysis_manager: AnalysisManager = None):
+        """Initialize the EventManager with LLM for event greetings and turn analysis for detection."""
+        self.llm = get_llm(config, "events")
+        self.scheduler = get_llm_scheduler()
+        self.analysis_manager = analysis_manager or AnalysisManager(config)
         self.db = firebase_manager.db 
+        self.async_db = getattr(firebase_manager, "async_db", None)
     
     def add_event(self, email: str, event: Event):
         """Add an event to Firestore using subcollection."""
@@ -32,13 +48,31 @@ class EventManager:
             return
         
         try:
-            event_data = event.model_dump()
-            doc_ref = self.db.collection('users').document(email).collection('events').document(event.eventid)
-            doc_ref.set(event_data)
+            commit_writes(self.db, self.event_writes(email, event))
             
         except Exception as e:
             logging.error(f"Error adding event: {e}")
+
+    async def add_event_async(self, email: str, event: Event):
+        """Async add_event, committed on the AsyncClient."""
+        if self.async_db is None:
+            return await asyncio.to_thread(self.add_event, email, event)
+
+        try:
+            await commit_writes_async(self.async_db, self.event_writes(email, event))
+
+        except Exception as e:
+            logging.error(f"Error adding event: {e}")
+
+    def event_writes(self, email: str, event: Event) -> List[WriteOp]:
+        """Build the Firestore write for an event so it can be committed in a batch."""
+        if not self.db:
+            return []
+
+        doc_ref = self.db.collection('users').document(email).collection('events').document(event.eventid)
+        return [WriteOp(doc_ref, event.model_dump(), merge=False)]
     
+    @traced("firestore.get_events")
     def get_events(self, email: str) -> List[Event]:
         """Get all events for user."""
         if not self.db:
@@ -73,88 +107,11 @@ class EventManager:
         return []
 
     def _extract_events_with_llm(self, message: str, email: str) -> Optional[Event]:
-        """Use LLM to extract events and timing from user messages."""
-        today = datetime.now()
-        tomorrow = today + timedelta(days=1)
-        yesterday = today - timedelta(days=1)
-        next_week = today + timedelta(days=7)
-        
-        system_prompt = f"""You are an expert at detecting important upcoming events or recent events that someone might want follow-up on. Analyze the user's message and determine:
-
-        1. If there's an important event mentioned (exam, interview, appointment, date, presentation, meeting, deadline, party, etc.)
-        2. The type of event (be specific but use common categories)
-        3. The timing context (when it's happening or happened)
-
-        IMPORTANT: Only detect events that are:
-        - Significant enough that a caring friend would follow up about
-        - Have clear timing indicators (today, tomorrow, next week, yesterday, etc.)
-        - Are specific events, not general activities
-
-        TODAY'S DATE: {today.strftime('%Y-%m-%d')} ({today.strftime('%A')})
-
-        Return your analysis in this EXACT JSON format:
-        {{
-            "has_event": true/false,
-            "event_type": "exam" or "interview" or "appointment" or "date" or "presentation" or "meeting" or "deadline" or "party" or "other",
-            "event_date": "YYYY-MM-DD" (calculate the actual date based on timing context),
-            "confidence": 0.0-1.0
-        }}
-
-        Only return has_event: true if you're confident (>0.7) there's a real important event with timing.
-        
-        For event_date calculation, use today's date as {today.strftime('%Y-%m-%d')} and calculate:
-        - "today" → {today.strftime('%Y-%m-%d')}
-        - "tomorrow" → {tomorrow.strftime('%Y-%m-%d')}
-        - "yesterday" → {yesterday.strftime('%Y-%m-%d')}
-        - "next week" → {next_week.strftime('%Y-%m-%d')} (7 days from today)
-        - "this weekend" → calculate Saturday/Sunday of this week
-        - "next Monday/Tuesday/etc" → calculate the next occurrence of that day
-        - Specific dates mentioned in the message should be converted to YYYY-MM-DD format"""
-
-        try:
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=f"Analyze this message for important events: '{message}'")
-            ]
-            
-            response = self.llm.invoke(messages)
-            response_text = response.content.strip()
-            
-            try:
-                if '{' in response_text and '}' in response_text:
-                    start = response_text.find('{')
-                    end = response_text.rfind('}') + 1
-                    json_str = response_text[start:end]
-                    event_data = json.loads(json_str)
-                    
-                    if isinstance(event_data, dict) and 'has_event' in event_data:
-                        confidence = event_data.get('confidence', 0.0)
-                        if event_data.get('has_event') and confidence >= 0.7:
-                            event_date_str = event_data.get('event_date') 
-                            event_type = event_data.get('event_type', 'event')
-                            base_components = [
-                                event_type.lower().replace(' ', '_'),
-                                email.split('@')[0],  
-                                event_date_str
-                            ]
-                            description_hash = hashlib.md5(message.encode()).hexdigest()[:6]
-                            event_id = f"{base_components[0]}_{base_components[1]}_{base_components[2]}_{description_hash}"
-                    
-                            return Event(
-                                eventid=event_id,
-                                eventType=event_type,
-                                description=message,
-                                eventDate=event_date_str,
-                                isCompleted=False
-                            )
-                        
-            except json.JSONDecodeError:
-                pass
-                
-            return None
-            
-        except Exception as e:
-            return None
+        """Extract events and timing from user messages, using the LLM only when a time reference needs it."""
+        needs_llm, event = self.analysis_manager.local_event(message, email)
+        if not needs_llm:
+            return event
+        return self.analysis_manager.analyze(message, email=email).event
 
     def _generate_event_greeting(self, events: List[Event], email: str,firebase_manager) -> str:
         """Generate a personalized event greeting using LLM for multiple events."""
@@ -173,23 +130,12 @@ class EventManager:
         events_text = "\n".join(events_context)
         events_summary = ", ".join(event_details)
         
-        system_prompt = f"""You are Sorea, a caring friend who remembers important events in people's lives. Generate a warm, personalized greeting that asks about multiple important events. 
-
-        GUIDELINES:
-        - Be genuinely caring and show you remember all the events
-        - Use natural, friendly language like you're texting a close friend
-        - Show appropriate emotion (excitement, concern, encouragement) for the event types
-        - Keep it conversational and warm, not formal
-        - Reference the timing naturally based on the date comparisons
-        - Make it feel personal and thoughtful
-        - If there are multiple events, weave them together naturally or focus on the most relevant one
+        system_prompt = f"""{GREETING_PROMPT}
 
         EVENT CONTEXT:
         - Person's name: {name}
         - Today's date: {today_str}
-        - Events to follow up on: {events_text}
-
-        Generate ONE natural, caring greeting message that shows you remember and care about their events."""
+        - Events to follow up on: {events_text}"""
 
         try:
             messages = [
@@ -197,7 +143,7 @@ class EventManager:
                 HumanMessage(content=f"Generate a caring greeting for {name} about their events: {events_summary}. Today is {today_str}. Compare the dates and generate appropriate timing language.")
             ]
             
-            response = self.llm.invoke(messages)
+            response = self.scheduler.invoke(self.llm, messages, "events")
             greeting = response.content.strip()
 
             if greeting.startswith('"') and greeting.endswith('"'):
@@ -5,19 +5,37 @@ No sessions, no analytics, no separate tables - just users organized by email
 
 import os
 import json
+import asyncio
 import base64
 import firebase_admin
 import logging
-from firebase_admin import credentials, firestore
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from firebase_admin import credentials, firestore, firestore_async
+from google.api_core import exceptions as gexc
 from google.cloud.firestore import FieldFilter
 from data import UserProfile
+from profile_cache import get_profile_cache, profile_from_dict
+from timezones import daily_bucket
+from tracing import traced
 
 class FirebaseManager:
-    """Firebase manager with email-based user organization using Firestore."""
+    """
+    Firebase manager with email-based user organization using Firestore.
+
+    db is the synchronous client, used by the daily task and the sync methods. async_db is
+    the AsyncClient behind the *_async methods of the chat path; those must run on the
+    background loop, since the client's channel is bound to the loop that first uses it.
+    Without an AsyncClient the *_async methods run the sync ones in a thread.
+    """
     
-    def __init__(self):
-        self.db = None
-        self.initialize_firebase()
+    def __init__(self, db=None, async_db=None):
+        """Connect to Firestore, or use the given clients (e.g. in-memory stand-ins for benchmarks)."""
+        self.db = db
+        self.async_db = async_db
+        self.profile_cache = get_profile_cache()
+        if self.db is None:
+            self.initialize_firebase()
     
     def initialize_firebase(self):
         """Initialize Firebase using multiple credential strategies suitable for Azure Functions."""
@@ -34,6 +52,13 @@ class FirebaseManager:
         except Exception as e:
             logging.error(f"Firebase initialization failed: {e}")
             self.db = None
+            return
+
+        try:
+            self.async_db = firestore_async.client()
+        except Exception as e:
+            logging.warning(f"Async Firestore client unavailable, using the sync client in threads: {e}")
+            self.async_db = None
     
     def _use_credentials_from_json_env(self) -> bool:
         """Initialize using raw JSON from FIREBASE_CREDENTIALS_JSON App Setting."""
@@ -107,31 +132,156 @@ class FirebaseManager:
         return settings
     
     def get_user_profile(self, email: str) -> UserProfile:
-        """Get user profile from Firestore using email as document ID."""
+        """Get user profile using email as document ID, from the process-wide profile cache when possible."""
+        profile = self.profile_cache.get(email)
+        if profile is None:
+            profile = self._fetch_user_profile(email)
+            self.profile_cache.set(email, profile)
+            self.profile_cache.watch(self.db, email)
+        return profile
+
+    async def get_user_profile_async(self, email: str) -> UserProfile:
+        """Async get_user_profile, reading through the same profile cache."""
+        profile = self.profile_cache.get(email)
+        if profile is None:
+            if self.async_db is None:
+                profile = await asyncio.to_thread(self._fetch_user_profile, email)
+            else:
+                profile = await self._fetch_user_profile_async(email)
+            self.profile_cache.set(email, profile)
+            self.profile_cache.watch(self.db, email)
+        return profile
+
+    @traced("firestore.get_user_profile")
+    async def _fetch_user_profile_async(self, email: str) -> UserProfile:
+        doc_ref = self.async_db.collection('users').document(email)
+        doc = await doc_ref.get()
+        if doc.exists:
+            data = doc.to_dict()
+            bucket = self._stale_daily_bucket(data)
+            if bucket is not None:
+                await doc_ref.set({'dailyBucket': bucket}, merge=True)
+            return profile_from_dict(email, data)
+        default_profile = UserProfile(email=email, name='Friend', timezone='UTC')
+        await doc_ref.set({
+            'name': default_profile.name,
+            'timezone': default_profile.timezone,
+            'dailyBucket': daily_bucket(default_profile.timezone)
+        })
+        return default_profile
+
+    @traced("firestore.get_user_profile")
+    def _fetch_user_profile(self, email: str) -> UserProfile:
+        """Read the user profile from Firestore, creating a default one if none exists."""
         if not self.db:
             raise RuntimeError("Firebase DB not initialized")
         doc_ref = self.db.collection('users').document(email)
         doc = doc_ref.get()
         if doc.exists:
             data = doc.to_dict()
-            return UserProfile(
-                email=email,
-                name=data.get('name', 'Friend'),
-                timezone=data.get('timezone', 'UTC')
-            )
+            bucket = self._stale_daily_bucket(data)
+            if bucket is not None:
+                doc_ref.set({'dailyBucket': bucket}, merge=True)
+            return profile_from_dict(email, data)
         else:
             # Create a default profile if none exists
             default_profile = UserProfile(email=email, name='Friend', timezone='UTC')
             doc_ref.set({
                 'name': default_profile.name,
-                'timezone': default_profile.timezone
+                'timezone': default_profile.timezone,
+                'dailyBucket': daily_bucket(default_profile.timezone)
             })
             return default_profile
+
+    @staticmethod
+    def _stale_daily_bucket(data: dict):
+        """
+        The user's daily bucket when the stored one is missing or out of date (a timezone
+        change or a DST switch), else None. Kept fresh on profile reads, so every user who
+        chats has it current.
+        """
+        bucket = daily_bucket(data.get('timezone'))
+        return bucket if data.get('dailyBucket') != bucket else None
     
-    def get_all_user_emails(self) -> list:
-        """Retrieve all user emails from Firestore."""
+    @traced("firestore.get_all_user_emails")
+    def get_all_user_emails(self, limit: Optional[int] = None, start_after: Optional[str] = None) -> list:
+        """Retrieve user emails from Firestore, at most limit of them after the start_after user (see _page_ids)."""
+        if not self.db:
+            raise RuntimeError("Firebase DB not initialized")
+        return self._page_ids(self.db.collection('users'), limit, start_after)
+
+    @traced("firestore.get_inactive_user_emails")
+    def get_inactive_user_emails(self, inactive_hours: float, limit: Optional[int] = None,
+                                 start_after: Optional[str] = None) -> list:
+        """
+        Retrieve users whose last message is older than inactive_hours, at most limit of them
+        after the start_after user (see _page_ids).
+        Relies on the lastMessageAt index, users without it are not returned.
+        """
+        if not self.db:
+            raise RuntimeError("Firebase DB not initialized")
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=inactive_hours)
+        query = self.db.collection('users').where(filter=FieldFilter('lastMessageAt', '<', cutoff))
+        return self._page_ids(query, limit, start_after)
+
+    def _page_ids(self, query, limit: Optional[int], start_after: Optional[str]) -> list:
+        """
+        Document ids of one page of a users query. start_after is the last email of the
+        previous page; its document is the query cursor.
+
+        Raises:
+            ValueError: If the start_after user does not exist
+        """
+        if start_after:
+            cursor = self.db.collection('users').document(start_after).get()
+            if not cursor.exists:
+                raise ValueError(f"Unknown start_after user: {start_after}")
+            query = query.start_after(cursor)
+        if limit is not None:
+            query = query.limit(limit)
+        return [doc.id for doc in query.stream()]
+
+    @traced("firestore.get_daily_due_users")
+    def get_daily_due_users(self, bucket: int) -> dict:
+        """
+        Retrieve users in the given daily bucket who chatted since their last daily run.
+        Equality filters only, served by the automatic single-field indexes.
+
+        Returns:
+            Dict of email -> user document data
+        """
         if not self.db:
             raise RuntimeError("Firebase DB not initialized")
-        users_ref = self.db.collection('users')
-        docs = users_ref.stream()
-        return [doc.id for doc in docs]
\ No newline at end of file
+        query = (
+            self.db.collection('users')
+            .where(filter=FieldFilter('dailyBucket', '==', bucket))
+            .where(filter=FieldFilter('dailyPending', '==', True))
+        )
+        return {doc.id: doc.to_dict() for doc in query.stream()}
+
+    @traced("firestore.clear_daily_pending")
+    def clear_daily_pending(self, email: str, before: datetime) -> bool:
+        """
+        Unmark a user after their daily run, unless they chatted at or after before (the end
+        of the summarized day) and so still have a day to summarize. The update only applies
+        if the document is unchanged since it was read, so a chat landing in between keeps
+        the mark.
+
+        Returns:
+            True when the mark was cleared
+        """
+        if not self.db:
+            raise RuntimeError("Firebase DB not initialized")
+        doc_ref = self.db.collection('users').document(email)
+        for _ in range(3):
+            doc = doc_ref.get()
+            data = (doc.to_dict() or {}) if doc.exists else {}
+            last_message_time = data.get('lastMessageAt')
+            if not data.get('dailyPending') or (last_message_time is not None and last_message_time >= before):
+                return False
+            try:
+                doc_ref.update({'dailyPending': False}, option=self.db.write_option(last_update_time=doc.update_time))
+                return True
+            except gexc.FailedPrecondition:
+                continue
+        return False
@@ -3,23 +3,57 @@ Helper Functions Module
 Contains utility functions for generating follow-up questions and suggestions
 """
 
-from typing import List, Dict, Tuple
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import List, Dict, Optional, Tuple
+from llm import get_llm
+from data import MessagePair
 from langchain_core.messages import SystemMessage, HumanMessage
+from managers.analysis import AnalysisManager
+from ratelimit import get_llm_scheduler
+from background import get_background_loop
 
 
+# Static part of the suggestions prompt, cached as a prompt prefix
+SUGGESTIONS_PROMPT = """You are a caring mental health companion. Generate practical suggestions for someone based on their emotional state and conversation context.
+
+        GUIDELINES BY URGENCY LEVEL:
+        - Level 1-2: Gentle self-care suggestions and positive activities
+        - Level 3: Focused coping strategies and stress management techniques
+        - Level 4-5: Immediate help suggestions and safety-focused recommendations
+
+        CONVERSATION DEPTH GUIDELINES:
+        - Early conversation (1-3 messages): General wellness suggestions
+        - Developing relationship (4-10 messages): More personalized recommendations
+        - Deeper relationship (10+ messages): Can suggest specific lifestyle changes or reaching out to support systems
+
+        RESPONSE FORMAT:
+        Generate 3-4 practical suggestions, one per line, without any headers or formatting.
+
+        REQUIREMENTS:
+        - Suggestions should be immediately helpful and actionable
+        - Suggestions should be specific (not generic advice)
+        - Use the user's name naturally when appropriate
+        - Match urgency level appropriately
+        - Each suggestion should be 10 words max
+        - Focus on practical steps they can take right now"""
+
+
+# Appended to the chat system prompt when the reply carries its own suggestions
+SUGGESTIONS_MARKER = "[[SUGGESTIONS]]"
+REPLY_SUGGESTIONS_INSTRUCTION = f"""
+        SUGGESTIONS:
+        After your reply, write {SUGGESTIONS_MARKER} on its own line, then 3-4 practical suggestions for
+        the user, one per line, each 10 words max, without any headers or formatting.
+        Never mention or explain the suggestions in the reply itself."""
+
 
 class HelperManager:
     """Manages helper functions for generating follow-up questions and suggestions."""
     
-    def __init__(self,config):
+    def __init__(self,config,analysis_manager: AnalysisManager = None):
         """Initialize the HelperManager with LLM for response generation."""
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.model_name,
-            google_api_key=config.gemini_api_key,
-            temperature=config.temperature,
-            max_tokens=config.max_tokens
-        )
+        self.llm = get_llm(config, "suggestions")
+        self.scheduler = get_llm_scheduler()
+        self.analysis_manager = analysis_manager or AnalysisManager(config)
 
     def detect_emotion(self, message: str) -> Tuple[str, int]:
         """
@@ -31,77 +65,41 @@ class HelperManager:
         Returns:
             Tuple of (emotion, urgency_level) where urgency_level is 1-5
         """
-        system_prompt = """You are an expert emotion detection system for a mental health chatbot. Analyze the user's message and determine:
-
-        1. PRIMARY EMOTION: The main emotion expressed (happy, sad, anxious, angry, excited, frustrated, depressed, hopeful, etc.)
-        2. URGENCY LEVEL: Rate from 1-5 based on how urgent the situation seems:
-
-        URGENCY LEVELS:
-        1 = Casual/Positive: Good news, casual chat, mild stress, normal life updates
-        2 = Mild Concern: Minor worries, everyday stress, slight sadness, general life issues
-        3 = Moderate Distress: Significant stress, relationship problems, work/school issues, moderate anxiety/depression
-        4 = High Distress: Severe anxiety, major life crisis, intense emotional pain, thoughts of self-harm (non-suicidal)
-        5 = CRISIS: Suicidal thoughts, immediate danger, severe depression with self-harm ideation, emergency situation
-
-        IMPORTANT GUIDELINES:
-        - Most messages should be level 1-3. Only use 4-5 for genuinely serious situations
-        - Don't over-dramatize normal stress or sadness
-        - Look for keywords like "kill myself", "end it all", "can't go on" for level 5
-        - Consider context: "I'm so tired" could be level 1 (normal) or level 3 (depression symptom)
-
-        Respond EXACTLY in this format:
-        EMOTION: [single word emotion]
-        URGENCY: [number 1-5]
-        REASONING: [brief explanation of why you chose this urgency level]"""
-
-        try:
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=f"Analyze this message for emotion and urgency: '{message}'")
-            ]
-            
-            response = self.llm.invoke(messages)
-            response_text = response.content.strip()
-            
-            # Parse the response
-            emotion = "neutral"
-            urgency_level = 1
-            
-            lines = response_text.split('\n')
-            for line in lines:
-                if line.startswith("EMOTION:"):
-                    emotion = line.split(":", 1)[1].strip().lower()
-                elif line.startswith("URGENCY:"):
-                    try:
-                        urgency_level = int(line.split(":", 1)[1].strip())
-                        urgency_level = max(1, min(5, urgency_level))  
-                    except (ValueError, IndexError):
-                        urgency_level = 1
-            
-            return emotion, urgency_level
-            
-        except Exception as e:
-            return "neutral", 1
-
-    def generate_suggestions(self, emotion: str, urgency_level: int, email: str, firebase_manager, message_manager, user_message: str = "") -> List[str]:
+        analysis = self.analysis_manager.analyze(message)
+        return analysis.emotion, analysis.urgency_level
+
+    def generate_suggestions(self, emotion: str, urgency_level: int, email: str, firebase_manager, message_manager,
+                             user_message: str = "", user_name: Optional[str] = None,
+                             recent_messages: Optional[List[MessagePair]] = None) -> List[str]:
+        """Blocking generate_suggestions_async for synchronous callers."""
+        return get_background_loop().run(self.generate_suggestions_async(
+            emotion, urgency_level, email, firebase_manager, message_manager, user_message, user_name, recent_messages
+        ))
+
+    async def generate_suggestions_async(self, emotion: str, urgency_level: int, email: str, firebase_manager,
+                                         message_manager, user_message: str = "", user_name: Optional[str] = None,
+                                         recent_messages: Optional[List[MessagePair]] = None) -> List[str]:
         """
         Generate practical suggestions based on user's emotional state and conversation context.
         
         Args:
             emotion: The detected emotion
             urgency_level: Urgency level from 1-5
-            user_name: User's preferred name
             email: User's email for conversation context
             user_message: Current user message
+            user_name: User's preferred name, read from the profile when not given
+            recent_messages: Conversation history the turn already loaded, fetched when not given
             
         Returns:
             List of practical suggestions
         """
-        user_profile = firebase_manager.get_user_profile(email)
-        name = user_profile.name
+        name = user_name
+        if name is None:
+            name = (await firebase_manager.get_user_profile_async(email)).name
         
         # Get conversation context
-        recent_messages = message_manager.get_conversation(email, firebase_manager, date=None, limit=10)
+        if recent_messages is None:
+            recent_messages = await message_manager.get_conversation_async(email, firebase_manager, date=None, limit=10)
         
         # Build conversation history for context
         conversation_context = ""
@@ -110,36 +108,15 @@ class HelperManager:
                 conversation_context += f"User: {msg_pair.user_message.content}\n"
                 conversation_context += f"Assistant: {msg_pair.llm_message.content}\n"
 
-        system_prompt = f"""You are a caring mental health companion. Generate practical suggestions for someone based on their emotional state and conversation context.
+        system_prompt = f"""{SUGGESTIONS_PROMPT}
 
         CONTEXT:
         - User's name: {name}
         - Current emotion: {emotion}
         - Urgency level: {urgency_level}/5 (1=casual, 2=mild concern, 3=moderate distress, 4=high distress, 5=crisis)
 
-        GUIDELINES BY URGENCY LEVEL:
-        - Level 1-2: Gentle self-care suggestions and positive activities
-        - Level 3: Focused coping strategies and stress management techniques
-        - Level 4-5: Immediate help suggestions and safety-focused recommendations
-
-        CONVERSATION DEPTH GUIDELINES:
-        - Early conversation (1-3 messages): General wellness suggestions
-        - Developing relationship (4-10 messages): More personalized recommendations
-        - Deeper relationship (10+ messages): Can suggest specific lifestyle changes or reaching out to support systems
-
         Recent conversation context:
-        {conversation_context}
-
-        RESPONSE FORMAT:
-        Generate 3-4 practical suggestions, one per line, without any headers or formatting.
-
-        REQUIREMENTS:
-        - Suggestions should be immediately helpful and actionable
-        - Suggestions should be specific (not generic advice)
-        - Use {name} naturally when appropriate
-        - Match urgency level appropriately
-        - Each suggestion should be 10 words max
-        - Focus on practical steps they can take right now"""
+        {conversation_context}"""
 
         try:
             messages = [
@@ -147,7 +124,7 @@ class HelperManager:
                 HumanMessage(content=f"Current user message: '{user_message}' | Generate practical suggestions for someone feeling {emotion} at urgency level {urgency_level}/5.")
             ]
             
-            response = self.llm.invoke(messages)
+            response = await self.scheduler.ainvoke(self.llm, messages, "suggestions")
             response_text = response.content.strip()
             suggestions = self._parse_suggestions(response_text)
             
@@ -156,7 +133,21 @@ class HelperManager:
         except Exception as e:
             return []
 
-    def _parse_suggestions(self, response_text: str) -> List[str]:
+    @staticmethod
+    def split_reply(response_text: str) -> Tuple[str, List[str]]:
+        """
+        Separate the suggestions a reply carries after SUGGESTIONS_MARKER.
+
+        Returns:
+            Tuple of (reply text, suggestions), suggestions empty when the marker is missing
+        """
+        reply, marker, rest = response_text.partition(SUGGESTIONS_MARKER)
+        if not marker:
+            return response_text, []
+        return reply.rstrip(), HelperManager._parse_suggestions(rest)
+
+    @staticmethod
+    def _parse_suggestions(response_text: str) -> List[str]:
         """
         Parse the LLM response to extract suggestions.
         
@@ -184,3 +175,45 @@ class HelperManager:
             pass
         
         return suggestions
+
+
+class ReplySplitter:
+    """
+    Splits a streamed reply into the visible text and the suggestions after SUGGESTIONS_MARKER.
+    Text that could be the start of the marker is held back until the next chunk decides it.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._tail = None   # text after the marker, once it was seen
+
+    def feed(self, chunk: str) -> str:
+        """Take the next chunk and return the part of it that is safe to show."""
+        if self._tail is not None:
+            self._tail += chunk
+            return ""
+
+        text = self._pending + chunk
+        index = text.find(SUGGESTIONS_MARKER)
+        if index >= 0:
+            self._pending = ""
+            self._tail = text[index + len(SUGGESTIONS_MARKER):]
+            return text[:index]
+
+        # Hold back the longest ending that is a prefix of the marker
+        hold = 0
+        for size in range(min(len(text), len(SUGGESTIONS_MARKER) - 1), 0, -1):
+            if SUGGESTIONS_MARKER.startswith(text[-size:]):
+                hold = size
+                break
+        self._pending = text[len(text) - hold:]
+        return text[:len(text) - hold]
+
+    def finish(self) -> str:
+        """Return any text still held back once the stream ended."""
+        pending, self._pending = self._pending, ""
+        return pending
+
+    @property
+    def suggestions(self) -> List[str]:
+        return HelperManager._parse_suggestions(self._tail) if self._tail else []
@@ -1,21 +1,47 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timezone, date, timedelta
 from firebase_admin import firestore
 from data import ConversationMemory, MessagePair, UserProfile, UserMessage, LLMMessage
 from datetime import timezone
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm import get_llm
+from ratelimit import get_llm_scheduler
+from background import get_background_loop
 from google.cloud import firestore as fbs
+from google.cloud.firestore import FieldFilter
 from google.cloud.firestore_v1 import Increment
+from firebase_writer import WriteOp, commit_writes, commit_writes_async
+from cache import TTLCache
+from tracing import traced
+import asyncio
 import logging
 
+
+class ConversationWindow:
+    """Cached tail of the conversation a get_conversation(date=None) call resolves to."""
+
+    def __init__(self, requested_id: str, conversation_id: str, pairs: List[MessagePair], complete: bool,
+                 memory: Optional[ConversationMemory] = None):
+        self.requested_id = requested_id        # conv id for the day the lookup was made
+        self.conversation_id = conversation_id  # conv id the pairs actually came from (may be a fallback day)
+        self.pairs = pairs
+        self.complete = complete                # True when pairs hold the whole conversation
+        # Counters and rolling summary of the conversation document
+        self.memory = memory or ConversationMemory(
+            conversation_id=conversation_id, pair_count=len(pairs) if complete else 0
+        )
+
 class MessageManager:
     """Manages conversation memory, user profiles, and chat history using Firebase."""
     
-    def __init__(self,firebase_manager):
+    def __init__(self,firebase_manager, cache_size: int = 1024, cache_ttl: float = 300.0, window_size: int = 20):
         self.conversations: Dict[str, ConversationMemory] = {}
         self.user_profiles: Dict[str, UserProfile] = {}
         self.db = firebase_manager.db
+        self.async_db = getattr(firebase_manager, "async_db", None)
+        # Recent MessagePair window of today's conversation per email
+        self.conversation_cache = TTLCache(cache_size, cache_ttl)
+        self.window_size = window_size
     
     def add_chat_pair(self, email: str, user_message: str, model_response: str, 
                     emotion_detected: str = None, urgency_level: int = 1):
@@ -26,46 +52,180 @@ class MessageManager:
         
         try:
             logging.info(f"Adding chat pair for {email}")
-            now = datetime.now()
-            conversation_id = f"conv_{now.strftime('%Y%m%d')}"
-            
-            chat_pair_data = {
-                "user": user_message,
-                "model": model_response,
-                "timestamp": fbs.SERVER_TIMESTAMP,
-                "urgency_level": urgency_level
-            }
-            if emotion_detected is not None:
-                chat_pair_data["emotion_detected"] = emotion_detected
-            
-            # Reference to today's conversation doc
-            conv_doc_ref = (
-                self.db.collection("users")
-                .document(email)
-                .collection("conversations")
-                .document(conversation_id)
-            )
-            logging.info(f"Conversation document ref: {conv_doc_ref.path}")
+            commit_writes(self.db, self.chat_pair_writes(email, user_message, model_response,
+                                                         emotion_detected, urgency_level))
+            logging.info(f"SUCCESS: Added chat pair to {email}'s conversation")
+
+        except Exception as e:
+            logging.error(f"ERROR: Error adding chat pair: {e}")
+
+    async def add_chat_pair_async(self, email: str, user_message: str, model_response: str,
+                                  emotion_detected: str = None, urgency_level: int = 1):
+        """Async add_chat_pair, committed on the AsyncClient."""
+        if self.async_db is None:
+            return await asyncio.to_thread(self.add_chat_pair, email, user_message, model_response,
+                                           emotion_detected, urgency_level)
+        try:
+            logging.info(f"Adding chat pair for {email}")
+            await commit_writes_async(self.async_db, self.chat_pair_writes(
+                email, user_message, model_response, emotion_detected, urgency_level
+            ))
+            logging.info(f"SUCCESS: Added chat pair to {email}'s conversation")
+
+        except Exception as e:
+            logging.error(f"ERROR: Error adding chat pair: {e}")
+
+    def chat_pair_writes(self, email: str, user_message: str, model_response: str,
+                         emotion_detected: str = None, urgency_level: int = 1) -> List[WriteOp]:
+        """Build the Firestore writes for a chat pair so they can be committed in a batch."""
+        if not self.db:
+            return []
+
+        now = datetime.now()
+        conversation_id = f"conv_{now.strftime('%Y%m%d')}"
+        
+        chat_pair_data = {
+            "user": user_message,
+            "model": model_response,
+            "timestamp": fbs.SERVER_TIMESTAMP,
+            "urgency_level": urgency_level
+        }
+        if emotion_detected is not None:
+            chat_pair_data["emotion_detected"] = emotion_detected
+
+        # Write-through so the next turn sees this pair before the batch is committed
+        self._remember_chat_pair(email, conversation_id, MessagePair(
+            user_message=UserMessage(content=user_message, emotion_detected=emotion_detected,
+                                     urgency_level=urgency_level),
+            llm_message=LLMMessage(content=model_response),
+            timestamp=now,
+            conversation_id=conversation_id
+        ))
+        
+        # Reference to today's conversation doc
+        conv_doc_ref = (
+            self.db.collection("users")
+            .document(email)
+            .collection("conversations")
+            .document(conversation_id)
+        )
 
+        user_doc_ref = self.db.collection("users").document(email)
+
+        return [
             # Ensure conversation doc exists & update counters
-            conv_doc_ref.set({
+            WriteOp(conv_doc_ref, {
                 "startDate": now.strftime("%Y-%m-%d"),
                 "chatPairCount": Increment(1),
                 "messageCount": Increment(2),   # user + model
                 "lastChatAt": fbs.SERVER_TIMESTAMP,
                 "lastMessageAt": fbs.SERVER_TIMESTAMP
-            }, merge=True)
+            }),
+            # Add chat pair into subcollection (auto id)
+            WriteOp(conv_doc_ref.collection("chat").document(), chat_pair_data, merge=False),
+            # Last activity index, makes get_last_conversation_time a single read.
+            # dailyPending marks the user for the daily run of their local midnight
+            WriteOp(user_doc_ref, {
+                "lastMessageAt": fbs.SERVER_TIMESTAMP,
+                "lastConversationId": conversation_id,
+                "dailyPending": True
+            })
+        ]
+    
+    def _get_cached_window(self, email: str, limit: Optional[int]) -> Optional[List[MessagePair]]:
+        """Return today's cached pairs if the cached window can answer the request, else None."""
+        window = self.conversation_cache.get(email)
+        if window is None or window.requested_id != f"conv_{datetime.now().strftime('%Y%m%d')}":
+            return None
+        if limit is None:
+            return list(window.pairs) if window.complete else None
+        if window.complete or len(window.pairs) >= limit:
+            return list(window.pairs[-limit:]) if limit > 0 else []
+        return None
 
-            # Add chat pair into subcollection
-            conv_doc_ref.collection("chat").add(chat_pair_data)
+    def _cache_window(self, email: str, window: ConversationWindow):
+        if len(window.pairs) > self.window_size:
+            window = ConversationWindow(window.requested_id, window.conversation_id,
+                                        window.pairs[-self.window_size:], False, window.memory)
+        self.conversation_cache.set(email, window)
 
-            logging.info(f"SUCCESS: Added chat pair to {email}'s conversation")
+    def _remember_chat_pair(self, email: str, conversation_id: str, pair: MessagePair):
+        """Append a new pair to the cached window of the conversation it belongs to."""
+        window = self.conversation_cache.get(email)
+        if window is None:
+            return
+        if window.conversation_id == conversation_id:
+            memory = window.memory.model_copy(update={"pair_count": window.memory.pair_count + 1})
+            self._cache_window(email, ConversationWindow(window.requested_id, conversation_id,
+                                                         window.pairs + [pair], window.complete, memory))
+        elif window.requested_id == conversation_id:
+            # The lookup fell back to an older day, so this pair starts today's conversation
+            self._cache_window(email, ConversationWindow(conversation_id, conversation_id, [pair], True))
+        else:
+            # Cached window belongs to a previous day
+            self.conversation_cache.pop(email)
 
-        except Exception as e:
-            logging.error(f"ERROR: Error adding chat pair: {e}")
-    
-    # In your MessageManager class:
+    def conversation_memory(self, email: str) -> Optional[ConversationMemory]:
+        """Counters and rolling summary of the conversation in today's cached window, if any."""
+        window = self.conversation_cache.get(email)
+        if window is None or window.requested_id != f"conv_{datetime.now().strftime('%Y%m%d')}":
+            return None
+        return window.memory
+
+    def remember_summary(self, email: str, memory: ConversationMemory):
+        """Put a freshly folded rolling summary into the cached window of its conversation."""
+        window = self.conversation_cache.get(email)
+        if window is None or window.conversation_id != memory.conversation_id:
+            return
+        # Turns added while the summary was being generated stay counted
+        memory = memory.model_copy(update={"pair_count": max(memory.pair_count, window.memory.pair_count)})
+        self.conversation_cache.set(email, ConversationWindow(
+            window.requested_id, window.conversation_id, window.pairs, window.complete, memory
+        ))
+
+    def rolling_summary_writes(self, email: str, memory: ConversationMemory) -> List[WriteOp]:
+        """Build the write that stores a rolling summary on its conversation document."""
+        if not self.db:
+            return []
+
+        conv_doc_ref = (
+            self.db.collection("users")
+            .document(email)
+            .collection("conversations")
+            .document(memory.conversation_id)
+        )
+        return [WriteOp(conv_doc_ref, {
+            "summary": memory.summary,
+            "keyTopics": memory.key_topics,
+            "summarizedPairs": memory.summarized_pairs,
+            "summaryUpdatedAt": fbs.SERVER_TIMESTAMP
+        })]
+
+    @traced("firestore.get_conversation_memory")
+    def get_conversation_memory(self, email: str, firebase_manager, date: str) -> Optional[ConversationMemory]:
+        """Read the counters and rolling summary of the conversation on date (YYYYMMDD)."""
+        if not firebase_manager.db:
+            return None
 
+        conversation_id = f"conv_{date}"
+        doc = (
+            firebase_manager.db.collection('users').document(email)
+            .collection('conversations').document(conversation_id).get()
+        )
+        if not doc.exists:
+            return None
+        return self._parse_memory(conversation_id, doc.to_dict())
+
+    @staticmethod
+    def _parse_memory(conversation_id: str, data: dict) -> ConversationMemory:
+        return ConversationMemory(
+            conversation_id=conversation_id,
+            summary=data.get('summary') or "",
+            key_topics=data.get('keyTopics') or [],
+            pair_count=data.get('chatPairCount') or 0,
+            summarized_pairs=data.get('summarizedPairs') or 0
+        )
+    
     def add_suggestions(
         self,
         helper_manager,
@@ -74,8 +234,29 @@ class MessageManager:
         email,
         firebase_manager,
         message_manager,
-        user_message=""
+        user_message="",
+        user_name=None,
+        recent_messages=None
     ):
+        """Blocking add_suggestions_async for synchronous callers."""
+        return get_background_loop().run(self.add_suggestions_async(
+            helper_manager, emotion, urgency_level, email, firebase_manager, message_manager,
+            user_message, user_name, recent_messages
+        ))
+
+    async def add_suggestions_async(
+        self,
+        helper_manager,
+        emotion,
+        urgency_level,
+        email,
+        firebase_manager,
+        message_manager,
+        user_message="",
+        user_name=None,
+        recent_messages=None
+    ):
+        """Generate suggestions for the turn and store them. user_name and recent_messages skip the re-reads."""
         if not self.db:
             logging.error("ERROR: Firestore DB not initialized.")
             return
@@ -83,54 +264,51 @@ class MessageManager:
         try:
             logging.info(f"Generating suggestions for {email}")
 
-            # 1. Generate suggestions (This part is correct)
-            suggestions = helper_manager.generate_suggestions(
+            suggestions = await helper_manager.generate_suggestions_async(
                 emotion,
                 urgency_level,
                 email,
                 firebase_manager,
                 message_manager,
-                user_message
+                user_message,
+                user_name=user_name,
+                recent_messages=recent_messages
             )
 
             if not isinstance(suggestions, list):
                 logging.warning("generate_suggestions did not return a list — coercing to list")
                 suggestions = [str(suggestions)]
 
-            # --- FIX STARTS HERE ---
-
-            # 2. Combine ALL data into a single dictionary for the 'latest' document
-            latest_suggestion_data = {
-                "emotion": emotion,
-                "urgency_level": urgency_level,
-                "timestamp": fbs.SERVER_TIMESTAMP,
-                "suggestions": suggestions,
-                # It seems these counters might be a copy-paste error from add_chat_pair.
-                # You may want to rename or remove them. See note below.
-                "updateCount": Increment(1), 
-            }
-
-            # 3. Get a reference to the single document we want to overwrite
-            doc_ref = (
-                self.db.collection("users")
-                .document(email)
-                .collection("suggestions")
-                .document("latest")  # This is the document we will overwrite
-            )
-
-            # 4. Write everything to that one document using .set()
-            # Using merge=True is good practice to avoid deleting other fields if they exist.
-            doc_ref.set(latest_suggestion_data, merge=True)
-
-            # --- FIX ENDS HERE ---
-
+            writes = self.suggestion_writes(email, emotion, urgency_level, suggestions)
+            if self.async_db is not None:
+                await commit_writes_async(self.async_db, writes)
+            else:
+                await asyncio.to_thread(commit_writes, self.db, writes)
             logging.info(f"SUCCESS: Suggestions stored for {email}")
 
         except Exception as e:
             logging.error(f"ERROR: Failed to store suggestions for {email}: {e}")
 
-         
-    
+    def suggestion_writes(self, email: str, emotion: str, urgency_level: int, suggestions: List[str]) -> List[WriteOp]:
+        """Build the write that overwrites the user's 'latest' suggestions document."""
+        if not self.db:
+            return []
+
+        doc_ref = (
+            self.db.collection("users")
+            .document(email)
+            .collection("suggestions")
+            .document("latest")
+        )
+        return [WriteOp(doc_ref, {
+            "emotion": emotion,
+            "urgency_level": urgency_level,
+            "timestamp": fbs.SERVER_TIMESTAMP,
+            "suggestions": suggestions,
+            "updateCount": Increment(1),
+        })]
+
+    @traced("firestore.get_conversation")
     def get_conversation(self, email: str, firebase_manager,date: Optional[str] = None, limit: Optional[int] = None) -> List[MessagePair]:
         """
         Get conversation messages for a specific date with optional limit.
@@ -147,27 +325,35 @@ class MessageManager:
         if not firebase_manager.db:
             return []
         
+        # Today's window is served from the in-process cache when it covers the request
+        use_cache = date is None
+        if use_cache:
+            cached_pairs = self._get_cached_window(email, limit)
+            if cached_pairs is not None:
+                return cached_pairs
+
         # Use today's date if no date provided
         if date is None:
             date = datetime.now().strftime('%Y%m%d')
         
         try:
-            conversation_id = f"conv_{date}"
+            requested_id = conversation_id = f"conv_{date}"
             doc_ref = firebase_manager.db.collection('users').document(email).collection('conversations').document(conversation_id)
             doc = doc_ref.get()
             
             # If no conversation exists for the specified date, try to get last conversation
             if not doc.exists:
-                last_conversation_time = self.get_last_conversation_time(email)
-                if last_conversation_time:
-                    last_date = last_conversation_time.strftime('%Y%m%d')
-                    conversation_id = f"conv_{last_date}"
+                _, last_conversation_id = self.get_last_activity(firebase_manager, email)
+                if last_conversation_id:
+                    conversation_id = last_conversation_id
                     doc_ref = firebase_manager.db.collection('users').document(email).collection('conversations').document(conversation_id)
                     doc = doc_ref.get()
                     
                     if not doc.exists:
                         return []
                 else:
+                    if use_cache:
+                        self._cache_window(email, ConversationWindow(requested_id, requested_id, [], True))
                     return []
             
             chat_ref = doc_ref.collection('chat')
@@ -183,79 +369,288 @@ class MessageManager:
                 query = chat_ref.order_by('timestamp')
                 pairs = list(query.stream())
             
-            message_pairs = []
-            
-            for pair in pairs:
-                pair_data = pair.to_dict()
-                
-                try:
-                    # Create UserMessage
-                    user_message = UserMessage(
-                        content=pair_data.get('user', ''),
-                        emotion_detected=pair_data.get('emotion_detected') or pair_data.get('emotionDetected'),
-                        urgency_level=pair_data.get('urgency_level') or pair_data.get('urgencyLevel', 1)
-                    )
-                    
-                    # Create LLMMessage  
-                    llm_message = LLMMessage(
-                        content=pair_data.get('model', ''),
-                        suggestions=pair_data.get('suggestions', []),
-                        follow_up_questions=pair_data.get('follow_up_questions', [])
-                    )
-                    
-                    # Create MessagePair
-                    message_pair = MessagePair(
-                        user_message=user_message,
-                        llm_message=llm_message,
-                        timestamp=pair_data.get('timestamp', datetime.now()),
-                        conversation_id=conversation_id
-                    )
-                    
-                    message_pairs.append(message_pair)
-                    
-                except Exception as e:
-                    logging.warning(f"Could not parse message pair: {e}")
-                    continue
-            
+            message_pairs = self._parse_pairs(pairs, conversation_id)
+
+            if use_cache:
+                complete = limit is None or len(pairs) < limit
+                memory = self._parse_memory(conversation_id, doc.to_dict() or {})
+                # Conversations from before the counters were kept
+                memory.pair_count = max(memory.pair_count, len(message_pairs))
+                self._cache_window(email, ConversationWindow(requested_id, conversation_id, message_pairs, complete,
+                                                             memory))
+
             return message_pairs
             
         except Exception as e:
             logging.error(f"Error getting conversation: {e}")
             return []
 
+    @staticmethod
+    def conversation_ids_between(start: datetime, end: datetime) -> List[str]:
+        """
+        Ids of the conversation docs a time span touches. Conversations are keyed by the
+        server's local date (see chat_pair_writes), which need not be the user's.
+        """
+        first = start.astimezone().date()
+        last = (end - timedelta(microseconds=1)).astimezone().date()
+        return [f"conv_{(first + timedelta(days=i)).strftime('%Y%m%d')}" for i in range((last - first).days + 1)]
+
+    @traced("firestore.get_conversation_pairs")
+    def get_conversation_pairs(self, email: str, firebase_manager, date: str,
+                               limit: Optional[int] = None) -> List[MessagePair]:
+        """
+        Message pairs of the conversation on date (YYYYMMDD), oldest first; with limit, only
+        the most recent ones. Unlike get_conversation there is no fallback to another day and
+        read errors are raised, so a failed read is never taken for a day without messages.
+        """
+        if not firebase_manager.db:
+            return []
+
+        conversation_id = f"conv_{date}"
+        chat_ref = (
+            firebase_manager.db.collection('users').document(email)
+            .collection('conversations').document(conversation_id).collection('chat')
+        )
+        if limit is not None:
+            pairs = list(chat_ref.order_by('timestamp', direction='DESCENDING').limit(limit).stream())
+            pairs.reverse()
+        else:
+            pairs = list(chat_ref.order_by('timestamp').stream())
+        return self._parse_pairs(pairs, conversation_id)
+
+    @traced("firestore.get_pairs_between")
+    def get_pairs_between(self, email: str, firebase_manager, start: datetime, end: datetime) -> List[MessagePair]:
+        """Message pairs with start <= timestamp < end, oldest first, across conversation dates."""
+        if not firebase_manager.db:
+            return []
+
+        conversations_ref = firebase_manager.db.collection('users').document(email).collection('conversations')
+        message_pairs = []
+        for conversation_id in self.conversation_ids_between(start, end):
+            query = (
+                conversations_ref.document(conversation_id).collection('chat')
+                .where(filter=FieldFilter('timestamp', '>=', start))
+                .where(filter=FieldFilter('timestamp', '<', end))
+                .order_by('timestamp')
+            )
+            message_pairs.extend(self._parse_pairs(list(query.stream()), conversation_id))
+        return message_pairs
+
+    @traced("firestore.get_conversation")
+    async def get_conversation_async(self, email: str, firebase_manager, date: Optional[str] = None,
+                                     limit: Optional[int] = None) -> List[MessagePair]:
+        """Async get_conversation on the AsyncClient, sharing the same conversation window cache."""
+        if firebase_manager.async_db is None:
+            # Undecorated sync method, this call is already traced
+            return await asyncio.to_thread(self.get_conversation.__wrapped__, self, email, firebase_manager, date, limit)
+
+        use_cache = date is None
+        if use_cache:
+            cached_pairs = self._get_cached_window(email, limit)
+            if cached_pairs is not None:
+                return cached_pairs
+
+        if date is None:
+            date = datetime.now().strftime('%Y%m%d')
+
+        try:
+            conversations_ref = firebase_manager.async_db.collection('users').document(email).collection('conversations')
+            requested_id = conversation_id = f"conv_{date}"
+            doc_ref = conversations_ref.document(conversation_id)
+            doc = await doc_ref.get()
+
+            # If no conversation exists for the specified date, try to get last conversation
+            if not doc.exists:
+                _, last_conversation_id = await self.get_last_activity_async(firebase_manager, email)
+                if last_conversation_id:
+                    conversation_id = last_conversation_id
+                    doc_ref = conversations_ref.document(conversation_id)
+                    doc = await doc_ref.get()
+
+                    if not doc.exists:
+                        return []
+                else:
+                    if use_cache:
+                        self._cache_window(email, ConversationWindow(requested_id, requested_id, [], True))
+                    return []
+
+            chat_ref = doc_ref.collection('chat')
+            if limit is not None:
+                query = chat_ref.order_by('timestamp', direction='DESCENDING').limit(limit)
+                pairs = [pair async for pair in query.stream()]
+                pairs.reverse()
+            else:
+                query = chat_ref.order_by('timestamp')
+                pairs = [pair async for pair in query.stream()]
+
+            message_pairs = self._parse_pairs(pairs, conversation_id)
+
+            if use_cache:
+                complete = limit is None or len(pairs) < limit
+                memory = self._parse_memory(conversation_id, doc.to_dict() or {})
+                # Conversations from before the counters were kept
+                memory.pair_count = max(memory.pair_count, len(message_pairs))
+                self._cache_window(email, ConversationWindow(requested_id, conversation_id, message_pairs, complete,
+                                                             memory))
+
+            return message_pairs
+
+        except Exception as e:
+            logging.error(f"Error getting conversation: {e}")
+            return []
+
+    def _parse_pairs(self, pairs, conversation_id: str) -> List[MessagePair]:
+        """Turn chat document snapshots into MessagePairs, skipping ones that don't parse."""
+        message_pairs = []
+        
+        for pair in pairs:
+            pair_data = pair.to_dict()
+            
+            try:
+                # Create UserMessage
+                user_message = UserMessage(
+                    content=pair_data.get('user', ''),
+                    emotion_detected=pair_data.get('emotion_detected') or pair_data.get('emotionDetected'),
+                    urgency_level=pair_data.get('urgency_level') or pair_data.get('urgencyLevel', 1)
+                )
+                
+                # Create LLMMessage  
+                llm_message = LLMMessage(
+                    content=pair_data.get('model', ''),
+                    suggestions=pair_data.get('suggestions', []),
+                    follow_up_questions=pair_data.get('follow_up_questions', [])
+                )
+                
+                # Create MessagePair
+                message_pair = MessagePair(
+                    user_message=user_message,
+                    llm_message=llm_message,
+                    timestamp=pair_data.get('timestamp', datetime.now()),
+                    conversation_id=conversation_id
+                )
+                
+                message_pairs.append(message_pair)
+                
+            except Exception as e:
+                logging.warning(f"Could not parse message pair: {e}")
+                continue
+
+        return message_pairs
+
     def get_last_conversation_time(self, firebase_manager,email: str) -> Optional[datetime]:
         """Get the timestamp of the user's last message from any conversation date."""
+        last_message_time, _ = self.get_last_activity(firebase_manager, email)
+        return last_message_time
+
+    @traced("firestore.get_last_activity")
+    def get_last_activity(self, firebase_manager, email: str) -> Tuple[Optional[datetime], Optional[str]]:
+        """
+        Get the timestamp and conversation id of the user's last message.
+        Reads the lastMessageAt/lastConversationId index on the user document, and falls back
+        to scanning the conversations (backfilling the index) for users written before it existed.
+        """
         if not firebase_manager.db:
-            return None
-        
+            return None, None
+
         try:
-            conversations_ref = firebase_manager.db.collection('users').document(email).collection('conversations')
-            conversations = conversations_ref.stream()
-            latest_timestamp = None
-            
-            for doc in conversations:
-                conv_id = doc.id
-                if conv_id.startswith('conv_'):
-                    try:
-                        chat_ref = conversations_ref.document(conv_id).collection('chat')
-                        last_message_query = chat_ref.order_by('timestamp', direction='DESCENDING').limit(1)
-                        last_messages = last_message_query.stream()
-                        
-                        for message_doc in last_messages:
-                            message_data = message_doc.to_dict()
-                            timestamp = message_data.get('timestamp')
-                            if timestamp:
-                                if latest_timestamp is None or timestamp > latest_timestamp:
-                                    latest_timestamp = timestamp
-                                    
-                    except Exception as conv_error:
-                        logging.warning(f"Error processing conversation {conv_id}: {conv_error}")
-                        continue
-            return latest_timestamp
-            
+            user_doc = firebase_manager.db.collection('users').document(email).get()
+            user_data = (user_doc.to_dict() or {}) if user_doc.exists else {}
+            if user_data.get('lastMessageAt') and user_data.get('lastConversationId'):
+                return user_data['lastMessageAt'], user_data['lastConversationId']
+
+            latest_timestamp, conversation_id = self._scan_last_activity(firebase_manager, email)
+            if latest_timestamp:
+                self._store_last_activity(firebase_manager, email, latest_timestamp, conversation_id)
+            return latest_timestamp, conversation_id
+
         except Exception as e:
             logging.error(f"Error getting last conversation time: {e}")
-            return None
+            return None, None
+
+    @traced("firestore.get_last_activity")
+    async def get_last_activity_async(self, firebase_manager, email: str) -> Tuple[Optional[datetime], Optional[str]]:
+        """Async get_last_activity. Users without the index take the sync scan in a thread."""
+        if firebase_manager.async_db is None:
+            return await asyncio.to_thread(self.get_last_activity.__wrapped__, self, firebase_manager, email)
+
+        try:
+            user_doc = await firebase_manager.async_db.collection('users').document(email).get()
+            user_data = (user_doc.to_dict() or {}) if user_doc.exists else {}
+            if user_data.get('lastMessageAt') and user_data.get('lastConversationId'):
+                return user_data['lastMessageAt'], user_data['lastConversationId']
+
+            # Legacy users only, the scan backfills the index
+            return await asyncio.to_thread(self.get_last_activity.__wrapped__, self, firebase_manager, email)
+
+        except Exception as e:
+            logging.error(f"Error getting last conversation time: {e}")
+            return None, None
+
+    def backfill_last_activity(self, firebase_manager, emails: Optional[List[str]] = None) -> int:
+        """
+        Populate lastMessageAt/lastConversationId for users that don't have it yet.
+
+        Args:
+            emails: Users to backfill. If None, every user is checked.
+
+        Returns:
+            Number of users whose index was written
+        """
+        if not firebase_manager.db:
+            return 0
+
+        backfilled = 0
+        for email in emails if emails is not None else firebase_manager.get_all_user_emails():
+            try:
+                user_doc = firebase_manager.db.collection('users').document(email).get()
+                user_data = (user_doc.to_dict() or {}) if user_doc.exists else {}
+                if user_data.get('lastMessageAt') and user_data.get('lastConversationId'):
+                    continue
+
+                latest_timestamp, conversation_id = self._scan_last_activity(firebase_manager, email)
+                if latest_timestamp:
+                    self._store_last_activity(firebase_manager, email, latest_timestamp, conversation_id)
+                    backfilled += 1
+
+            except Exception as e:
+                logging.warning(f"Could not backfill last activity for {email}: {e}")
+
+        logging.info(f"Backfilled last activity for {backfilled} users")
+        return backfilled
+
+    def _store_last_activity(self, firebase_manager, email: str, timestamp: datetime, conversation_id: str):
+        firebase_manager.db.collection('users').document(email).set({
+            "lastMessageAt": timestamp,
+            "lastConversationId": conversation_id
+        }, merge=True)
+
+    def _scan_last_activity(self, firebase_manager, email: str) -> Tuple[Optional[datetime], Optional[str]]:
+        """Find the user's last message by querying every conversation. O(conversation days) reads."""
+        conversations_ref = firebase_manager.db.collection('users').document(email).collection('conversations')
+        conversations = conversations_ref.stream()
+        latest_timestamp = None
+        latest_conversation_id = None
+        
+        for doc in conversations:
+            conv_id = doc.id
+            if conv_id.startswith('conv_'):
+                try:
+                    chat_ref = conversations_ref.document(conv_id).collection('chat')
+                    last_message_query = chat_ref.order_by('timestamp', direction='DESCENDING').limit(1)
+                    last_messages = last_message_query.stream()
+                    
+                    for message_doc in last_messages:
+                        message_data = message_doc.to_dict()
+                        timestamp = message_data.get('timestamp')
+                        if timestamp:
+                            if latest_timestamp is None or timestamp > latest_timestamp:
+                                latest_timestamp = timestamp
+                                latest_conversation_id = conv_id
+                                
+                except Exception as conv_error:
+                    logging.warning(f"Error processing conversation {conv_id}: {conv_error}")
+                    continue
+        return latest_timestamp, latest_conversation_id
     
     def _is_first_chat_of_day(self, email: str) -> bool:
         """
@@ -273,15 +668,19 @@ class MessageManager:
             return False
 
     def generate_notification_text(self, email: str, config, firebase_manager) -> str:
+        """Blocking generate_notification_text_async for synchronous callers."""
+        return get_background_loop().run(self.generate_notification_text_async(email, config, firebase_manager))
+
+    async def generate_notification_text_async(self, email: str, config, firebase_manager) -> str:
         """Generate a short, comforting notification text based on recent activity and context."""
         try:
             now = datetime.now(timezone.utc)
             today = now.strftime('%Y%m%d')
             yesterday = (now - timedelta(days=1)).strftime('%Y%m%d')
             
-            user_profile = firebase_manager.get_user_profile(email)
+            user_profile = await firebase_manager.get_user_profile_async(email)
             user_name = user_profile.name
-            last_message_time = self.get_last_conversation_time(firebase_manager,email)
+            last_message_time, _ = await self.get_last_activity_async(firebase_manager, email)
             
             if last_message_time:
                 try:
@@ -297,7 +696,7 @@ class MessageManager:
                     last_message_date_str = last_message_date.strftime('%Y%m%d')
                     
                     # Get conversation from the actual date of last message
-                    recent_messages = self.get_conversation(email, firebase_manager,last_message_date_str)
+                    recent_messages = await self.get_conversation_async(email, firebase_manager, last_message_date_str)
                     
                     if recent_messages and len(recent_messages) > 0:
                         if hours_since_last < 24:
@@ -325,11 +724,7 @@ class MessageManager:
                     context_text += f"User: {pair.user_message.content}\n"
                     context_text += f"Assistant: {pair.llm_message.content}\n"
             
-            llm = ChatGoogleGenerativeAI(
-                model=config.model_name,
-                google_api_key=config.gemini_api_key,
-                temperature=0.8
-            )
+            llm = get_llm(config, "notification")
             
             system_prompt = """You are a formal but caring big brother. Generate a SHORT notification (maximum 15 words) in the FORMAL BIG BROTHER + 2 QUESTIONS + CONCERN style.
 
@@ -369,7 +764,7 @@ class MessageManager:
                 HumanMessage(content=human_prompt)
             ]
             
-            response = llm.invoke(messages)
+            response = await get_llm_scheduler().ainvoke(llm, messages, "notification")
             notification_text = response.content.strip()
             
             # Remove quotes if LLM wrapped the response
@@ -383,7 +778,7 @@ class MessageManager:
             
         except Exception as e:
             logging.error(f"Error generating notification text: {e}")
-            user_profile = firebase_manager.get_user_profile(email)
+            user_profile = await firebase_manager.get_user_profile_async(email)
             user_name = user_profile.name 
             return f"Hey {user_name}, Missing you. Are you feeling okay??"
 
@@ -3,21 +3,27 @@ Summary Manager for Daily Conversation Summaries
 Handles generation, storage, and retrieval of conversation summaries
 """
 
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import firebase_admin
 from firebase_admin import firestore
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm import get_llm
+from ratelimit import get_llm_scheduler
+from background import get_background_loop
 from langchain_core.messages import SystemMessage, HumanMessage
 from data import MessagePair
+from tracing import traced
+import asyncio
+import json
 import logging
 
 
 class SummaryManager:
     """Manages conversation summaries and daily summary generation."""
     
-    def __init__(self, config,db=None):
-        """Initialize with optional database connection."""
+    def __init__(self, config,db=None, async_db=None):
+        """Initialize with optional database connections (sync client and AsyncClient)."""
         self.db = db
+        self.async_db = async_db
         if not self.db:
             try:
                 if firebase_admin._apps:
@@ -28,12 +34,10 @@ class SummaryManager:
                 logging.error(f"Could not initialize Firebase in SummaryManager: {e}")
                 self.db = None
         
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.model_name,
-            google_api_key=config.gemini_api_key,
-            temperature=0.5  
-        )
+        self.llm = get_llm(config, "summary")
+        self.scheduler = get_llm_scheduler()
 
+    @traced("firestore.daily_summary_exists")
     def daily_summary_exists(self, email: str, date_str: str) -> bool:
         """Check if a daily summary already exists for the given date."""
         if not self.db:
@@ -48,18 +52,49 @@ class SummaryManager:
             logging.error(f"Error checking daily summary existence: {e}")
             return False
     
-    def store_daily_summary(self, email: str, date_str: str, summary: dict):
-        """Store a daily conversation summary."""
+    @traced("firestore.daily_summary_exists")
+    async def daily_summary_exists_async(self, email: str, date_str: str) -> bool:
+        """Async daily_summary_exists on the AsyncClient."""
+        if self.async_db is None:
+            return await asyncio.to_thread(self.daily_summary_exists.__wrapped__, self, email, date_str)
+
+        try:
+            doc = await self._summary_ref(self.async_db, email, date_str).get()
+            return doc.exists
+
+        except Exception as e:
+            logging.error(f"Error checking daily summary existence: {e}")
+            return False
+
+    def store_daily_summary(self, email: str, date_str: str, summary: dict) -> bool:
+        """Store a daily conversation summary. Returns whether the write went through."""
         if not self.db:
-            return
+            return False
         
         try:
             self.db.collection('users').document(email).collection('summaries').document(f'daily_{date_str}').set(summary)
             logging.info(f"Stored daily summary for {email} on {date_str}")
+            return True
             
         except Exception as e:
             logging.error(f"Error storing daily summary: {e}")
+            return False
     
+    async def store_daily_summary_async(self, email: str, date_str: str, summary: dict) -> bool:
+        """Async store_daily_summary on the AsyncClient."""
+        if self.async_db is None:
+            return await asyncio.to_thread(self.store_daily_summary, email, date_str, summary)
+
+        try:
+            await self._summary_ref(self.async_db, email, date_str).set(summary)
+            logging.info(f"Stored daily summary for {email} on {date_str}")
+            return True
+
+        except Exception as e:
+            logging.error(f"Error storing daily summary: {e}")
+            return False
+
+    @traced("firestore.get_daily_summary")
     def get_daily_summary(self, email: str, date_str: str) -> Optional[dict]:
         """Get daily summary for a specific date."""
         if not self.db:
@@ -77,7 +112,29 @@ class SummaryManager:
             logging.error(f"Error getting daily summary: {e}")
             return None
     
+    @traced("firestore.get_daily_summary")
+    async def get_daily_summary_async(self, email: str, date_str: str) -> Optional[dict]:
+        """Async get_daily_summary on the AsyncClient."""
+        if self.async_db is None:
+            return await asyncio.to_thread(self.get_daily_summary.__wrapped__, self, email, date_str)
+
+        try:
+            doc = await self._summary_ref(self.async_db, email, date_str).get()
+            return doc.to_dict() if doc.exists else None
+
+        except Exception as e:
+            logging.error(f"Error getting daily summary: {e}")
+            return None
+
+    @staticmethod
+    def _summary_ref(db, email: str, date_str: str):
+        return db.collection('users').document(email).collection('summaries').document(f'daily_{date_str}')
+
     def generate_conversation_summary(self, message_pairs: List[MessagePair]) -> str:
+        """Blocking generate_conversation_summary_async for synchronous callers."""
+        return get_background_loop().run(self.generate_conversation_summary_async(message_pairs))
+
+    async def generate_conversation_summary_async(self, message_pairs: List[MessagePair]) -> str:
         """Generate AI summary of a conversation using LLM."""
         
         if not message_pairs:
@@ -124,7 +181,7 @@ class SummaryManager:
                 HumanMessage(content=summary_prompt)
             ]
             
-            response = self.llm.invoke(messages)
+            response = await self.scheduler.ainvoke(self.llm, messages, "summary")
             summary_text = response.content.strip()
             
             return summary_text
@@ -132,3 +189,67 @@ class SummaryManager:
         except Exception as e:
             logging.warning(f"Could not generate summary: {e}")
             return None
+
+    def fold_summary(self, previous_summary: str, key_topics: List[str],
+                     message_pairs: List[MessagePair]) -> Optional[Tuple[str, List[str]]]:
+        """Blocking fold_summary_async for synchronous callers."""
+        return get_background_loop().run(self.fold_summary_async(previous_summary, key_topics, message_pairs))
+
+    async def fold_summary_async(self, previous_summary: str, key_topics: List[str],
+                                 message_pairs: List[MessagePair]) -> Optional[Tuple[str, List[str]]]:
+        """
+        Fold new turns into a running conversation summary. Only the new turns are sent,
+        so the prompt stays small however long the conversation gets.
+
+        Returns:
+            Tuple of (updated summary, key topics), or None if the summary could not be generated
+        """
+        conversation_text = ""
+        for message_pair in message_pairs:
+            conversation_text += f"User: {message_pair.user_message.content}\n"
+            conversation_text += f"Assistant: {message_pair.llm_message.content}\n"
+
+        if not conversation_text.strip():
+            return (previous_summary, key_topics) if previous_summary else None
+
+        fold_prompt = f"""Update the running summary of a conversation between a user and their mental health support friend.
+
+        SUMMARY SO FAR:
+        {previous_summary or "(nothing yet, this is the start of the conversation)"}
+
+        KEY TOPICS SO FAR: {", ".join(key_topics) if key_topics else "none"}
+
+        NEW MESSAGES:
+        {conversation_text}
+
+        Rewrite the summary so it also covers the new messages:
+        - What the user talked about and how they were feeling, and how that changed
+        - Main topics or concerns, positive moments, and things to remember for next time
+        - Simple and conversational, under 120 words, written like "User talked about..." or "They seemed..."
+
+        Respond ONLY with JSON:
+        {{"summary": "<updated summary>", "key_topics": ["<up to 5 short topics>"]}}"""
+
+        try:
+            messages = [
+                SystemMessage(content="You are a caring friend keeping short running notes of a conversation, so you remember what you talked about with someone."),
+                HumanMessage(content=fold_prompt)
+            ]
+
+            response = await self.scheduler.ainvoke(self.llm, messages, "summary")
+            response_text = response.content.strip()
+
+            start, end = response_text.find('{'), response_text.rfind('}') + 1
+            if start == -1 or end <= start:
+                # Plain-text answer, keep it as the summary
+                return response_text, key_topics
+            data = json.loads(response_text[start:end])
+            summary_text = str(data.get("summary") or "").strip()
+            if not summary_text:
+                return None
+            topics = [str(topic) for topic in data.get("key_topics") or []][:5]
+            return summary_text, topics or key_topics
+
+        except Exception as e:
+            logging.warning(f"Could not fold conversation summary: {e}")
+            return None
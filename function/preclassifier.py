@@ -0,0 +1,105 @@
+"""
+Local Pre-Classifier
+Rule-based fast path that settles clear crisis and clearly mental-health messages without an LLM call.
+Only unambiguous first-person statements take the fast path; anything else goes to the analysis call.
+"""
+
+import re
+from data import PreClassification
+
+
+_I = r"(?:i|i'm|im|i am|i've|ive|i have|i'd|id|i would|i will|i'll)"
+_INTENT = r"(?:want to|wanna|going to|gonna|plan(?:ning)? to|about to|ready to|(?:been )?thinking (?:about|of)|decided to)"
+_SELF_HARM = (
+    r"(?:kill(?:ing)? my ?self|end(?:ing)? (?:it all|my (?:own )?life)|tak(?:e|ing) my (?:own )?life"
+    r"|commit(?:ting)? suicide|overdos(?:e|ing)|die)"
+)
+
+# First-person statements of suicidal intent that escalate straight to crisis handling
+CRISIS_PHRASES = [
+    _I + r"(?: really| just| honestly)? " + _INTENT + r" " + _SELF_HARM + r"(?! (?:of|from|laughing|if|when))",
+    r"kill(?:ing)? my ?self",
+    r"i(?:'m| am) (?:feeling |so |really |very )?suicidal",
+    r"i(?:'ve| have) (?:been )?(?:feeling suicidal|having suicidal thoughts|had suicidal thoughts)",
+    r"i (?:don'?t|do not) want to (?:live|be alive|exist) (?:anymore|any longer)",
+    r"(?:i'?d|i would|i'm|i am|everyone would|they'?d all) be better off (?:dead|without me)",
+    r"(?:there'?s|there is|i have|i've got|i see) no (?:reason|point) (?:for me )?(?:to live|in living|to go on)",
+    r"i can'?t go on (?:anymore|any longer|living)",
+    r"i(?:'ve| have)? (?:just )?(?:overdosed|took (?:a bunch of|too many|all (?:of )?my) (?:pills|meds|tablets))",
+]
+
+# A negation shortly before a crisis phrase ("I would never kill myself") sends it to the LLM
+NEGATION = re.compile(r"\b(?:not|never|no longer|don'?t|didn'?t|won'?t|wouldn'?t|isn'?t|wasn'?t|nor)\b(?:\W+\w+){0,3}\W*$")
+
+# Joking or hypothetical framing is left for the LLM to judge
+NOT_LITERAL = r"\b(?:lol|lmao|haha\w*|jk|kidding|if i|what if|hypothetically|is it possible)\b"
+
+# Feelings that mark a message as mental-health related when the user says they have them
+FEELINGS = [
+    r"anxious", r"depressed", r"stressed(?: out)?", r"overwhelmed", r"panicking", r"lonely", r"sad",
+    r"upset", r"worried", r"scared", r"nervous", r"hopeless", r"worthless", r"exhausted",
+    r"burn(?:ed|t) ?out", r"heartbroken", r"grieving", r"insecure", r"miserable", r"numb", r"alone",
+    r"unmotivated",
+]
+# Words that only describe a feeling after "feel" ("I'm down for pizza", "I'm afraid I can't come")
+FELT_ONLY = [r"low", r"down", r"lost", r"empty", r"afraid", r"awful", r"terrible", r"bad", r"worse"]
+_FEELING = r"(?:" + "|".join(FEELINGS) + r")"
+_FELT = r"(?:" + "|".join(FEELINGS + FELT_ONLY) + r")"
+_DEGREE = r"(?:(?:so|really|very|extremely|super|pretty|quite|a bit|a little|kind of|kinda|always|constantly|just|still|totally) )*"
+
+# Real first-person constructions: "I'm so anxious", "I've been feeling low", "my anxiety", "I can't sleep"
+MENTAL_HEALTH_STATEMENTS = [
+    r"(?:i'm|im|i am|i've been|ive been|i have been) " + _DEGREE + _FEELING,
+    r"(?:i|i've|ive|i have|i keep|i'm|im|i am|i've been|ive been|i have been) " + _DEGREE + r"feel(?:ing|s)? " + _DEGREE + _FELT,
+    r"(?:i|i've|i have) (?:had|have|get|keep having|been having) (?:a )?(?:panic attacks?|anxiety attacks?|anxiety|depression|insomnia|intrusive thoughts)",
+    r"my (?:anxiety|depression|panic attacks?|mental health|therapist|counsell?or|grief|loneliness|insomnia|self[- ]esteem)",
+    r"i (?:can'?t|cannot) (?:stop crying|sleep at night|sleep anymore|cope|handle (?:it|this) anymore)",
+    r"i(?:'ve| have)? (?:been )?(?:crying|cried) (?:all|every|myself)",
+]
+
+# Messages that ask for a task alongside a feeling ("angry my code won't compile, write a sort") go to the LLM
+TASK_REQUESTS = (
+    r"\b(?:write|code|compile|function|script|program|debug|homework|assignment|solve|calculate|translate|"
+    r"recipe|essay|equation|formula|capital of)\b"
+)
+
+
+class PreClassifier:
+    """Compiled lexicon matcher run before the analysis LLM call."""
+
+    def __init__(self):
+        self.crisis_pattern = re.compile(r"\b(?:" + "|".join(CRISIS_PHRASES) + r")\b", re.IGNORECASE)
+        self.topic_pattern = re.compile(r"\b(?:" + "|".join(MENTAL_HEALTH_STATEMENTS) + r")\b", re.IGNORECASE)
+        self.not_literal_pattern = re.compile(NOT_LITERAL, re.IGNORECASE)
+        self.task_pattern = re.compile(TASK_REQUESTS, re.IGNORECASE)
+
+    def classify(self, message: str) -> PreClassification:
+        """
+        Decide which path a message takes.
+
+        Returns:
+            PreClassification with path "crisis" (escalate now), "mental_health" (topic settled,
+            skip the topic part of the analysis) or "llm" (no confident local decision)
+        """
+        text = message.replace("’", "'")
+
+        crisis_match = self._crisis_match(text)
+        if crisis_match:
+            return PreClassification(path="crisis", matched=crisis_match)
+
+        topic_match = self.topic_pattern.search(text)
+        if topic_match and not self.task_pattern.search(text):
+            return PreClassification(path="mental_health", matched=topic_match.group(0), confidence=0.9)
+
+        return PreClassification(path="llm")
+
+    def _crisis_match(self, text: str):
+        """The first crisis phrase that is not negated, joking or hypothetical."""
+        if self.not_literal_pattern.search(text):
+            return None
+        for match in self.crisis_pattern.finditer(text):
+            # Only the words before the phrase within its own sentence
+            before = re.split(r"[.!?;\n]", text[:match.start()])[-1]
+            if not NEGATION.search(before):
+                return match.group(0)
+        return None
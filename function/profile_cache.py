@@ -0,0 +1,141 @@
+"""
+User Profile Cache
+Process-wide TTL cache of user profiles, optionally kept fresh by Firestore snapshot listeners
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+from cache import TTLCache
+from data import UserProfile
+
+
+def profile_from_dict(email: str, data: dict) -> UserProfile:
+    """Build a UserProfile from a users/{email} document."""
+    return UserProfile(
+        email=email,
+        name=data.get('name', 'Friend'),
+        timezone=data.get('timezone', 'UTC')
+    )
+
+
+class FirestoreProfileWatcher:
+    """Listens to users/{email} documents with Firestore on_snapshot."""
+
+    def watch(self, db, email: str, callback: Callable[[str, Optional[dict]], None]):
+        """Start listening and return an object with unsubscribe()."""
+        def on_snapshot(snapshots, changes, read_time):
+            for snapshot in snapshots:
+                callback(email, snapshot.to_dict() if snapshot.exists else None)
+
+        return db.collection('users').document(email).on_snapshot(on_snapshot)
+
+
+class LocalProfileWatcher:
+    """In-memory stand-in for tests and load runs: changes are pushed with notify()."""
+
+    def __init__(self):
+        self.callbacks = {}
+        self._lock = threading.Lock()
+
+    def watch(self, db, email: str, callback: Callable[[str, Optional[dict]], None]):
+        with self._lock:
+            self.callbacks[email] = callback
+        return _LocalWatch(self, email)
+
+    def notify(self, email: str, data: Optional[dict]):
+        """Simulate a change to the user's document (None for a deleted document)."""
+        with self._lock:
+            callback = self.callbacks.get(email)
+        if callback:
+            callback(email, data)
+
+
+class _LocalWatch:
+    def __init__(self, watcher: LocalProfileWatcher, email: str):
+        self.watcher = watcher
+        self.email = email
+
+    def unsubscribe(self):
+        with self.watcher._lock:
+            self.watcher.callbacks.pop(self.email, None)
+
+
+class ProfileCache:
+    """
+    Caches profiles for ttl seconds. With watching enabled, each cached user also gets a
+    snapshot listener that replaces the entry whenever the document changes, so edits made
+    by the app show up before the entry expires. Listeners are capped at max_watches,
+    the least recently started one is dropped first.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 600.0, watch: bool = False,
+                 max_watches: int = 100, watcher=None):
+        self.cache = TTLCache(maxsize, ttl)
+        self.watch_enabled = watch
+        self.max_watches = max_watches
+        self.watcher = watcher or FirestoreProfileWatcher()
+        self._watches = OrderedDict()   # email -> listener handle
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        """Apply the profile cache settings from Config."""
+        self.cache.maxsize = config.profile_cache_size
+        self.cache.ttl = config.profile_cache_ttl
+        self.watch_enabled = config.profile_watch
+
+    def set_watcher(self, watcher):
+        """Replace the listener backend (e.g. with LocalProfileWatcher in tests) and drop cached profiles."""
+        self.clear()
+        with self._lock:
+            self.watcher = watcher
+
+    def get(self, email: str) -> Optional[UserProfile]:
+        return self.cache.get(email)
+
+    def set(self, email: str, profile: UserProfile):
+        self.cache.set(email, profile)
+
+    def invalidate(self, email: str):
+        self.cache.pop(email)
+
+    def watch(self, db, email: str):
+        """Keep the user's entry fresh through a snapshot listener, if watching is enabled."""
+        if not self.watch_enabled:
+            return
+        with self._lock:
+            if email in self._watches:
+                return
+            try:
+                self._watches[email] = self.watcher.watch(db, email, self._on_change)
+            except Exception as e:
+                logging.warning(f"Profile listener for {email} not started: {e}")
+                return
+            while len(self._watches) > self.max_watches:
+                _, handle = self._watches.popitem(last=False)
+                handle.unsubscribe()
+
+    def _on_change(self, email: str, data: Optional[dict]):
+        if data is None:
+            self.invalidate(email)
+        else:
+            self.set(email, profile_from_dict(email, data))
+
+    def clear(self):
+        """Drop every cached profile and stop all listeners."""
+        with self._lock:
+            for handle in self._watches.values():
+                handle.unsubscribe()
+            self._watches.clear()
+        self.cache.clear()
+
+
+profile_cache = ProfileCache()
+
+
+def get_profile_cache(config=None) -> ProfileCache:
+    """Return the process-wide ProfileCache, applying config settings when given."""
+    if config is not None:
+        profile_cache.configure(config)
+    return profile_cache
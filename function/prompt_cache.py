@@ -0,0 +1,210 @@
+"""
+Prompt Prefix Caching
+Registers the large static system prompts as Gemini cached content and references them by handle
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+from google.api_core import exceptions as gexc
+from langchain_core.messages import HumanMessage, SystemMessage
+from context import estimate_tokens
+
+try:
+    from langchain_google_genai import create_context_cache
+except ImportError:  # older langchain-google-genai without context caching
+    create_context_cache = None
+
+
+def is_cache_invalid(error: Exception) -> bool:
+    """Whether a call was rejected for its cached content (expired, deleted or unknown)."""
+    if isinstance(error, gexc.NotFound):
+        return True
+    text = str(error).lower()
+    return (
+        any(word in text for word in ("cachedcontent", "cached content", "cached_content"))
+        and any(word in text for word in ("not found", "expired", "invalid", "does not exist", "unknown"))
+    )
+
+
+class GeminiCacheBackend:
+    """Creates cached content on the Gemini API holding the prefix as system instruction."""
+
+    def create(self, llm, prefix: str, ttl_seconds: int) -> str:
+        if create_context_cache is None:
+            raise RuntimeError("langchain-google-genai does not support context caching")
+        return create_context_cache(llm, [SystemMessage(content=prefix)], ttl=f"{ttl_seconds}s")
+
+
+class FakeCacheBackend:
+    """In-memory stand-in for tests and load runs: hands out names and records what was cached."""
+
+    def __init__(self):
+        self.created = {}
+        self._lock = threading.Lock()
+
+    def create(self, llm, prefix: str, ttl_seconds: int) -> str:
+        with self._lock:
+            name = f"cachedContents/fake-{len(self.created) + 1}"
+            self.created[name] = prefix
+        return name
+
+
+class PromptCache:
+    """
+    Swaps a registered static system prompt for a cached content handle on each call.
+
+    The dynamic rest of the system message moves into a leading user turn, since requests
+    that use cached content may not carry their own system instruction. Whenever a handle
+    cannot be created or is rejected as invalid, the call goes out with the original
+    messages; other errors (rate limits, timeouts) are raised to the caller.
+    """
+
+    def __init__(self, backend=None, enabled: bool = True, ttl_seconds: int = 3600,
+                 min_tokens: int = 1024, retry_after: float = 600.0):
+        self.backend = backend or GeminiCacheBackend()
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.retry_after = retry_after
+        self._prefixes = []
+        self._handles = {}    # (model, prefix hash) -> (name, expires_at)
+        self._failures = {}   # (model, prefix hash) -> retry not before
+        self._creating = set()  # (model, prefix hash) with a create call in flight
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        """Apply the caching settings from Config."""
+        self.enabled = config.prompt_cache_enabled
+        self.ttl_seconds = config.prompt_cache_ttl
+        self.min_tokens = config.prompt_cache_min_tokens
+
+    def set_backend(self, backend):
+        """Replace the cache backend (e.g. with FakeCacheBackend in tests) and drop known handles."""
+        with self._lock:
+            self.backend = backend
+            self._handles.clear()
+            self._failures.clear()
+
+    def register(self, prefix: str):
+        """Mark a static prompt prefix as cacheable. Handles are created lazily on first use."""
+        prefix = prefix.strip()
+        with self._lock:
+            if prefix not in self._prefixes:
+                # Longest first so a prefix that extends another one wins
+                self._prefixes.append(prefix)
+                self._prefixes.sort(key=len, reverse=True)
+
+    def handle(self, llm, prefix: str) -> Optional[str]:
+        """
+        Return a live cached content name for the prefix, creating it if needed, or None.
+        The create call runs outside the lock; calls for a prefix whose handle is still being
+        created go out uncached instead of waiting for it.
+        """
+        if not self.enabled or estimate_tokens(prefix) < self.min_tokens:
+            return None
+
+        key = (getattr(llm, "model", ""), hashlib.sha256(prefix.encode()).hexdigest())
+        now = time.monotonic()
+        with self._lock:
+            cached = self._handles.get(key)
+            # Refresh a minute early so a handle never expires mid-request
+            if cached and cached[1] - 60 > now:
+                return cached[0]
+            if self._failures.get(key, 0) > now or key in self._creating:
+                return None
+            self._creating.add(key)
+
+        try:
+            name = self.backend.create(llm, prefix, self.ttl_seconds)
+        except Exception as e:
+            logging.warning(f"Prompt caching unavailable, sending prompt in full: {e}")
+            name = None
+
+        with self._lock:
+            self._creating.discard(key)
+            if name is None:
+                self._failures[key] = now + self.retry_after
+            else:
+                self._handles[key] = (name, now + self.ttl_seconds)
+        return name
+
+    def invalidate(self, name: str):
+        """Forget a handle the API rejected (expired or deleted)."""
+        with self._lock:
+            for key, (cached_name, _) in list(self._handles.items()):
+                if cached_name == name:
+                    del self._handles[key]
+
+    def apply(self, llm, messages: List) -> Tuple[List, dict]:
+        """
+        Rewrite messages to use a cached prefix when possible.
+
+        Returns:
+            Tuple of (messages, extra invoke kwargs), unchanged when no cache applies
+        """
+        if not messages or not isinstance(messages[0], SystemMessage):
+            return messages, {}
+
+        content = messages[0].content.strip()
+        prefix = next((p for p in self._prefixes if content.startswith(p)), None)
+        if prefix is None:
+            return messages, {}
+
+        name = self.handle(llm, prefix)
+        if name is None:
+            return messages, {}
+
+        rest = content[len(prefix):].strip()
+        cached_messages = ([HumanMessage(content=rest)] if rest else []) + list(messages[1:])
+        return cached_messages, {"cached_content": name}
+
+    async def ainvoke(self, llm, messages: List):
+        """llm.ainvoke with the cached prefix, retrying once with the full prompt if the cache was rejected."""
+        # Creating a handle is a blocking API call, keep it off the event loop
+        cached_messages, kwargs = await asyncio.to_thread(self.apply, llm, messages)
+        if not kwargs:
+            return await llm.ainvoke(messages)
+        try:
+            return await llm.ainvoke(cached_messages, **kwargs)
+        except Exception as e:
+            if not is_cache_invalid(e):
+                raise
+            logging.warning(f"Cached prompt rejected, retrying in full: {e}")
+            self.invalidate(kwargs["cached_content"])
+            return await llm.ainvoke(messages)
+
+    async def astream(self, llm, messages: List):
+        """llm.astream with the cached prefix, falling back to the full prompt if the cache was rejected."""
+        # Creating a handle is a blocking API call, keep it off the event loop
+        cached_messages, kwargs = await asyncio.to_thread(self.apply, llm, messages)
+        if not kwargs:
+            async for chunk in llm.astream(messages):
+                yield chunk
+            return
+
+        streamed = False
+        try:
+            async for chunk in llm.astream(cached_messages, **kwargs):
+                streamed = True
+                yield chunk
+        except Exception as e:
+            if streamed or not is_cache_invalid(e):
+                raise
+            logging.warning(f"Cached prompt rejected, retrying in full: {e}")
+            self.invalidate(kwargs["cached_content"])
+            async for chunk in llm.astream(messages):
+                yield chunk
+
+
+prompt_cache = PromptCache()
+
+
+def get_prompt_cache(config=None) -> PromptCache:
+    """Return the process-wide PromptCache, applying config settings when given."""
+    if config is not None:
+        prompt_cache.configure(config)
+    return prompt_cache
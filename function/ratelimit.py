@@ -0,0 +1,243 @@
+"""
+Rate Limiting
+Schedules every Gemini call under the per-minute request and token quotas, by priority
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import List, Optional
+from background import get_background_loop
+from context import estimate_tokens
+from llm import LLM_PURPOSES, BACKGROUND_PRIORITY
+from prompt_cache import get_prompt_cache
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """True for a 429 / RESOURCE_EXHAUSTED error from the Gemini API."""
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text
+
+
+class _Bucket:
+    """Token bucket refilled continuously at capacity per minute. A capacity of 0 means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float) -> float:
+        """Seconds until amount can be taken while leaving reserve in the bucket."""
+        if not self.capacity:
+            return 0.0
+        # A single request larger than the bucket only needs a full bucket
+        needed = min(amount + reserve, self.capacity) - self.level
+        return max(0.0, needed * 60 / self.capacity)
+
+    def take(self, amount: float):
+        if self.capacity:
+            self.level -= amount
+
+    def resize(self, per_minute: float):
+        """Change the capacity, keeping what is already used up (a bucket that was unlimited starts full)."""
+        self.refill(time.monotonic())
+        self.level = min(per_minute, self.level) if self.capacity else per_minute
+        self.capacity = per_minute
+
+
+class LLMScheduler:
+    """
+    Runs LLM calls through one queue ordered by priority (see LLM_PURPOSES), limiting calls
+    in flight and keeping requests and tokens under the per-minute quotas.
+
+    The queue is strict: a waiting high-priority call holds back everything behind it.
+    Background calls may only use background_share of each quota, so bursts of suggestions
+    or summaries leave headroom for replies. A 429 pauses every call with exponential
+    backoff before the failed call is retried.
+
+    The queue lives on the background loop; calls from other loops are moved onto it.
+    """
+
+    def __init__(self, requests_per_minute: int = 1000, tokens_per_minute: int = 1000000,
+                 max_concurrency: int = 16, background_share: float = 0.8, max_retries: int = 3,
+                 backoff: float = 2.0, max_backoff: float = 60.0, output_tokens: int = 512):
+        self.requests = _Bucket(requests_per_minute)
+        self.tokens = _Bucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.background_share = background_share
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.output_tokens = output_tokens
+        self.in_flight = 0
+        self._waiters = []   # heap of (priority, seq, tokens, future)
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._timer = None
+        self._settings = None
+
+    def configure(self, config):
+        """
+        Apply the quota settings from Config. Settings that did not change are left alone, and
+        new quotas keep the current bucket levels, so reconfiguring never hands out a fresh minute.
+        """
+        settings = (
+            config.gemini_requests_per_minute, config.gemini_tokens_per_minute,
+            config.llm_max_concurrency, config.llm_background_share, config.llm_max_retries
+        )
+        if settings == self._settings:
+            return
+        self._settings = settings
+
+        # Bucket state belongs to the background loop, where _dispatch reads it
+        background = get_background_loop()
+        if background.in_loop_thread():
+            self._apply(settings)
+        else:
+            background.loop.call_soon_threadsafe(self._apply, settings)
+
+    def _apply(self, settings):
+        requests_per_minute, tokens_per_minute, self.max_concurrency, self.background_share, self.max_retries = settings
+        self.requests.resize(requests_per_minute)
+        self.tokens.resize(tokens_per_minute)
+        if self._waiters:
+            self._dispatch()
+
+    # ------------------------------------------------------------------
+    async def acquire(self, priority: int, tokens: int):
+        """Wait for a slot. Every acquire must be paired with release."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller went away
+                self.release(tokens)
+            else:
+                # Cancelled in the queue, the dispatcher skips it
+                self._dispatch()
+            raise
+
+    def release(self, estimated: int, actual: Optional[int] = None):
+        """Give back a slot, correcting the token budget with the call's actual usage."""
+        self.in_flight -= 1
+        if actual is not None:
+            self.tokens.take(actual - estimated)
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        loop = asyncio.get_running_loop()
+        while self._waiters and self.in_flight < self.max_concurrency:
+            priority, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            share = self.background_share if priority >= BACKGROUND_PRIORITY else 1.0
+            wait = max(
+                self._paused_until - now,
+                self.requests.wait_time(1, (1 - share) * self.requests.capacity),
+                self.tokens.wait_time(tokens, (1 - share) * self.tokens.capacity)
+            )
+            if wait > 0:
+                self._timer = loop.call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _rate_limited(self, attempt: int):
+        pause = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        logging.warning(f"Gemini rate limited, pausing LLM calls for {pause:.1f}s")
+
+    def _estimate(self, messages: List) -> int:
+        return sum(estimate_tokens(str(message.content)) for message in messages) + self.output_tokens
+
+    # ------------------------------------------------------------------
+    async def ainvoke(self, llm, messages: List, purpose: str):
+        """llm.ainvoke (with prompt caching) once the scheduler grants a slot for purpose."""
+        background = get_background_loop()
+        if not background.in_loop_thread():
+            return await background.run_async(self.ainvoke(llm, messages, purpose))
+
+        priority = LLM_PURPOSES[purpose]["priority"]
+        estimated = self._estimate(messages)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(priority, estimated)
+            actual = None
+            try:
+                response = await get_prompt_cache().ainvoke(llm, messages)
+                actual = (getattr(response, "usage_metadata", None) or {}).get("total_tokens") or None
+                return response
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                self._rate_limited(attempt)
+            finally:
+                self.release(estimated, actual)
+
+    async def astream(self, llm, messages: List, purpose: str):
+        """llm.astream (with prompt caching) once granted. A 429 before the first chunk is retried."""
+        background = get_background_loop()
+        if not background.in_loop_thread():
+            async for chunk in background.stream(self.astream(llm, messages, purpose)):
+                yield chunk
+            return
+
+        priority = LLM_PURPOSES[purpose]["priority"]
+        estimated = self._estimate(messages)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(priority, estimated)
+            streamed = False
+            try:
+                async for chunk in get_prompt_cache().astream(llm, messages):
+                    streamed = True
+                    yield chunk
+                return
+            except Exception as e:
+                if streamed or not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                self._rate_limited(attempt)
+            finally:
+                self.release(estimated)
+
+    def invoke(self, llm, messages: List, purpose: str):
+        """Blocking ainvoke for synchronous callers. Must not be called from the background loop."""
+        return get_background_loop().run(self.ainvoke(llm, messages, purpose))
+
+
+llm_scheduler = LLMScheduler()
+
+
+def get_llm_scheduler(config=None) -> LLMScheduler:
+    """
+    Return the process-wide LLMScheduler, applying config settings when given. Only the
+    entry points (MentalHealthChatbot, DailyTaskRunner) pass a config; managers use the no-arg form.
+    """
+    if config is not None:
+        llm_scheduler.configure(config)
+    return llm_scheduler
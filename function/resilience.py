@@ -0,0 +1,152 @@
+"""
+Stage Resilience
+Per-stage timeouts, retries and circuit breakers around Gemini and Firestore calls
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable
+from tracing import span
+
+
+class StageFailed(Exception):
+    """A pipeline stage failed after all attempts and has no fallback."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency after repeated failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls are refused
+    for reset_timeout seconds. Then a single trial call is let through: success closes
+    the circuit, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def release(self):
+        """Give back a trial call that ended without a verdict (e.g. the caller went away)."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                logging.warning(f"Circuit '{self.name}' open after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, config=None) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for a dependency ('gemini', 'firestore')."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                kwargs = {}
+                if config is not None:
+                    kwargs = {
+                        "failure_threshold": config.breaker_failure_threshold,
+                        "reset_timeout": config.breaker_reset_timeout
+                    }
+                breaker = CircuitBreaker(name, **kwargs)
+                _breakers[name] = breaker
+    return breaker
+
+
+_NO_FALLBACK = object()
+
+
+async def run_stage(name: str, func: Callable, *args, breaker: CircuitBreaker = None,
+                    timeout: float = None, retries: int = 0, backoff: float = 0.5,
+                    fallback=_NO_FALLBACK):
+    """
+    Run one pipeline stage with a timeout, retries and an optional circuit breaker.
+
+    Sync functions run in a worker thread, coroutine functions are awaited. A timed-out
+    thread keeps running in the background, but its result is no longer waited for.
+
+    Returns:
+        The stage result, or fallback once every attempt failed or the circuit is open
+
+    Raises:
+        StageFailed: If every attempt failed and no fallback was given
+    """
+    with span(f"stage.{name}") as attributes:
+        last_error = None
+        for attempt in range(retries + 1):
+            if breaker and not breaker.allow():
+                last_error = f"circuit '{breaker.name}' open"
+                break
+            attributes["attempts"] = attempt + 1
+            recorded = False
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    call = func(*args)
+                else:
+                    call = asyncio.to_thread(func, *args)
+                result = await asyncio.wait_for(call, timeout)
+            except Exception as e:
+                last_error = "timed out" if isinstance(e, asyncio.TimeoutError) else e
+                logging.warning(f"Stage {name} attempt {attempt + 1} failed: {last_error}")
+                if breaker:
+                    breaker.record_failure()
+                recorded = True
+                if attempt < retries:
+                    await asyncio.sleep(backoff * 2 ** attempt)
+                continue
+            else:
+                if breaker:
+                    breaker.record_success()
+                recorded = True
+                return result
+            finally:
+                # A cancelled call (e.g. the client went away) gives back a half-open trial
+                if breaker and not recorded:
+                    breaker.release()
+
+        attributes["degraded"] = True
+        if fallback is _NO_FALLBACK:
+            raise StageFailed(f"Stage {name} failed: {last_error}")
+        logging.warning(f"Stage {name} degraded: {last_error}")
+        return fallback
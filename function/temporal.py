@@ -0,0 +1,151 @@
+"""
+Local Temporal-Cue Parser
+Finds time references in a message and resolves them to dates, so event extraction only
+goes to the LLM when a message can mention a dated event at all
+"""
+
+import re
+from datetime import date, timedelta
+from typing import Optional
+from data import TemporalCue
+
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+MONTHS = {
+    "jan": 1, "january": 1, "feb": 2, "february": 2, "mar": 3, "march": 3, "apr": 4, "april": 4,
+    "may": 5, "jun": 6, "june": 6, "jul": 7, "july": 7, "aug": 8, "august": 8, "sep": 9, "sept": 9,
+    "september": 9, "oct": 10, "october": 10, "nov": 11, "november": 11, "dec": 12, "december": 12,
+}
+
+NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7}
+
+# Event vocabulary and the event_type each term maps to (see the analysis prompt). Only terms
+# that name the event unambiguously: "test" (covid, blood, driving), "finals" (sports), "pitch"
+# or "a date" ("pick a date") leave the message to the LLM
+EVENT_TERMS = {
+    "exam": r"exams?|midterms?|final exams?|my finals|quiz(?:zes)?",
+    "interview": r"(?:job )?interview",
+    "appointment": r"appointment|dentist",
+    "date": r"(?:first|second|dinner|blind) date|date night|(?:going on|go on|have) a date",
+    "presentation": r"presentation|speech",
+    "meeting": r"meeting",
+    "deadline": r"deadline|(?:is|are|it's|its) due(?! to\b)",
+    "party": r"(?<!third )party|wedding",
+}
+
+# Words that make a local reading unsafe (negated, hypothetical or called off)
+HEDGES = r"\b(?:no|not|never|don'?t|didn'?t|doesn'?t|won'?t|wasn'?t|isn'?t|if|maybe|might|cancel+ed|postponed|moved|rescheduled)\b"
+
+_WEEKDAY = "|".join(WEEKDAYS)
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_NUMBER = r"\d+|" + "|".join(NUMBERS)
+
+CUE_PATTERN = re.compile(
+    r"\b(?:"
+    r"(?P<day_after>day after tomorrow)"
+    r"|(?P<tomorrow>tomorrow|tmrw|tmr)"
+    r"|(?P<today>today|tonight|this (?:morning|afternoon|evening))"
+    r"|(?P<yesterday>yesterday|last night)"
+    r"|(?P<weekend>(?:this|next) weekend)"
+    r"|(?P<next_week>next week)"
+    r"|(?:(?P<weekday_mod>next|this|coming|last|on) )?(?P<weekday>" + _WEEKDAY + r")"
+    r"|in (?P<count>" + _NUMBER + r") (?P<unit>days?|weeks?)"
+    r"|(?P<iso>\d{4}-\d{2}-\d{2})"
+    r"|(?P<month_a>" + _MONTH + r")\.? (?P<day_a>\d{1,2})(?:st|nd|rd|th)?\b"
+    r"|(?P<day_b>\d{1,2})(?:st|nd|rd|th)? (?:of )?(?P<month_b>" + _MONTH + r")"
+    # Cues with no single date: the LLM decides
+    r"|in a (?:few|couple(?: of)?) (?:days|weeks)|next month|this month|end of (?:the )?(?:week|month)"
+    r"|\d{1,2}/\d{1,2}(?:/\d{2,4})?|the \d{1,2}(?:st|nd|rd|th)(?! (?:of )?(?:" + _MONTH + r"))"
+    r")\b",
+    re.IGNORECASE
+)
+
+
+class TemporalParser:
+    """Compiled cue matcher run before event extraction."""
+
+    def __init__(self):
+        self.event_patterns = {
+            event_type: re.compile(r"\b(?:" + terms + r")\b", re.IGNORECASE)
+            for event_type, terms in EVENT_TERMS.items()
+        }
+        self.hedge_pattern = re.compile(HEDGES, re.IGNORECASE)
+
+    def parse(self, message: str, today: Optional[date] = None) -> Optional[TemporalCue]:
+        """
+        Find the time references in a message.
+
+        Returns:
+            None when there is no time reference (no event can be dated). Otherwise a
+            TemporalCue whose date is set when every reference resolves to the same day,
+            and whose event_type is set when the message names exactly one kind of event
+            and is not negated or hypothetical.
+        """
+        today = today or date.today()
+        text = message.replace("’", "'")
+
+        matches = list(CUE_PATTERN.finditer(text))
+        if not matches:
+            return None
+
+        dates = {self._resolve(match, today) for match in matches}
+        event_types = [event_type for event_type, pattern in self.event_patterns.items() if pattern.search(text)]
+
+        return TemporalCue(
+            matched=matches[0].group(0),
+            date=dates.pop().isoformat() if len(dates) == 1 and None not in dates else None,
+            event_type=event_types[0] if len(event_types) == 1 and not self.hedge_pattern.search(text) else None
+        )
+
+    @staticmethod
+    def _resolve(match: re.Match, today: date) -> Optional[date]:
+        """The date a single cue refers to, or None when it is not one definite day."""
+        groups = {name: value for name, value in match.groupdict().items() if value}
+
+        if "day_after" in groups:
+            return today + timedelta(days=2)
+        if "tomorrow" in groups:
+            return today + timedelta(days=1)
+        if "today" in groups:
+            return today
+        if "yesterday" in groups:
+            return today - timedelta(days=1)
+        if "next_week" in groups:
+            return today + timedelta(days=7)
+        if "weekend" in groups:
+            # This weekend's Saturday, yesterday when said on a Sunday
+            saturday = today + timedelta(days=5 - today.weekday())
+            if groups["weekend"].lower().startswith("next"):
+                return saturday + timedelta(days=7)
+            # On Sunday the rest of this weekend is today
+            return max(saturday, today)
+        if "weekday" in groups:
+            modifier = (groups.get("weekday_mod") or "").lower()
+            target = WEEKDAYS.index(groups["weekday"].lower())
+            if modifier == "last":
+                return today - timedelta(days=(today.weekday() - target) % 7 or 7)
+            if modifier == "this":
+                return today + timedelta(days=(target - today.weekday()) % 7)
+            if modifier in ("next", "coming"):
+                return today + timedelta(days=(target - today.weekday()) % 7 or 7)
+            # "Friday" / "on Friday" may be the last or the next one
+            return None
+        if "count" in groups:
+            count = groups["count"].lower()
+            count = int(count) if count.isdigit() else NUMBERS[count]
+            return today + timedelta(days=count * (7 if groups["unit"].lower().startswith("week") else 1))
+        if "iso" in groups:
+            try:
+                return date.fromisoformat(groups["iso"])
+            except ValueError:
+                return None
+        if "month_a" in groups or "month_b" in groups:
+            month = MONTHS[(groups.get("month_a") or groups.get("month_b")).lower()]
+            try:
+                resolved = date(today.year, month, int(groups.get("day_a") or groups.get("day_b")))
+            except ValueError:
+                return None
+            # A past day of the year could be last year's or next year's
+            return resolved if resolved >= today else None
+        return None
@@ -0,0 +1,50 @@
+"""
+User Timezones
+Local-midnight buckets that spread the daily task over the hours of the day
+"""
+
+import logging
+import math
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+def get_zone(name: Optional[str]):
+    """The user's timezone, UTC when missing or unknown."""
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        logging.warning(f"Unknown timezone '{name}', using UTC")
+        return timezone.utc
+
+
+def daily_bucket(name: Optional[str], now: Optional[datetime] = None) -> int:
+    """
+    UTC hour (0-23) of the hourly daily run that follows the user's local midnight,
+    the first full hour at or after it. UTC+5:30 midnight is 18:30 UTC, so its bucket is 19.
+    """
+    now = now or datetime.now(timezone.utc)
+    offset_hours = now.astimezone(get_zone(name)).utcoffset().total_seconds() / 3600
+    return math.ceil((-offset_hours) % 24) % 24
+
+
+def ended_local_date(name: Optional[str], now: Optional[datetime] = None) -> str:
+    """ISO date of the user's local day that ended most recently."""
+    now = now or datetime.now(timezone.utc)
+    return (now.astimezone(get_zone(name)).date() - timedelta(days=1)).isoformat()
+
+
+def local_date(name: Optional[str], moment: datetime) -> str:
+    """ISO date of moment in the user's timezone (naive moments are taken as UTC)."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(get_zone(name)).date().isoformat()
+
+
+def local_day_bounds(name: Optional[str], day: str) -> Tuple[datetime, datetime]:
+    """UTC start (inclusive) and end (exclusive) of the user's local day, an ISO date."""
+    zone = get_zone(name)
+    start = datetime.combine(date.fromisoformat(day), time.min, tzinfo=zone)
+    end = datetime.combine(date.fromisoformat(day) + timedelta(days=1), time.min, tzinfo=zone)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
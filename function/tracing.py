@@ -0,0 +1,227 @@
+"""
+Tracing
+Lightweight spans for Firestore reads, LLM calls and writer queue waits.
+Spans are exported through OpenTelemetry when a tracer provider is configured,
+otherwise kept in a bounded in-memory recorder.
+"""
+
+import asyncio
+import functools
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # OpenTelemetry is optional
+    otel_trace = None
+
+
+class SpanRecord:
+    """A finished span: name, wall-clock start, duration and attributes."""
+
+    def __init__(self, name: str, start: float, duration_ms: float, attributes: dict = None):
+        self.name = name
+        self.start = start
+        self.duration_ms = duration_ms
+        self.attributes = attributes or {}
+
+    def __repr__(self):
+        return f"SpanRecord({self.name!r}, {self.duration_ms:.1f}ms, {self.attributes})"
+
+
+class Trace:
+    """Every span recorded while handling one request."""
+
+    def __init__(self, trace_id: str = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans: List[SpanRecord] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: SpanRecord):
+        with self._lock:
+            self.spans.append(record)
+
+    def timings(self) -> Dict[str, float]:
+        """Total milliseconds per span name, in first-seen order."""
+        totals = {}
+        with self._lock:
+            for record in self.spans:
+                totals[record.name] = totals.get(record.name, 0.0) + record.duration_ms
+        return totals
+
+    def server_timing(self) -> str:
+        """Timings formatted for the Server-Timing response header."""
+        return ", ".join(
+            f"{name.replace('.', '-')};dur={duration:.1f}" for name, duration in self.timings().items()
+        )
+
+
+class InMemoryRecorder:
+    """Keeps the most recent spans in memory, for tests, load runs and when OpenTelemetry is absent."""
+
+    def __init__(self, maxlen: int = 10000):
+        self._spans = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def export(self, record: SpanRecord):
+        with self._lock:
+            self._spans.append(record)
+
+    def spans(self, name: str = None) -> List[SpanRecord]:
+        with self._lock:
+            return [record for record in self._spans if name is None or record.name == name]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class OpenTelemetryExporter:
+    """Re-emits finished spans on the configured OpenTelemetry tracer provider."""
+
+    def __init__(self):
+        self.tracer = otel_trace.get_tracer("sorea")
+
+    @staticmethod
+    def available() -> bool:
+        """True once an SDK (e.g. Azure Monitor) has installed a real tracer provider."""
+        return otel_trace is not None and not isinstance(
+            otel_trace.get_tracer_provider(), (otel_trace.ProxyTracerProvider, otel_trace.NoOpTracerProvider)
+        )
+
+    def export(self, record: SpanRecord):
+        start_ns = int(record.start * 1e9)
+        otel_span = self.tracer.start_span(record.name, start_time=start_ns, attributes=record.attributes)
+        otel_span.end(end_time=start_ns + int(record.duration_ms * 1e6))
+
+
+recorder = InMemoryRecorder()
+_otel_exporter = None
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("sorea_trace", default=None)
+
+
+def _export(record: SpanRecord):
+    global _otel_exporter
+    if OpenTelemetryExporter.available():
+        if _otel_exporter is None:
+            _otel_exporter = OpenTelemetryExporter()
+        _otel_exporter.export(record)
+    else:
+        recorder.export(record)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def record_span(name: str, duration_ms: float, trace: Optional[Trace] = None, start: float = None, **attributes):
+    """Record a span measured elsewhere (e.g. a queue wait) into the given or current trace."""
+    trace = trace or current_trace()
+    if trace is not None:
+        attributes.setdefault("trace_id", trace.trace_id)
+    record = SpanRecord(name, start if start is not None else time.time() - duration_ms / 1000, duration_ms, attributes)
+    if trace is not None:
+        trace.add(record)
+    _export(record)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the enclosed block. Yields the attribute dict so callers can add to it."""
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(name, (time.perf_counter() - started) * 1000, start=start, **attributes)
+
+
+def traced(name: str):
+    """Decorator that wraps every call of a sync or coroutine function in a span."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def run_in_trace(trace: Optional[Trace], coro):
+    """Await coro with trace as the current trace (e.g. on the background loop)."""
+    token = _current_trace.set(trace or Trace())
+    try:
+        return await coro
+    finally:
+        _current_trace.reset(token)
+
+
+async def stream_in_trace(trace: Optional[Trace], agen):
+    """Iterate an async generator with trace as the current trace."""
+    token = _current_trace.set(trace or Trace())
+    try:
+        async for item in agen:
+            yield item
+    finally:
+        _current_trace.reset(token)
+
+
+class LLMTracingHandler(BaseCallbackHandler):
+    """LangChain callback that records one span per LLM call, with token counts."""
+
+    def __init__(self):
+        self._runs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, **_token_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error=type(error).__name__)
+
+    def _start(self, run_id, kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") or ""
+        self._runs[run_id] = (time.time(), time.perf_counter(), current_trace(), model)
+
+    def _finish(self, run_id, **attributes):
+        started = self._runs.pop(run_id, None)
+        if started is None:
+            return
+        start, started_perf, trace, model = started
+        record_span(
+            "llm.call", (time.perf_counter() - started_perf) * 1000,
+            trace=trace, start=start, model=model, **attributes
+        )
+
+
+def _token_usage(response) -> dict:
+    """Input/output token counts from an LLMResult, if the provider reported them."""
+    try:
+        usage = response.generations[0][0].message.usage_metadata or {}
+    except (AttributeError, IndexError):
+        usage = {}
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0)
+    }
@@ -0,0 +1,165 @@
+# File: tests/bench_chat.py
+#
+# Offline load test for the chat pipeline. Drives MentalHealthChatbot.process_conversation_async
+# (or the chat_handler HTTP function) against FakeFirestore and FakeLLM, and reports throughput,
+# latency percentiles, LLM calls per turn and Firestore RPCs per turn for each concurrency level.
+#
+#   python bench_chat.py --concurrency 1 8 32 --turns 200 --mode pipeline
+#   python bench_chat.py --concurrency 8 --mode handler --llm-median 600 --llm-p95 1500
+#   python bench_chat.py --concurrency 8 --suggestions-in-reply
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from fakes import FakeFirestore, LatencyModel, fake_llm_factory
+
+import llm
+from config import Config
+from prompt_cache import get_prompt_cache, FakeCacheBackend
+from profile_cache import get_profile_cache
+
+MESSAGES = [
+    "I'm so anxious about my exam, I can't focus on anything",
+    "Work has been really stressful lately and I feel overwhelmed",
+    "I had a fight with my best friend and I feel awful",
+    "Honestly today was okay, just a bit tired",
+    "I can't sleep at night, my mind keeps racing",
+    "What's the capital of France?",
+    "I feel lonely since I moved to the new city",
+    "My therapist said I should journal more, any ideas?",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_chatbot(db, users, config=None):
+    """A MentalHealthChatbot wired to the in-memory Firestore, with seeded user profiles."""
+    from chatbot import MentalHealthChatbot
+    from managers.firebase_manager import FirebaseManager
+
+    for i, email in enumerate(users):
+        db.docs[f"users/{email}"] = {"name": f"User{i}", "timezone": "UTC"}
+    return MentalHealthChatbot(config, firebase_manager=FirebaseManager(db=db, async_db=db.async_client()))
+
+
+def run_level(concurrency, turns, mode, llm_latency, firestore_latency, users=50, suggestions_in_reply=False):
+    """Run one concurrency level and return its metrics."""
+    from background import get_background_loop
+
+    # Every level starts with a cold profile cache
+    get_profile_cache().clear()
+    factory = fake_llm_factory(llm_latency)
+    llm.registry.set_factory(factory)
+    db = FakeFirestore(firestore_latency)
+    emails = [f"bench{i}@example.com" for i in range(users)]
+    chatbot = build_chatbot(db, emails, Config(suggestions_in_reply=suggestions_in_reply))
+    latencies = []
+
+    def one_turn(i):
+        email, message = emails[i % len(emails)], MESSAGES[i % len(MESSAGES)]
+        started = time.perf_counter()
+        if mode == "handler":
+            call_handler(chatbot, email, message)
+        else:
+            chatbot.process_conversation(email, message)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_turn, range(turns)))
+    elapsed = time.perf_counter() - started
+
+    # Count the queued writes and suggestion jobs the turns caused
+    get_background_loop().run(chatbot.writer.drain())
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "turns": turns,
+        "throughput": turns / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "llm_calls_per_turn": sum(factory.calls.values()) / turns,
+        "llm_calls": dict(factory.calls),
+        "firestore_rpcs_per_turn": sum(db.rpcs.values()) / turns,
+        "firestore_rpcs": dict(db.rpcs),
+    }
+
+
+def call_handler(chatbot, email, message):
+    """Send one request through function_app.chat_handler, bypassing the Functions host, and return the response."""
+    import azure.functions as func
+    import function_app
+    import main
+
+    main.chatbot = chatbot
+    request = func.HttpRequest(
+        method="POST", url="/api/chat", headers={"Content-Type": "application/json"},
+        body=json.dumps({"email": email, "message": message}).encode()
+    )
+    response = function_app.chat_handler._function.get_user_function()(request)
+    assert response.status_code == 200, response.get_body()
+    return response
+
+
+def run_benchmark(levels, turns, mode="pipeline", llm_median=0.0, llm_p95=None,
+                  firestore_median=0.0, firestore_p95=None, seed=0, suggestions_in_reply=False):
+    get_prompt_cache().set_backend(FakeCacheBackend())
+    results = []
+    for concurrency in levels:
+        results.append(run_level(
+            concurrency, turns, mode,
+            LatencyModel(llm_median, llm_p95, seed),
+            LatencyModel(firestore_median, firestore_p95, seed),
+            suggestions_in_reply=suggestions_in_reply
+        ))
+    return results
+
+
+def print_table(results):
+    header = f"{'mode':<9}{'conc':>5}{'turns/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'llm/turn':>10}{'rpc/turn':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['mode']:<9}{r['concurrency']:>5}{r['throughput']:>10.1f}{r['p50_ms']:>10.1f}"
+            f"{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['llm_calls_per_turn']:>10.2f}{r['firestore_rpcs_per_turn']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test for the chat pipeline")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--mode", choices=["pipeline", "handler"], default="pipeline")
+    parser.add_argument("--llm-median", type=float, default=300.0, help="median LLM latency (ms)")
+    parser.add_argument("--llm-p95", type=float, default=900.0)
+    parser.add_argument("--firestore-median", type=float, default=15.0, help="median Firestore RPC latency (ms)")
+    parser.add_argument("--firestore-p95", type=float, default=50.0)
+    parser.add_argument("--suggestions-in-reply", action="store_true",
+                        help="have the main reply carry the suggestions instead of a separate call")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        args.concurrency, args.turns, args.mode,
+        args.llm_median, args.llm_p95, args.firestore_median, args.firestore_p95,
+        suggestions_in_reply=args.suggestions_in_reply
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
@@ -0,0 +1,406 @@
+# File: tests/fakes.py
+#
+# In-memory stand-ins for Firestore and Gemini, used by the offline benchmark.
+
+import asyncio
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1 import Increment
+from google.cloud.firestore_v1.transforms import Sentinel
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from tracing import span
+
+
+class LatencyModel:
+    """Log-normal latency given its median and 95th percentile, in milliseconds."""
+
+    def __init__(self, median_ms=0.0, p95_ms=None, seed=None):
+        self.median_ms = median_ms
+        p95_ms = p95_ms if p95_ms is not None else median_ms
+        self.sigma = math.log(p95_ms / median_ms) / 1.645 if median_ms > 0 and p95_ms > median_ms else 0.0
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """One latency sample in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        with self._lock:
+            factor = math.exp(self.sigma * self.random.gauss(0, 1)) if self.sigma else 1.0
+        return self.median_ms * factor / 1000
+
+
+# ---------------------------------------------------------------------------
+# Firestore
+# ---------------------------------------------------------------------------
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def get(self):
+        self._db.rpc("get")
+        return FakeSnapshot(self, self._db.read(self.path), self._db.update_times.get(self.path))
+
+    def set(self, data, merge=False):
+        self._db.rpc("write")
+        self._db.write(self.path, data, merge)
+
+    def update(self, data, option=None):
+        self._db.rpc("write")
+        self._db.write(self.path, data, True, expected_update_time=option and option["last_update_time"])
+
+    def delete(self):
+        self._db.rpc("write")
+        self._db.remove(self.path)
+
+
+_OPERATORS = {
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, "==": lambda a, b: a == b,
+    ">": lambda a, b: a > b, ">=": lambda a, b: a >= b, "!=": lambda a, b: a != b,
+}
+
+
+class FakeQuery:
+    def __init__(self, db, path, order=None, descending=False, limit=None, filters=(), start_after=None):
+        self._db = db
+        self._path = path
+        self._order = order
+        self._descending = descending
+        self._limit = limit
+        self._filters = filters
+        self._start_after = start_after
+
+    # Collections narrow to plain queries of the same flavour
+    _query_class = None
+
+    def _copy(self, **changes):
+        fields = {"order": self._order, "descending": self._descending, "limit": self._limit, "filters": self._filters,
+                  "start_after": self._start_after}
+        fields.update(changes)
+        return (self._query_class or FakeQuery)(self._db, self._path, **fields)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(order=field, descending=direction == "DESCENDING")
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def where(self, filter):
+        return self._copy(filters=self._filters + ((filter.field_path, filter.op_string, filter.value),))
+
+    def start_after(self, snapshot):
+        """Cursor after a document snapshot, in the query's order (then document path) like Firestore."""
+        return self._copy(start_after=snapshot.reference.path)
+
+    def stream(self):
+        self._db.rpc("query")
+        return iter(self._results())
+
+    def _results(self):
+        docs = self._db.children(self._path)
+        for field, op, value in self._filters:
+            docs = [item for item in docs if item[1].get(field) is not None and _OPERATORS[op](item[1][field], value)]
+        # Like Firestore: by the ordered field, else the inequality field, then the document path
+        field = self._order or next((f for f, op, _ in self._filters if op != "=="), None)
+
+        def key(path, data):
+            return (data.get(field), path) if field else (path,)
+
+        if field:
+            docs = [item for item in docs if item[1].get(field) is not None]
+        docs.sort(key=lambda item: key(*item), reverse=self._descending)
+        if self._start_after is not None:
+            after = key(self._start_after, self._db.read(self._start_after) or {})
+            docs = [item for item in docs if (key(*item) < after if self._descending else key(*item) > after)]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return [FakeSnapshot(FakeDocument(self._db, path), data) for path, data in docs]
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, path):
+        super().__init__(db, path)
+
+    def document(self, document_id=None):
+        return FakeDocument(self._db, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, ref, data, merge=False):
+        self._writes.append((ref.path, data, merge))
+
+    def commit(self):
+        self._db.rpc("commit")
+        self._db.check_commit([path for path, _, _ in self._writes])
+        for path, data, merge in self._writes:
+            self._db.write(path, data, merge)
+
+
+class FakeFirestore:
+    """Dict-backed Firestore client covering the calls the managers make, counting every RPC."""
+
+    def __init__(self, latency=None):
+        self.latency = latency or LatencyModel()
+        self.docs = {}
+        self.rpcs = Counter()
+        # Called with the paths of every batch commit; raise from it to fail the commit
+        self.commit_hook = None
+        # Called with the kind of every RPC ("get", "query", "write", "commit"); raise from it to fail the call
+        self.rpc_hook = None
+        self.update_times = {}
+        self._clock = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def document(self, path):
+        return FakeDocument(self, path)
+
+    def async_client(self):
+        """An AsyncClient stand-in over the same documents and RPC counters."""
+        return FakeAsyncFirestore(self)
+
+    def count(self, kind):
+        with self._lock:
+            self.rpcs[kind] += 1
+        if self.rpc_hook is not None:
+            self.rpc_hook(kind)
+
+    def rpc(self, kind):
+        self.count(kind)
+        time.sleep(self.latency.sample())
+
+    def check_commit(self, paths):
+        if self.commit_hook is not None:
+            self.commit_hook(paths)
+
+    def read(self, path):
+        with self._lock:
+            data = self.docs.get(path)
+            return dict(data) if data is not None else None
+
+    def children(self, collection_path):
+        prefix = collection_path + "/"
+        with self._lock:
+            return [
+                (path, dict(data)) for path, data in self.docs.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+
+    def write_option(self, last_update_time=None):
+        """Precondition for FakeDocument.update, like Client.write_option."""
+        return {"last_update_time": last_update_time}
+
+    def write(self, path, data, merge, expected_update_time=None):
+        with self._lock:
+            if expected_update_time is not None and self.update_times.get(path) != expected_update_time:
+                raise gexc.FailedPrecondition(f"{path} changed since it was read")
+            current = self.docs.get(path) if merge else None
+            self.docs[path] = _apply(dict(current or {}), data)
+            self.update_times[path] = next(self._clock)
+
+    def remove(self, path):
+        with self._lock:
+            self.docs.pop(path, None)
+
+
+class FakeAsyncDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self._sync = FakeDocument(db, path)
+        self.path = path
+        self.id = self._sync.id
+
+    def collection(self, name):
+        return FakeAsyncCollection(self._db, f"{self.path}/{name}")
+
+    async def get(self):
+        await self._db.rpc_async("get")
+        return FakeSnapshot(self._sync, self._db.read(self.path), self._db.update_times.get(self.path))
+
+    async def set(self, data, merge=False):
+        await self._db.rpc_async("write")
+        self._db.write(self.path, data, merge)
+
+
+class FakeAsyncQuery(FakeQuery):
+    @property
+    def _query_class(self):
+        return FakeAsyncQuery
+
+    async def stream(self):
+        await self._db.rpc_async("query")
+        for snapshot in self._results():
+            yield snapshot
+
+
+class FakeAsyncCollection(FakeAsyncQuery):
+    def __init__(self, db, path):
+        super().__init__(db, path)
+
+    def document(self, document_id=None):
+        return FakeAsyncDocument(self._db, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+
+class FakeAsyncBatch(FakeBatch):
+    async def commit(self):
+        await self._db.rpc_async("commit")
+        self._db.check_commit([path for path, _, _ in self._writes])
+        for path, data, merge in self._writes:
+            self._db.write(path, data, merge)
+
+
+class FakeAsyncFirestore:
+    """AsyncClient stand-in sharing a FakeFirestore's documents, counters and latency."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def collection(self, name):
+        return FakeAsyncCollection(self, name)
+
+    def document(self, path):
+        return FakeAsyncDocument(self, path)
+
+    def batch(self):
+        return FakeAsyncBatch(self)
+
+    async def rpc_async(self, kind):
+        self._db.count(kind)
+        await asyncio.sleep(self._db.latency.sample())
+
+    def __getattr__(self, name):
+        # read/write/children/remove go to the shared store
+        return getattr(self._db, name)
+
+
+def _apply(current, data):
+    for key, value in data.items():
+        if isinstance(value, Sentinel):
+            current[key] = datetime.now(timezone.utc)
+        elif isinstance(value, Increment):
+            current[key] = current.get(key, 0) + value.value
+        elif isinstance(value, dict) and isinstance(current.get(key), dict):
+            current[key] = _apply(dict(current[key]), value)
+        else:
+            current[key] = value
+    return current
+
+
+# ---------------------------------------------------------------------------
+# Gemini
+# ---------------------------------------------------------------------------
+
+class FakeLLM:
+    """
+    Chat model stand-in that answers each prompt type with a plausible fixed response
+    after a sampled latency, counting calls by kind. Like registry clients, every call
+    records an llm.call span.
+    """
+
+    def __init__(self, latency=None, calls=None, model="fake-gemini"):
+        self.latency = latency or LatencyModel()
+        self.calls = calls if calls is not None else Counter()
+        self.model = model
+        self._lock = threading.Lock()
+
+    def _respond(self, messages):
+        prompt = " ".join(str(message.content) for message in messages)
+        if "You are the analysis stage" in prompt:
+            kind = "analysis"
+            current = str(messages[-1].content)
+            content = json.dumps({
+                "emotion": "anxious", "urgency": 5 if "kill myself" in current else 2,
+                "mental_health": "capital of" not in current, "topic_confidence": 0.9, "topic_reason": "fake",
+                "has_event": False, "event_confidence": 0.0
+            })
+        elif "responding to someone in severe emotional crisis" in prompt:
+            kind = "crisis"
+            content = json.dumps({"crisis_response": "Please call 988.", "suggestions": [], "follow_up_questions": []})
+        elif "Generate practical suggestions" in prompt:
+            kind = "suggestions"
+            content = "Take a slow breath\nGo for a short walk\nText a friend"
+        elif "Update the running summary" in prompt:
+            kind = "summary"
+            content = json.dumps({"summary": "They talked about feeling anxious and overwhelmed.",
+                                  "key_topics": ["anxiety", "work"]})
+        elif "Summarize this conversation" in prompt:
+            kind = "summary"
+            content = "They talked about feeling anxious."
+        else:
+            kind = "reply"
+            content = "That sounds really hard. I'm here with you - what's weighing on you most right now?"
+            if "[[SUGGESTIONS]]" in prompt:
+                content += "\n[[SUGGESTIONS]]\nTake a slow breath\nWrite down what worries you"
+        with self._lock:
+            self.calls[kind] += 1
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(content) // 4, "total_tokens": 0}
+        return content, usage
+
+    def invoke(self, messages, **kwargs):
+        content, usage = self._respond(messages)
+        with span("llm.call", model=self.model):
+            time.sleep(self.latency.sample())
+        return AIMessage(content=content, usage_metadata=usage)
+
+    async def ainvoke(self, messages, **kwargs):
+        content, usage = self._respond(messages)
+        with span("llm.call", model=self.model):
+            await asyncio.sleep(self.latency.sample())
+        return AIMessage(content=content, usage_metadata=usage)
+
+    async def astream(self, messages, **kwargs):
+        content, _ = self._respond(messages)
+        with span("llm.call", model=self.model):
+            # Most of the latency is time to first token
+            await asyncio.sleep(self.latency.sample())
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            yield AIMessageChunk(content=word if i == len(words) - 1 else word + " ")
+
+
+def fake_llm_factory(latency=None, calls=None):
+    """A factory for llm.registry.set_factory that hands out FakeLLMs sharing one call counter."""
+    calls = calls if calls is not None else Counter()
+
+    def factory(model, api_key, temperature, max_tokens):
+        return FakeLLM(latency, calls, model)
+
+    factory.calls = calls
+    return factory
@@ -0,0 +1,39 @@
+# File: tests/test_background.py
+#
+# Offline tests for the background loop's shutdown, no network or Functions host needed.
+
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORKER = textwrap.dedent("""
+    import os, signal, sys, time
+    sys.path.insert(0, os.path.join({tests!r}, "..", "function"))
+    from fakes import FakeFirestore
+    from firebase_writer import FirebaseWriter, WriteOp
+
+    db = FakeFirestore()
+    db.commit_hook = lambda paths: print("committed", *paths, flush=True)
+    writer = FirebaseWriter(db, async_db=db.async_client(), flush_interval=60)
+    writer.submit_writes([WriteOp(db.document("users/a"), {{"n": 1}})])
+    writer.submit_debounced("job", 60, print, "debounced job ran", flush=True)
+    time.sleep(0.2)
+    os.kill(os.getpid(), signal.SIGTERM)
+    time.sleep(5)
+    print("not terminated", flush=True)
+""")
+
+
+def test_sigterm_drains_pending_work():
+    result = subprocess.run(
+        [sys.executable, "-c", WORKER.format(tests=TESTS_DIR)],
+        cwd=TESTS_DIR, capture_output=True, text=True, timeout=30
+    )
+    assert "committed users/a" in result.stdout, result.stderr
+    assert "debounced job ran" in result.stdout
+    assert "not terminated" not in result.stdout
+    assert result.returncode == -signal.SIGTERM
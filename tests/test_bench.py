@@ -0,0 +1,19 @@
+# File: tests/test_bench.py
+
+from bench_chat import run_benchmark, print_table
+
+def test_bench():
+    """Offline pipeline benchmark: fake Gemini and Firestore, no network or Functions host needed."""
+    print("\n--- Starting Offline Chat Benchmark ---")
+    results = run_benchmark(
+        levels=[1, 8], turns=40, mode="pipeline",
+        llm_median=20, llm_p95=60, firestore_median=2, firestore_p95=6
+    )
+    results += run_benchmark(levels=[4], turns=16, mode="handler", llm_median=20, firestore_median=2)
+    print_table(results)
+
+    for r in results:
+        # analysis + reply + background suggestions at most
+        assert r['llm_calls_per_turn'] <= 3, f"LLM calls per turn regressed → {r['llm_calls_per_turn']:.2f}"
+        assert r['firestore_rpcs_per_turn'] <= 8, f"Firestore RPCs per turn regressed → {r['firestore_rpcs_per_turn']:.2f}"
+    print("--- Offline Chat Benchmark Passed ---")
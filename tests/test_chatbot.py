@@ -0,0 +1,185 @@
+# File: tests/test_chatbot.py
+#
+# Offline tests for the chat pipeline against FakeFirestore and FakeLLM.
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from fakes import FakeFirestore, fake_llm_factory
+
+import chatbot as chatbot_module
+import llm
+from background import get_background_loop
+from bench_chat import build_chatbot, call_handler
+from chatbot import DEGRADED_REPLY
+from config import Config
+from profile_cache import get_profile_cache
+from prompt_cache import FakeCacheBackend, get_prompt_cache
+from resilience import CircuitBreaker
+from tracing import recorder
+
+EMAIL = "offline@example.com"
+
+
+def make_chatbot(config=None, llm_latency=None):
+    get_profile_cache().clear()
+    get_prompt_cache().set_backend(FakeCacheBackend())
+    factory = fake_llm_factory(llm_latency)
+    llm.registry.set_factory(factory)
+    db = FakeFirestore()
+    chatbot = build_chatbot(db, [EMAIL], config or Config())
+    return chatbot, db, factory
+
+
+def stored_pairs(db):
+    return [data for path, data in db.docs.items() if f"users/{EMAIL}/conversations/" in path and "/chat/" in path]
+
+
+def test_stream_disconnect_still_stores_the_turn():
+    chatbot, db, _ = make_chatbot()
+    background = get_background_loop()
+
+    async def read_first_chunk():
+        stream = background.stream(chatbot.stream_conversation_async(EMAIL, "Work has been really stressful lately"))
+        async for chunk in stream:
+            break
+        # The client goes away after the first chunk
+        await stream.aclose()
+        return chunk
+
+    first = asyncio.run(read_first_chunk())
+    background.run(asyncio.sleep(0.2))
+    background.run(chatbot.writer.drain())
+
+    [pair] = stored_pairs(db)
+    assert pair["user"] == "Work has been really stressful lately"
+    assert pair["model"].startswith(first)
+
+
+def test_open_gemini_breaker_degrades_without_llm_calls():
+    chatbot, db, factory = make_chatbot()
+    chatbot.gemini_breaker = CircuitBreaker("gemini", failure_threshold=1)
+    chatbot.gemini_breaker.record_failure()
+    background = get_background_loop()
+
+    reply = background.run(chatbot.process_conversation_async(EMAIL, "Work has been really stressful lately"))
+    background.run(chatbot.writer.drain())
+
+    assert reply == DEGRADED_REPLY
+    assert sum(factory.calls.values()) == 0
+    [pair] = stored_pairs(db)
+    assert pair["model"] == DEGRADED_REPLY
+
+
+def test_suggestions_are_debounced_across_a_burst_of_turns():
+    chatbot, _, factory = make_chatbot(Config(suggestion_debounce=60))
+    background = get_background_loop()
+
+    for message in ["I'm so anxious", "I can't sleep anymore", "Work keeps piling up"]:
+        background.run(chatbot.process_conversation_async(EMAIL, message))
+    assert factory.calls["suggestions"] == 0
+
+    # Draining releases the one suggestion job still waiting
+    background.run(chatbot.writer.drain())
+    assert factory.calls["suggestions"] == 1
+
+
+def test_crisis_phrase_skips_the_analysis_call():
+    chatbot, db, factory = make_chatbot()
+    background = get_background_loop()
+
+    reply = background.run(chatbot.process_conversation_async(EMAIL, "I want to kill myself"))
+    background.run(chatbot.writer.drain())
+
+    assert reply == "Please call 988."
+    assert factory.calls["analysis"] == 0
+    assert factory.calls["crisis"] == 1
+    [pair] = stored_pairs(db)
+    assert pair["urgency_level"] == 5
+
+
+
+class RecordingReplyStream(chatbot_module.ReplyStream):
+    """ReplyStream that remembers every draft and whether it was cancelled."""
+
+    drafts = []
+
+    def __init__(self, llm, messages):
+        super().__init__(llm, messages)
+        self.cancelled = False
+        RecordingReplyStream.drafts.append(self)
+
+    def cancel(self):
+        self.cancelled = True
+        super().cancel()
+
+
+def speculative_chatbot(monkeypatch):
+    RecordingReplyStream.drafts = []
+    monkeypatch.setattr(chatbot_module, "ReplyStream", RecordingReplyStream)
+    return make_chatbot(Config(speculative_generation=True))
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("What is the capital of France?", "Sorry but i can not answer to that question!!!."),
+    # Joking framing goes past the pre-classifier; the analysis call flags the crisis
+    ("lol I could kill myself over this exam", "Please call 988."),
+])
+def test_discarded_draft_is_cancelled_and_not_stored(monkeypatch, message, expected):
+    chatbot, db, factory = speculative_chatbot(monkeypatch)
+    background = get_background_loop()
+
+    reply = background.run(chatbot.process_conversation_async(EMAIL, message))
+    background.run(chatbot.writer.drain())
+
+    assert reply == expected
+    [draft] = RecordingReplyStream.drafts
+    assert draft.cancelled
+    assert factory.calls["analysis"] == 1
+    [pair] = stored_pairs(db)
+    assert pair["model"] == expected
+
+
+def test_open_breaker_cancels_the_speculative_draft(monkeypatch):
+    chatbot, db, _ = speculative_chatbot(monkeypatch)
+    chatbot.gemini_breaker = CircuitBreaker("gemini", failure_threshold=1)
+    chatbot.gemini_breaker.record_failure()
+    background = get_background_loop()
+
+    async def read_all():
+        stream = background.stream(chatbot.stream_conversation_async(EMAIL, "Work has been really stressful lately"))
+        return "".join([chunk async for chunk in stream])
+
+    assert asyncio.run(read_all()) == DEGRADED_REPLY
+    background.run(chatbot.writer.drain())
+
+    [draft] = RecordingReplyStream.drafts
+    assert draft.cancelled
+    [pair] = stored_pairs(db)
+    assert pair["model"] == DEGRADED_REPLY
+
+
+
+def test_debug_timings_report_the_request_trace(monkeypatch):
+    import function_app
+
+    chatbot, _, _ = make_chatbot()
+    monkeypatch.setattr(function_app, "DEBUG_TIMINGS", True)
+    recorder.clear()
+
+    response = call_handler(chatbot, EMAIL, "Work has been really stressful lately")
+    # The suggestion job runs after the response, still under the request's trace
+    get_background_loop().run(chatbot.writer.drain())
+
+    trace_id = response.headers["X-Trace-Id"]
+    timings = response.headers["Server-Timing"]
+    for name in ["chat-turn", "firestore-get_user_profile", "stage-analysis", "stage-reply", "llm-call"]:
+        assert f"{name};dur=" in timings
+
+    traced = {record.name for record in recorder.spans() if record.attributes.get("trace_id") == trace_id}
+    assert {"chat.turn", "firestore.get_user_profile", "llm.call", "writer.job"} <= traced
@@ -0,0 +1,51 @@
+# File: tests/test_context.py
+#
+# Offline tests for the token-budgeted reply context.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from config import Config
+from context import ContextBuilder
+from data import ConversationMemory, LLMMessage, MessagePair, UserMessage
+
+
+def pairs(count, words=10):
+    return [
+        MessagePair(user_message=UserMessage(content=f"user {i} " + "word " * words),
+                    llm_message=LLMMessage(content=f"bot {i} " + "word " * words))
+        for i in range(count)
+    ]
+
+
+def test_trims_oldest_turns_first():
+    builder = ContextBuilder(Config(context_token_budget=60))
+    history, trimmed = builder.fit_history(pairs(10))
+    assert trimmed == 10 - len(history)
+    assert history[-1].user_message.content.startswith("user 9")
+    assert builder.uncovered_turns(pairs(10), None, trimmed) == trimmed
+
+
+def test_rolling_summary_covers_summarized_turns():
+    builder = ContextBuilder(Config(context_token_budget=10000, summary_keep_turns=2))
+    memory = ConversationMemory(conversation_id="conv", summary="They talked.", pair_count=10, summarized_pairs=7)
+    history, trimmed = builder.fit_history(pairs(10), memory)
+    assert len(history) == 3 and trimmed == 7
+    assert builder.uncovered_turns(pairs(10), memory, trimmed) == 0
+
+
+def test_budget_trims_past_the_rolling_summary():
+    builder = ContextBuilder(Config(context_token_budget=60, summary_keep_turns=2))
+    memory = ConversationMemory(conversation_id="conv", summary="They talked.", pair_count=10, summarized_pairs=2)
+    history, trimmed = builder.fit_history(pairs(10), memory)
+    # 8 unsummarized turns, only a few fit: the rest must still be folded in
+    assert builder.uncovered_turns(pairs(10), memory, trimmed) == trimmed - 2
+
+
+def test_summary_is_labelled_as_this_conversation():
+    builder = ContextBuilder(Config())
+    messages = builder.build("SYSTEM", "hi", "Sam", "calm", 1, pairs(1), "They talked about work.")
+    assert "EARLIER IN THIS CONVERSATION" in messages[0].content
+    assert len(messages) == 4
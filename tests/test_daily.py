@@ -0,0 +1,128 @@
+# File: tests/test_daily.py
+#
+# Offline tests for the daily task's local-day selection and pending marks, against FakeFirestore.
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from fakes import FakeFirestore, fake_llm_factory
+from google.api_core import exceptions as gexc
+
+import llm
+from daily import DailyTaskRunner
+from managers.firebase_manager import FirebaseManager
+from managers.message import MessageManager
+
+EMAIL = "daily@example.com"
+UTC = timezone.utc
+
+
+def make_runner(db):
+    llm.registry.set_factory(fake_llm_factory())
+    return DailyTaskRunner(firebase_manager=FirebaseManager(db=db, async_db=db.async_client()))
+
+
+def add_pair(db, when, text):
+    conversation_id = MessageManager.conversation_ids_between(when, when + timedelta(seconds=1))[0]
+    db.docs[f"users/{EMAIL}/conversations/{conversation_id}"] = {"chatPairCount": 1}
+    db.docs[f"users/{EMAIL}/conversations/{conversation_id}/chat/{text}"] = {
+        "user": text, "model": "ok", "timestamp": when
+    }
+
+
+def test_local_day_spans_server_dates():
+    db = FakeFirestore()
+    runner = make_runner(db)
+    # Asia/Kolkata 2026-03-10 runs from 2026-03-09 18:30 to 2026-03-10 18:30 UTC
+    add_pair(db, datetime(2026, 3, 9, 18, 0, tzinfo=UTC), "before")
+    add_pair(db, datetime(2026, 3, 9, 20, 0, tzinfo=UTC), "evening")
+    add_pair(db, datetime(2026, 3, 10, 9, 0, tzinfo=UTC), "afternoon")
+    add_pair(db, datetime(2026, 3, 10, 19, 0, tzinfo=UTC), "after")
+
+    memory, pairs = runner.load_local_day(EMAIL, "2026-03-10", "Asia/Kolkata")
+    assert memory is None
+    assert [pair.user_message.content for pair in pairs] == ["evening", "afternoon"]
+
+
+def test_pending_kept_for_chats_after_the_day():
+    db = FakeFirestore()
+    runner = make_runner(db)
+    day_end = datetime(2026, 3, 10, 18, 30, tzinfo=UTC)
+
+    db.write(f"users/{EMAIL}", {"dailyPending": True, "lastMessageAt": day_end + timedelta(minutes=5)}, False)
+    assert not runner.firebase_manager.clear_daily_pending(EMAIL, day_end)
+    assert db.docs[f"users/{EMAIL}"]["dailyPending"] is True
+
+    db.write(f"users/{EMAIL}", {"lastMessageAt": day_end - timedelta(minutes=5)}, True)
+    assert runner.firebase_manager.clear_daily_pending(EMAIL, day_end)
+    assert db.docs[f"users/{EMAIL}"]["dailyPending"] is False
+
+
+def test_run_for_user_stores_the_local_day():
+    db = FakeFirestore()
+    runner = make_runner(db)
+    add_pair(db, datetime(2026, 3, 9, 20, 0, tzinfo=UTC), "evening")
+    db.write(f"users/{EMAIL}", {
+        "dailyPending": True, "timezone": "Asia/Kolkata",
+        "lastMessageAt": datetime(2026, 3, 9, 20, 0, tzinfo=UTC)
+    }, False)
+
+    runner.run_for_user(EMAIL, datetime(2026, 3, 9, 20, 0, tzinfo=UTC), "2026-03-10", "Asia/Kolkata")
+    assert f"users/{EMAIL}/summaries/daily_2026-03-10" in db.docs
+    assert db.docs[f"users/{EMAIL}"]["dailyPending"] is False
+
+
+
+def fail(kind):
+    def hook(rpc):
+        if rpc == kind:
+            raise gexc.ServiceUnavailable(f"{kind} unavailable")
+    return hook
+
+
+def mark_evening_chat(db):
+    when = datetime(2026, 3, 9, 20, 0, tzinfo=UTC)
+    add_pair(db, when, "evening")
+    db.write(f"users/{EMAIL}", {"dailyPending": True, "timezone": "Asia/Kolkata", "lastMessageAt": when}, False)
+    return when
+
+
+def test_failed_summary_store_keeps_the_mark():
+    db = FakeFirestore()
+    runner = make_runner(db)
+    when = mark_evening_chat(db)
+
+    db.rpc_hook = fail("write")
+    with pytest.raises(RuntimeError):
+        runner.run_for_user(EMAIL, when, "2026-03-10", "Asia/Kolkata")
+    db.rpc_hook = None
+    assert f"users/{EMAIL}/summaries/daily_2026-03-10" not in db.docs
+    assert db.docs[f"users/{EMAIL}"]["dailyPending"] is True
+
+
+def test_failed_conversation_read_keeps_the_mark():
+    db = FakeFirestore()
+    runner = make_runner(db)
+    when = mark_evening_chat(db)
+
+    db.rpc_hook = fail("query")
+    with pytest.raises(gexc.ServiceUnavailable):
+        runner.run_for_user(EMAIL, when, "2026-03-10", "Asia/Kolkata")
+    with pytest.raises(gexc.ServiceUnavailable):
+        runner.load_last_day(EMAIL, when.astimezone())
+    db.rpc_hook = None
+    assert db.docs[f"users/{EMAIL}"]["dailyPending"] is True
+
+def test_due_users_leave_the_mark_to_the_worker():
+    db = FakeFirestore()
+    runner = make_runner(db)
+    db.write(f"users/{EMAIL}", {"dailyPending": True, "dailyBucket": 19, "timezone": "Asia/Kolkata"}, False)
+
+    due = runner.due_users(datetime(2026, 3, 10, 19, 0, tzinfo=UTC))
+    assert due == {EMAIL: (None, "2026-03-10", "Asia/Kolkata")}
+    assert db.docs[f"users/{EMAIL}"]["dailyPending"] is True
@@ -0,0 +1,40 @@
+# File: tests/test_daily_queue.py
+
+import json
+import time
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.queue import QueueClient, TextBase64EncodePolicy
+
+# Azurite, the same storage the Functions host uses locally (AzureWebJobsStorage)
+CONNECTION_STRING = "UseDevelopmentStorage=true"
+QUEUE_NAME = "daily-tasks"
+
+def message_count(queue):
+    try:
+        return queue.get_queue_properties().approximate_message_count
+    except ResourceNotFoundError:
+        return 0
+
+def test_daily_queue():
+    """Queued daily task is picked up by DailyTaskWorker without being poisoned."""
+    print("\n--- Starting Daily Task Queue Test ---")
+    queue = QueueClient.from_connection_string(
+        CONNECTION_STRING, QUEUE_NAME, message_encode_policy=TextBase64EncodePolicy()
+    )
+    poison = QueueClient.from_connection_string(CONNECTION_STRING, f"{QUEUE_NAME}-poison")
+    try:
+        queue.create_queue()
+    except Exception:
+        pass
+    poisoned_before = message_count(poison)
+
+    queue.send_message(json.dumps({'email': 'test.sorea@gmail.com', 'lastMessageAt': None, 'date': None}))
+    print(f"Queued daily task on {QUEUE_NAME}")
+
+    for _ in range(60):
+        if message_count(queue) == 0:
+            break
+        time.sleep(2)
+    assert message_count(queue) == 0, "Daily task message was not consumed"
+    assert message_count(poison) == poisoned_before, "Daily task message was poisoned"
+    print("--- Daily Task Queue Test Passed ---")
@@ -0,0 +1,127 @@
+# File: tests/test_firebase_writer.py
+#
+# Offline tests for Firestore write coalescing and batch commits, against FakeFirestore.
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from fakes import FakeFirestore
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1 import Increment
+
+from background import get_background_loop
+from firebase_writer import FirebaseWriter, WriteOp, coalesce_writes
+
+
+def ref(db, path):
+    return db.document(path)
+
+
+def test_coalesce_same_document():
+    db = FakeFirestore()
+    ops = coalesce_writes([
+        WriteOp(ref(db, "users/a"), {"name": "A", "count": Increment(1)}),
+        WriteOp(ref(db, "users/b"), {"name": "B"}),
+        WriteOp(ref(db, "users/a"), {"count": Increment(2), "meta": {"x": 1}}),
+        WriteOp(ref(db, "users/a"), {"meta": {"y": 2}}),
+    ])
+    assert [op.ref.path for op in ops] == ["users/a", "users/b"]
+    merged = ops[0].data
+    assert merged["name"] == "A"
+    assert merged["count"].value == 3
+    assert merged["meta"] == {"x": 1, "y": 2}
+
+
+def test_coalesce_plain_value_then_increment():
+    db = FakeFirestore()
+    [op] = coalesce_writes([
+        WriteOp(ref(db, "users/a"), {"count": 5}),
+        WriteOp(ref(db, "users/a"), {"count": Increment(2)}),
+    ])
+    assert op.data["count"] == 7
+
+    [op] = coalesce_writes([
+        WriteOp(ref(db, "users/a"), {"count": Increment(2)}),
+        WriteOp(ref(db, "users/a"), {"count": 5}),
+    ])
+    assert op.data["count"] == 5
+
+
+def test_coalesce_overwrite_resets_document():
+    db = FakeFirestore()
+    [op] = coalesce_writes([
+        WriteOp(ref(db, "users/a"), {"old": True}),
+        WriteOp(ref(db, "users/a"), {"new": True}, merge=False),
+        WriteOp(ref(db, "users/a"), {"more": True}),
+    ])
+    assert op.merge is False
+    assert op.data == {"new": True, "more": True}
+
+
+def flush(db, ops):
+    writer = FirebaseWriter(db, async_db=db.async_client(), retry_backoff=0)
+    writer.submit_writes(ops)
+    get_background_loop().run(writer.drain())
+
+
+def test_flush_retries_transient_errors():
+    db = FakeFirestore()
+    failures = [gexc.ServiceUnavailable("unavailable")]
+
+    def hook(paths):
+        if failures:
+            raise failures.pop()
+    db.commit_hook = hook
+
+    flush(db, [WriteOp(ref(db, "users/a"), {"count": Increment(1)})])
+    assert db.docs["users/a"] == {"count": 1}
+    assert db.rpcs["commit"] == 2
+
+
+def test_flush_isolates_a_bad_write():
+    db = FakeFirestore()
+
+    def hook(paths):
+        if "users/bad" in paths:
+            raise gexc.InvalidArgument("bad write")
+    db.commit_hook = hook
+
+    flush(db, [
+        WriteOp(ref(db, "users/a"), {"ok": True}),
+        WriteOp(ref(db, "users/bad"), {"ok": False}),
+        WriteOp(ref(db, "users/b"), {"ok": True}),
+    ])
+    assert db.docs["users/a"] == {"ok": True}
+    assert db.docs["users/b"] == {"ok": True}
+    assert "users/bad" not in db.docs
+
+
+def test_debounced_burst_runs_only_the_last_job():
+    writer = FirebaseWriter(FakeFirestore())
+    background = get_background_loop()
+    ran = []
+
+    async def job(n):
+        ran.append(n)
+
+    for n in range(3):
+        writer.submit_debounced("key", 0.05, job, n)
+    writer.submit_debounced("other", 0.05, job, "other")
+    background.run(asyncio.sleep(0.2))
+    background.run(writer.drain())
+    assert sorted(ran, key=str) == [2, "other"]
+
+
+def test_drain_releases_waiting_debounced_jobs():
+    writer = FirebaseWriter(FakeFirestore())
+    ran = []
+
+    async def job():
+        ran.append(1)
+
+    writer.submit_debounced("key", 60, job)
+    get_background_loop().run(writer.drain())
+    assert ran == [1]
@@ -0,0 +1,125 @@
+# File: tests/test_message_cache.py
+#
+# Offline tests for MessageManager's conversation window cache, against FakeFirestore.
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from fakes import FakeFirestore
+
+import managers.message
+from managers.firebase_manager import FirebaseManager
+from managers.message import MessageManager
+
+EMAIL = "cache@example.com"
+DAY = datetime(2026, 3, 10, 12, 0)
+
+
+class Clock(datetime):
+    """datetime whose now() the test moves, patched into managers.message."""
+
+    current = DAY
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current if tz is None else cls.current.astimezone(tz)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    Clock.current = DAY
+    monkeypatch.setattr(managers.message, "datetime", Clock)
+    return Clock
+
+
+def make_manager(db):
+    firebase_manager = FirebaseManager(db=db)
+    return MessageManager(firebase_manager), firebase_manager
+
+
+def seed(db, day, count):
+    conversation_id = f"conv_{day.strftime('%Y%m%d')}"
+    db.write(f"users/{EMAIL}/conversations/{conversation_id}", {"chatPairCount": count}, False)
+    for i in range(count):
+        db.write(f"users/{EMAIL}/conversations/{conversation_id}/chat/pair{i}", {
+            "user": f"message {i}", "model": "ok", "timestamp": day + timedelta(minutes=i)
+        }, False)
+    db.write(f"users/{EMAIL}", {"lastMessageAt": day, "lastConversationId": conversation_id}, True)
+
+
+def contents(pairs):
+    return [pair.user_message.content for pair in pairs]
+
+
+def test_cached_window_answers_only_limits_it_covers(clock):
+    db = FakeFirestore()
+    seed(db, DAY, 5)
+    manager, firebase_manager = make_manager(db)
+
+    assert contents(manager.get_conversation(EMAIL, firebase_manager, limit=3)) == ["message 2", "message 3", "message 4"]
+    queries = db.rpcs["query"]
+
+    # A smaller limit is served from the cached tail
+    assert contents(manager.get_conversation(EMAIL, firebase_manager, limit=2)) == ["message 3", "message 4"]
+    assert db.rpcs["query"] == queries
+
+    # The window holds only part of the conversation, so larger or unlimited reads go to Firestore
+    assert len(manager.get_conversation(EMAIL, firebase_manager, limit=5)) == 5
+    assert db.rpcs["query"] == queries + 1
+    assert len(manager.get_conversation(EMAIL, firebase_manager)) == 5
+    assert db.rpcs["query"] == queries + 2
+
+    # The whole conversation is now cached and answers any limit
+    assert len(manager.get_conversation(EMAIL, firebase_manager, limit=50)) == 5
+    assert db.rpcs["query"] == queries + 2
+
+
+def test_new_pair_is_visible_before_the_write_commits(clock):
+    db = FakeFirestore()
+    seed(db, DAY, 2)
+    manager, firebase_manager = make_manager(db)
+    manager.get_conversation(EMAIL, firebase_manager)
+    reads = dict(db.rpcs)
+
+    # Built but never committed, like a write still waiting in the FirebaseWriter batch
+    manager.chat_pair_writes(EMAIL, "fresh message", "fresh reply")
+
+    assert contents(manager.get_conversation(EMAIL, firebase_manager)) == ["message 0", "message 1", "fresh message"]
+    assert manager.conversation_memory(EMAIL).pair_count == 3
+    assert dict(db.rpcs) == reads
+
+
+def test_day_rollover_evicts_the_previous_window(clock):
+    db = FakeFirestore()
+    seed(db, DAY, 2)
+    manager, firebase_manager = make_manager(db)
+    manager.get_conversation(EMAIL, firebase_manager)
+
+    clock.current = DAY + timedelta(days=1)
+    assert manager.conversation_memory(EMAIL) is None
+    manager.chat_pair_writes(EMAIL, "next day", "reply")
+    assert manager.conversation_cache.get(EMAIL) is None
+
+
+def test_fallback_day_is_replaced_by_the_first_pair_of_today(clock):
+    db = FakeFirestore()
+    seed(db, DAY, 2)
+    manager, firebase_manager = make_manager(db)
+
+    # Nothing today yet: the lookup falls back to the last conversation day
+    clock.current = DAY + timedelta(days=1)
+    assert contents(manager.get_conversation(EMAIL, firebase_manager)) == ["message 0", "message 1"]
+    reads = dict(db.rpcs)
+    assert contents(manager.get_conversation(EMAIL, firebase_manager)) == ["message 0", "message 1"]
+    assert dict(db.rpcs) == reads
+
+    # Today's first pair starts a new window instead of extending the fallback day
+    manager.chat_pair_writes(EMAIL, "today", "reply")
+    assert contents(manager.get_conversation(EMAIL, firebase_manager)) == ["today"]
+    assert manager.conversation_memory(EMAIL).pair_count == 1
+    assert dict(db.rpcs) == reads
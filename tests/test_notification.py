@@ -14,4 +14,18 @@ def test_notification():
     res = requests.post(url, json=payload)
     return_json = res.json()
     assert return_json['notification'] == "[TEST NOTIFICATION SUCCESS]", f"Notification endpoint failed → {res.status_code}"
-    print("--- Notification API Test Passed ---")
\ No newline at end of file
+    print("--- Notification API Test Passed ---")
+
+def test_notifications_batch():
+    """Test for bulk notification endpoint."""
+    print("\n--- Starting Bulk Notification API Test ---")
+    url = f"{BASE_URL}/api/notifications"
+    payload = {
+        'emails' : ['test.sorea@gmail.com']
+    }
+    print(f"Testing: {url}")
+    res = requests.post(url, json=payload)
+    return_json = res.json()
+    assert res.status_code == 200, f"Bulk notification endpoint failed → {res.status_code}"
+    assert return_json['results']['test.sorea@gmail.com']['notification'] == "[TEST NOTIFICATION SUCCESS]", "Bulk notification result missing"
+    print("--- Bulk Notification API Test Passed ---")
@@ -0,0 +1,83 @@
+# File: tests/test_notifications_handler.py
+#
+# Offline tests for the bulk notification endpoint's paging and input checks, against FakeFirestore.
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from fakes import FakeFirestore, fake_llm_factory
+
+import azure.functions as func
+import daily
+import llm
+from config import Config
+from daily import DailyTaskRunner
+from managers.firebase_manager import FirebaseManager
+
+
+@pytest.fixture
+def db():
+    llm.registry.set_factory(fake_llm_factory())
+    db = FakeFirestore()
+    old = datetime.now(timezone.utc) - timedelta(days=3)
+    for name in ["d", "a", "c", "b"]:
+        db.write(f"users/{name}@example.com", {"lastMessageAt": old, "name": name}, False)
+    db.write("users/active@example.com", {"lastMessageAt": datetime.now(timezone.utc)}, False)
+    daily._runner = DailyTaskRunner(
+        config=Config(notification_max_batch=2),
+        firebase_manager=FirebaseManager(db=db, async_db=db.async_client())
+    )
+    yield db
+    daily._runner = None
+
+
+def post(body):
+    """Send one request through function_app.notifications_handler, bypassing the Functions host."""
+    import function_app
+
+    request = func.HttpRequest(
+        method="POST", url="/api/notifications", headers={"Content-Type": "application/json"},
+        body=json.dumps(body).encode()
+    )
+    response = function_app.notifications_handler._function.get_user_function()(request)
+    return response.status_code, json.loads(response.get_body())
+
+
+def test_cohort_is_paged(db):
+    status, page = post({"cohort": {"inactive_hours": 24}})
+    assert status == 200
+    assert sorted(page["results"]) == ["a@example.com", "b@example.com"]
+    assert page["next_start_after"] == "b@example.com"
+
+    status, page = post({"cohort": {"inactive_hours": 24, "start_after": "b@example.com"}})
+    assert status == 200
+    assert sorted(page["results"]) == ["c@example.com", "d@example.com"]
+    assert "next_start_after" not in page
+
+
+def test_every_user_cohort_is_capped(db):
+    status, page = post({"cohort": {}})
+    assert status == 200
+    assert len(page["results"]) == 2
+    assert page["next_start_after"] == "active@example.com"
+
+
+@pytest.mark.parametrize("body", [
+    ["a@example.com"],
+    {"cohort": {"inactive_hours": "24"}},
+    {"cohort": {"inactive_hours": True}},
+    {"cohort": {"inactive_hours": -1}},
+    {"cohort": {"inactive_hours": 10 ** 9}},
+    {"cohort": {"start_after": 5}},
+    {"cohort": {"start_after": "missing@example.com"}},
+])
+def test_bad_input_is_rejected(db, body):
+    status, page = post(body)
+    assert status == 400
+    assert "error" in page
@@ -0,0 +1,75 @@
+# File: tests/test_preclassifier.py
+#
+# Offline tests for the local pre-classifier, no network or Functions host needed.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from preclassifier import PreClassifier
+
+classifier = PreClassifier()
+
+
+@pytest.mark.parametrize("message", [
+    "I want to kill myself",
+    "i'm going to end it all tonight",
+    "I've been thinking about ending my life",
+    "I don't want to live anymore",
+    "Honestly I'm suicidal",
+    "everyone would be better off without me",
+    "I can't go on anymore",
+    "I took all my pills",
+    "I’m planning to take my own life",
+])
+def test_crisis_phrases(message):
+    assert classifier.classify(message).path == "crisis"
+
+
+@pytest.mark.parametrize("message", [
+    "I'm ending things with my boyfriend… finally free!",
+    "Watched a documentary on suicide prevention",
+    "can't go on like this with my noisy roommate lol",
+    "Is it possible to overdose on vitamin C?",
+    "I would never kill myself, don't worry",
+    "I'm not going to kill myself",
+    "My brother said he wants to die",
+    "I'm going to die of embarrassment",
+    "lol I want to die, this exam is so long",
+])
+def test_not_crisis(message):
+    assert classifier.classify(message).path != "crisis"
+
+
+@pytest.mark.parametrize("message", [
+    "I'm so anxious about my exam, I can't focus on anything",
+    "I've been feeling really low lately",
+    "I feel so alone since I moved",
+    "My anxiety is getting worse",
+    "I keep having panic attacks at work",
+    "I can't stop crying",
+    "I've been feeling kind of empty",
+])
+def test_mental_health_statements(message):
+    result = classifier.classify(message)
+    assert result.path == "mental_health"
+    assert result.confidence > 0
+
+
+@pytest.mark.parametrize("message", [
+    "How do I compute a confidence interval for my stats homework?",
+    "I'm cutting onions for dinner",
+    "What's the stress on my beam under this load?",
+    "angry my python code won't compile, write a sort function",
+    "I'm angry my python code won't compile, write a sort function",
+    "What's the capital of France?",
+    "My friend is depressed, how can I help?",
+    "I'm down for pizza tonight",
+    "I'm afraid I can't make it to the party",
+    "I got lost on the way to the museum",
+])
+def test_topic_left_to_llm(message):
+    assert classifier.classify(message).path == "llm"
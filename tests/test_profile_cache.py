@@ -0,0 +1,82 @@
+# File: tests/test_profile_cache.py
+#
+# Offline tests for the user profile cache and its change listeners, against FakeFirestore
+# and LocalProfileWatcher.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from fakes import FakeFirestore
+
+from managers.firebase_manager import FirebaseManager
+from profile_cache import LocalProfileWatcher, ProfileCache
+
+EMAIL = "profile@example.com"
+
+
+def make_manager(cache):
+    db = FakeFirestore()
+    db.write(f"users/{EMAIL}", {"name": "Sam", "timezone": "Europe/Paris"}, False)
+    firebase_manager = FirebaseManager(db=db)
+    firebase_manager.profile_cache = cache
+    return firebase_manager, db
+
+
+def test_profile_is_read_again_after_ttl():
+    firebase_manager, db = make_manager(ProfileCache(ttl=0.05))
+
+    assert firebase_manager.get_user_profile(EMAIL).name == "Sam"
+    assert firebase_manager.get_user_profile(EMAIL).name == "Sam"
+    assert db.rpcs["get"] == 1
+
+    db.write(f"users/{EMAIL}", {"name": "Samantha"}, True)
+    time.sleep(0.1)
+    assert firebase_manager.get_user_profile(EMAIL).name == "Samantha"
+    assert db.rpcs["get"] == 2
+
+
+def test_snapshot_replaces_the_cached_profile():
+    watcher = LocalProfileWatcher()
+    firebase_manager, db = make_manager(ProfileCache(watch=True, watcher=watcher))
+    firebase_manager.get_user_profile(EMAIL)
+
+    watcher.notify(EMAIL, {"name": "Samantha", "timezone": "Asia/Tokyo"})
+    profile = firebase_manager.get_user_profile(EMAIL)
+    assert (profile.name, profile.timezone) == ("Samantha", "Asia/Tokyo")
+    assert db.rpcs["get"] == 1
+
+
+def test_deleted_document_invalidates_the_profile():
+    watcher = LocalProfileWatcher()
+    firebase_manager, db = make_manager(ProfileCache(watch=True, watcher=watcher))
+    firebase_manager.get_user_profile(EMAIL)
+
+    watcher.notify(EMAIL, None)
+    assert firebase_manager.profile_cache.get(EMAIL) is None
+    firebase_manager.get_user_profile(EMAIL)
+    assert db.rpcs["get"] == 2
+
+
+def test_oldest_listener_is_dropped_past_max_watches():
+    watcher = LocalProfileWatcher()
+    cache = ProfileCache(watch=True, watcher=watcher, max_watches=2)
+    for email in ["a@example.com", "b@example.com", "c@example.com"]:
+        cache.watch(None, email)
+
+    assert sorted(watcher.callbacks) == ["b@example.com", "c@example.com"]
+
+    # Changes to the dropped user no longer reach the cache
+    watcher.notify("a@example.com", {"name": "A"})
+    assert cache.get("a@example.com") is None
+    watcher.notify("c@example.com", {"name": "C"})
+    assert cache.get("c@example.com").name == "C"
+
+
+def test_watching_disabled_starts_no_listener():
+    watcher = LocalProfileWatcher()
+    firebase_manager, _ = make_manager(ProfileCache(watch=False, watcher=watcher))
+    firebase_manager.get_user_profile(EMAIL)
+    assert watcher.callbacks == {}
@@ -0,0 +1,134 @@
+# File: tests/test_prompt_cache.py
+#
+# Offline tests for prompt prefix caching against FakeCacheBackend.
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from google.api_core import exceptions as gexc
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from prompt_cache import FakeCacheBackend, PromptCache
+
+PREFIX = "You are a steady, caring companion. " * 40
+
+
+class RecordingLLM:
+    """Records the kwargs of every call and fails the first ones with the given errors."""
+
+    model = "fake-gemini"
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls.append((messages, kwargs))
+        if self.errors:
+            raise self.errors.pop(0)
+        return AIMessage(content="ok")
+
+    async def astream(self, messages, **kwargs):
+        self.calls.append((messages, kwargs))
+        if self.errors:
+            raise self.errors.pop(0)
+        yield AIMessage(content="ok")
+
+
+def make_cache(min_tokens=10):
+    cache = PromptCache(backend=FakeCacheBackend(), min_tokens=min_tokens)
+    cache.register(PREFIX)
+    return cache
+
+
+def turn():
+    return [SystemMessage(content=PREFIX + "\nUser's name: Sam"), HumanMessage(content="hi")]
+
+
+def test_registered_prefix_is_swapped_for_a_handle():
+    cache = make_cache()
+    messages, kwargs = cache.apply(RecordingLLM(), turn())
+
+    assert kwargs == {"cached_content": "cachedContents/fake-1"}
+    assert cache.backend.created["cachedContents/fake-1"] == PREFIX.strip()
+    # The dynamic rest of the system message becomes a leading user turn
+    assert [type(m) for m in messages] == [HumanMessage, HumanMessage]
+    assert messages[0].content == "User's name: Sam"
+
+    # The handle is reused
+    cache.apply(RecordingLLM(), turn())
+    assert len(cache.backend.created) == 1
+
+
+def test_short_prefix_is_not_cached():
+    cache = make_cache(min_tokens=100000)
+    messages, kwargs = cache.apply(RecordingLLM(), turn())
+    assert kwargs == {}
+    assert messages == turn()
+    assert cache.backend.created == {}
+
+
+def test_rejected_cache_falls_back_to_the_full_prompt():
+    cache = make_cache()
+    llm = RecordingLLM(gexc.NotFound("cachedContents/fake-1 not found"))
+
+    assert asyncio.run(cache.ainvoke(llm, turn())).content == "ok"
+    assert [kwargs for _, kwargs in llm.calls] == [{"cached_content": "cachedContents/fake-1"}, {}]
+    assert cache._handles == {}
+
+
+@pytest.mark.parametrize("error", [gexc.ResourceExhausted("429 quota"), gexc.DeadlineExceeded("timed out")])
+def test_other_errors_are_raised_and_keep_the_handle(error):
+    cache = make_cache()
+    llm = RecordingLLM(error)
+
+    with pytest.raises(type(error)):
+        asyncio.run(cache.ainvoke(llm, turn()))
+    assert len(llm.calls) == 1
+    assert len(cache._handles) == 1
+
+
+def test_stream_reraises_rate_limits():
+    cache = make_cache()
+    llm = RecordingLLM(gexc.ResourceExhausted("429 quota"))
+
+    async def consume():
+        return [chunk async for chunk in cache.astream(llm, turn())]
+
+    with pytest.raises(gexc.ResourceExhausted):
+        asyncio.run(consume())
+    assert len(llm.calls) == 1
+
+
+def test_create_runs_outside_the_lock():
+    started, release = threading.Event(), threading.Event()
+
+    class SlowBackend(FakeCacheBackend):
+        def create(self, llm, prefix, ttl_seconds):
+            if prefix == PREFIX.strip():
+                started.set()
+                release.wait(5)
+            return super().create(llm, prefix, ttl_seconds)
+
+    cache = PromptCache(backend=SlowBackend(), min_tokens=10)
+    cache.register(PREFIX)
+    other = "You write short practical suggestions. " * 40
+    cache.register(other)
+
+    slow = threading.Thread(target=cache.apply, args=(RecordingLLM(), turn()))
+    slow.start()
+    assert started.wait(5)
+    try:
+        # The same prefix goes out uncached meanwhile, another prefix gets its own handle
+        assert cache.apply(RecordingLLM(), turn())[1] == {}
+        assert cache.apply(RecordingLLM(), [SystemMessage(content=other)])[1] == {"cached_content": "cachedContents/fake-1"}
+    finally:
+        release.set()
+        slow.join()
+    assert cache.apply(RecordingLLM(), turn())[1] == {"cached_content": "cachedContents/fake-2"}
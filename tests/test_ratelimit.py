@@ -0,0 +1,80 @@
+# File: tests/test_ratelimit.py
+#
+# Offline tests for the LLM scheduler's quotas, no network or Functions host needed.
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from config import Config
+from background import get_background_loop
+from ratelimit import LLMScheduler, _Bucket
+
+
+def configure(scheduler, config):
+    """configure() and wait for the settings to land on the background loop."""
+    scheduler.configure(config)
+
+    async def settled():
+        return None
+    get_background_loop().run(settled())
+
+
+def test_reconfigure_keeps_bucket_levels():
+    scheduler = LLMScheduler()
+    configure(scheduler, Config(gemini_requests_per_minute=2, gemini_tokens_per_minute=0))
+    scheduler.requests.take(2)
+    assert scheduler.requests.wait_time(1, 0) > 25
+
+    # Same settings again (every manager construction used to do this) is a no-op
+    configure(scheduler, Config(gemini_requests_per_minute=2, gemini_tokens_per_minute=0))
+    assert scheduler.requests.level < 0.1
+    assert scheduler.requests.wait_time(1, 0) > 25
+
+    # A new quota changes the rate but not what was already used
+    configure(scheduler, Config(gemini_requests_per_minute=4, gemini_tokens_per_minute=0))
+    assert scheduler.requests.capacity == 4
+    assert scheduler.requests.level < 0.1
+
+
+def test_bucket_resize():
+    bucket = _Bucket(10)
+    bucket.take(4)
+    bucket.resize(5)
+    assert bucket.level == 5
+    bucket.resize(3)
+    assert bucket.level == 3
+
+    unlimited = _Bucket(0)
+    assert unlimited.wait_time(1000, 0) == 0
+    unlimited.resize(60)
+    assert unlimited.level == 60
+
+
+def test_background_calls_leave_headroom():
+    bucket = _Bucket(10)
+    # A background call must leave 20% of the bucket for replies
+    bucket.take(8)
+    assert bucket.wait_time(1, 0) == 0
+    assert bucket.wait_time(1, 2) > 0
+
+
+def test_quota_holds_back_a_burst():
+    scheduler = LLMScheduler()
+    configure(scheduler, Config(gemini_requests_per_minute=2, gemini_tokens_per_minute=0))
+    loop = get_background_loop()
+
+    async def call():
+        await scheduler.acquire(0, 1)
+        scheduler.release(1)
+
+    loop.run(call())
+    loop.run(call())
+    with pytest.raises(asyncio.TimeoutError):
+        loop.run(asyncio.wait_for(call(), 0.3))
+    # The cancelled waiter left the queue
+    assert scheduler.in_flight == 0
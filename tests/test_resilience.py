@@ -0,0 +1,132 @@
+# File: tests/test_resilience.py
+#
+# Offline tests for the circuit breaker and run_stage.
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from resilience import CircuitBreaker, StageFailed, run_stage
+
+
+def expire(breaker):
+    """Move the open circuit past its reset timeout."""
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    expire(breaker)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_breaker_failed_trial_opens_again():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    expire(breaker)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_breaker_release_frees_the_trial():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    expire(breaker)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_run_stage_retries_then_succeeds():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RuntimeError("flaky")
+        return "ok"
+
+    breaker = CircuitBreaker("test", failure_threshold=5)
+    assert asyncio.run(run_stage("flaky", flaky, breaker=breaker, retries=1, backoff=0)) == "ok"
+    assert len(attempts) == 2
+    assert breaker.failures == 0
+
+
+def test_run_stage_timeout_falls_back():
+    async def slow():
+        await asyncio.sleep(1)
+        return "late"
+
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    result = asyncio.run(run_stage("slow", slow, breaker=breaker, timeout=0.01, fallback="fallback"))
+    assert result == "fallback"
+    assert breaker.state == "open"
+
+
+def test_run_stage_skips_call_while_open():
+    calls = []
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    breaker.record_failure()
+
+    result = asyncio.run(run_stage("skipped", lambda: calls.append(1), breaker=breaker, fallback=None))
+    assert result is None
+    assert calls == []
+
+
+def test_run_stage_without_fallback_raises():
+    def broken():
+        raise RuntimeError("broken")
+
+    with pytest.raises(StageFailed):
+        asyncio.run(run_stage("broken", broken, retries=1, backoff=0))
+
+
+def test_cancelled_trial_releases_the_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    expire(breaker)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def cancel_trial():
+        task = asyncio.ensure_future(run_stage("hang", hang, breaker=breaker, fallback=None))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert breaker.state == "half_open"
+    assert breaker.allow()
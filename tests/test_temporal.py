@@ -0,0 +1,82 @@
+# File: tests/test_temporal.py
+#
+# Offline tests for the local temporal-cue parser.
+
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "function"))
+
+from temporal import TemporalParser
+
+parser = TemporalParser()
+MONDAY = date(2026, 3, 9)
+FRIDAY = date(2026, 3, 13)
+SATURDAY = date(2026, 3, 14)
+SUNDAY = date(2026, 3, 15)
+
+
+@pytest.mark.parametrize("message, today, expected", [
+    ("my exam is tomorrow", MONDAY, "2026-03-10"),
+    ("interview the day after tomorrow", MONDAY, "2026-03-11"),
+    ("dentist tonight", MONDAY, "2026-03-09"),
+    ("the party was yesterday", MONDAY, "2026-03-08"),
+    ("meeting this Friday", MONDAY, "2026-03-13"),
+    ("meeting this Friday", FRIDAY, "2026-03-13"),
+    ("meeting next Friday", FRIDAY, "2026-03-20"),
+    ("meeting last Friday", FRIDAY, "2026-03-06"),
+    ("wedding this weekend", MONDAY, "2026-03-14"),
+    ("wedding this weekend", SATURDAY, "2026-03-14"),
+    ("wedding this weekend", SUNDAY, "2026-03-15"),
+    ("wedding next weekend", SUNDAY, "2026-03-21"),
+    ("deadline in 3 days", MONDAY, "2026-03-12"),
+    ("deadline in two weeks", MONDAY, "2026-03-23"),
+    ("my exam is on 2026-04-01", MONDAY, "2026-04-01"),
+    ("exam on March 20th", MONDAY, "2026-03-20"),
+    ("exam on the 20th of March", MONDAY, "2026-03-20"),
+])
+def test_resolves_dates(message, today, expected):
+    assert parser.parse(message, today).date == expected
+
+
+@pytest.mark.parametrize("message", [
+    "my exam is on Friday",          # the last or the next one
+    "exam on March 2nd",             # already past this year
+    "exam tomorrow, or maybe Friday",
+    "presentation in a few days",
+    "meeting end of the month",
+])
+def test_no_single_date(message):
+    cue = parser.parse(message, MONDAY)
+    assert cue is not None and cue.date is None
+
+
+def test_no_time_reference():
+    assert parser.parse("I've been feeling anxious about my exam", MONDAY) is None
+
+
+@pytest.mark.parametrize("message, event_type", [
+    ("my exam is tomorrow", "exam"),
+    ("I have a job interview tomorrow", "interview"),
+    ("first date tomorrow, so nervous", "date"),
+    ("the report is due tomorrow", "deadline"),
+    ("big presentation tomorrow", "presentation"),
+])
+def test_event_types(message, event_type):
+    assert parser.parse(message, MONDAY).event_type == event_type
+
+
+@pytest.mark.parametrize("message", [
+    "I took a covid test today",
+    "watching the NBA finals tomorrow",
+    "let's pick a date tomorrow",
+    "I'm calling the third party vendor tomorrow",
+    "my exam tomorrow was cancelled",
+    "I don't have a meeting tomorrow",
+    "exam and interview tomorrow",
+])
+def test_left_to_the_llm(message):
+    assert parser.parse(message, MONDAY).event_type is None